@@ -0,0 +1,483 @@
+import json
+import random
+import re
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connections
+from django.db.models import Max, Q
+from django.http import StreamingHttpResponse
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from change.models import Change
+from change.services import ChangeService
+from job.models import ImportJob
+from job.services import ImportJobService
+from set.models import Set
+from theme.models import Theme
+from theme.services import ThemeService
+from theme.stats import StatsChanges
+from user.models import UserProfile
+from utils.renderers import MSGPACK
+
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+# items per batch request
+BATCH_SIZE = 20
+
+PASSWORD = "benchmark"
+
+SERVER_TIMING_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+@dataclass
+class Fixture:
+    """ Rows seeded for the run, the routes pick their ids in these lists """
+    prefix: str
+    user: UserProfile
+    root: Theme
+    # requests per route
+    requests: int
+    themes: list[int] = field(default_factory=list)
+    parents: dict[int, Optional[int]] = field(default_factory=dict)
+    leaves: list[int] = field(default_factory=list)
+    sets: list[int] = field(default_factory=list)
+    # rows deleted by the delete routes, the single deletes take the first requests ones, the batch deletes the rest
+    disposable_sets: list[int] = field(default_factory=list)
+    disposable_themes: list[int] = field(default_factory=list)
+    jobs: list[int] = field(default_factory=list)
+    refresh_token: str = ""
+    # since of the change log route, from the start of the log
+    changes_cursor: str = ""
+    # the change log entries of the run are the ones after last_change_id on the rows created by the run, whose ids
+    # start at first_set_id and first_theme_id
+    last_change_id: int = 0
+    first_set_id: int = 0
+    first_theme_id: int = 0
+
+    def values(self, i: int) -> dict[str, Any]:
+        """ Placeholders of the urls for the i-th request of a route """
+        theme_id = self.themes[i % len(self.themes)]
+
+        return {
+            "set_id": self.sets[i * 7919 % len(self.sets)],
+            "theme_id": theme_id,
+            "parent_id": self.parents[theme_id],
+            "root_id": self.root.pk,
+            "leaf_id": self.leaves[i % len(self.leaves)],
+            "job_id": self.jobs[i % len(self.jobs)] if self.jobs else 0,
+            "set_offset": len(self.sets) * 9 // 10,
+            "theme_offset": len(self.themes) * 9 // 10,
+            "disposable_set_id": self.disposable_sets[i],
+            "disposable_theme_id": self.disposable_themes[i],
+            "changes_cursor": self.changes_cursor,
+        }
+
+    def batch(self, ids: list[int], i: int) -> list[int]:
+        return [ids[(i * BATCH_SIZE + j) % len(ids)] for j in range(BATCH_SIZE)]
+
+    def disposable_batch(self, ids: list[int], i: int) -> list[int]:
+        start = self.requests + i * BATCH_SIZE
+
+        return ids[start:start + BATCH_SIZE]
+
+
+Body = Callable[[Fixture, int], Any]
+
+
+@dataclass
+class Route:
+    name: str
+    method: str
+    url: str
+    body: Optional[Body] = None
+    # cap on the requests of the slow routes (password hashing, whole table exports, schema generation)
+    max_requests: Optional[int] = None
+    accept: str = "application/json"
+
+
+ROUTES = [
+    Route("token", "POST", "/api/token/",
+          lambda f, i: {"email": f.user.email, "password": PASSWORD}, max_requests=20),
+    Route("token refresh", "POST", "/api/token/refresh/", lambda f, i: {"refresh": f.refresh_token}),
+    Route("sets list", "GET", "/api/sets/?limit=50"),
+    Route("sets list deep offset", "GET", "/api/sets/?limit=50&offset={set_offset}"),
+    Route("sets list cursor", "GET", "/api/sets/?limit=50&pagination=cursor&ordering=-year"),
+    Route("sets list filtered", "GET", "/api/sets/?limit=50&year_min=2000&search=set+1"),
+    Route("sets list msgpack", "GET", "/api/sets/?limit=1000&pagination=cursor", accept=MSGPACK),
+    Route("set detail", "GET", "/api/sets/{set_id}"),
+    Route("set create", "POST", "/api/sets/",
+          lambda f, i: {"num": f"{f.prefix}-new-{i}", "name": f"New set {i}", "year": 2000, "num_parts": i,
+                        "img_url": f"https://cdn.rebrickable.com/media/sets/new-{i}.jpg",
+                        "theme_id": f.values(i)["leaf_id"]}),
+    Route("set update", "PATCH", "/api/sets/{set_id}", lambda f, i: {"num_parts": i}),
+    Route("set delete", "DELETE", "/api/sets/{disposable_set_id}"),
+    Route("sets batch get", "POST", "/api/sets/batch", lambda f, i: {"ids": f.batch(f.sets, i)}),
+    Route("sets batch update", "PATCH", "/api/sets/batch",
+          lambda f, i: {"items": [{"id": pk, "num_parts": i} for pk in f.batch(f.sets, i)]}),
+    Route("sets batch delete", "DELETE", "/api/sets/batch",
+          lambda f, i: {"ids": f.disposable_batch(f.disposable_sets, i)}),
+    Route("sets export csv", "GET", "/api/sets/export/csv", max_requests=3),
+    Route("sets export ndjson", "GET", "/api/sets/export/ndjson", max_requests=3),
+    Route("sets export msgpack", "GET", "/api/sets/export/msgpack", max_requests=3),
+    Route("themes list", "GET", "/api/themes/?limit=50"),
+    Route("themes list deep offset", "GET", "/api/themes/?limit=50&offset={theme_offset}"),
+    Route("themes list cursor", "GET", "/api/themes/?limit=50&pagination=cursor"),
+    Route("theme detail", "GET", "/api/themes/{theme_id}"),
+    Route("theme ancestors", "GET", "/api/themes/{leaf_id}/ancestors"),
+    Route("theme descendants", "GET", "/api/themes/{root_id}/descendants"),
+    Route("theme sets", "GET", "/api/themes/{theme_id}/sets?limit=50"),
+    Route("theme sets subtree", "GET", "/api/themes/{root_id}/sets?limit=50&offset={set_offset}"),
+    Route("theme stats", "GET", "/api/themes/{root_id}/stats"),
+    Route("theme create", "POST", "/api/themes/", lambda f, i: {"name": f"New theme {i}",
+                                                                "parent_id": f.values(i)["leaf_id"]}),
+    Route("theme update", "PATCH", "/api/themes/{theme_id}",
+          lambda f, i: {"name": f"Theme {i}", "parent_id": f.values(i)["parent_id"]}),
+    Route("theme delete", "DELETE", "/api/themes/{disposable_theme_id}"),
+    Route("themes batch get", "POST", "/api/themes/batch", lambda f, i: {"ids": f.batch(f.themes, i)}),
+    Route("themes batch update", "PATCH", "/api/themes/batch",
+          lambda f, i: {"items": [{"id": pk, "name": f"Theme {i}"} for pk in f.batch(f.themes, i)]}),
+    Route("themes batch delete", "DELETE", "/api/themes/batch",
+          lambda f, i: {"ids": f.disposable_batch(f.disposable_themes, i)}),
+    Route("themes export csv", "GET", "/api/themes/export/csv", max_requests=3),
+    Route("async sets list", "GET", "/api/async/sets/?limit=50&offset={set_offset}"),
+    Route("async set detail", "GET", "/api/async/sets/{set_id}"),
+    Route("async themes list", "GET", "/api/async/themes/?limit=50"),
+    Route("async theme detail", "GET", "/api/async/themes/{theme_id}"),
+    Route("async theme descendants", "GET", "/api/async/themes/{root_id}/descendants"),
+    Route("async theme sets", "GET", "/api/async/themes/{theme_id}/sets?limit=50"),
+    Route("job detail", "GET", "/api/jobs/{job_id}"),
+    Route("changes", "GET", "/api/changes/?limit=1000&since={changes_cursor}"),
+    Route("database metrics", "GET", "/api/metrics/database"),
+    Route("request metrics", "GET", "/api/metrics/requests"),
+    Route("schema", "GET", "/api/schema/", max_requests=5),
+    Route("docs", "GET", "/api/docs/", accept="text/html", max_requests=5),
+]
+
+
+@dataclass
+class Result:
+    durations: list[float]
+    elapsed: float
+    queries: list[int]
+    errors: int
+
+    def to_dict(self) -> dict[str, Any]:
+        percentiles = statistics.quantiles(self.durations, n=100) if len(self.durations) > 1 else self.durations * 99
+
+        return {
+            "requests": len(self.durations),
+            "errors": self.errors,
+            "throughput": len(self.durations) / self.elapsed,
+            "p50_ms": percentiles[49],
+            "p95_ms": percentiles[94],
+            "p99_ms": percentiles[98],
+            "max_ms": max(self.durations),
+            "avg_queries": statistics.mean(self.queries),
+            "max_queries": max(self.queries),
+        }
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalog and measure throughput, latency percentiles and query counts of every route"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--themes", type=int, default=500)
+        parser.add_argument("--depth", type=int, default=8, help="Depth of the theme tree")
+        parser.add_argument("--sets", type=int, default=100_000)
+        parser.add_argument("--requests", type=int, default=100, help="Requests per route")
+        parser.add_argument("--concurrency", type=int, default=1, help="Threads sending the requests")
+        parser.add_argument("--imports", type=int, nargs="*", default=[100, 1000, 10_000],
+                            help="Rows of the bulk import files")
+        parser.add_argument("--routes", nargs="*", help="Only run the routes whose name contains one of these")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic catalog")
+        parser.add_argument("--cache", action="store_true",
+                            help="Keep the catalog cache, by default every request reaches the db")
+        parser.add_argument("--output", help="Write the results to this json file")
+        parser.add_argument("--baseline", help="Fail when the results regress from this json file (see --output)")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed p95 increase over the baseline, as a fraction")
+        parser.add_argument("--keep", action="store_true", help="Don't delete the seeded rows")
+        parser.add_argument("--database", help="Name of the configured database, required when DEBUG is off to "
+                                               "confirm the run writes to it")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not settings.DEBUG and options["database"] != str(settings.DATABASES["default"]["NAME"]):
+            raise CommandError("DEBUG is off, confirm the database the rows are written to with --database")
+
+        last_change_id = Change.objects.aggregate(id=Max("id"))["id"] or 0
+        first_set_id = (Set.objects.aggregate(id=Max("id"))["id"] or 0) + 1
+        first_theme_id = (Theme.objects.aggregate(id=Max("id"))["id"] or 0) + 1
+
+        prefix = f"benchmark-{uuid.uuid4().hex[:8]}"
+        user = UserProfile.objects.create_superuser(f"{prefix}@example.com", "benchmark", PASSWORD)
+        root = Theme.objects.create(name=prefix)
+        root.path = f"{root.pk}/"
+        root.save(update_fields=["path"])
+        fixture = Fixture(prefix, user, root, options["requests"], last_change_id=last_change_id,
+                          first_set_id=first_set_id, first_theme_id=first_theme_id)
+
+        try:
+            start = time.perf_counter()
+            self.seed(fixture, options)
+            self.stdout.write(f"Seeded {len(fixture.themes)} themes and {len(fixture.sets)} sets "
+                              f"in {time.perf_counter() - start:.1f}s")
+
+            # the requests are sent by test clients, whose host is testserver
+            with override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0,
+                                   ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                                   **({} if options["cache"] else {"CACHES": NO_CACHE})):
+                results: dict[str, Any] = {"imports": self.run_imports(fixture, options["imports"]),
+                                            "routes": self.run_routes(fixture, options)}
+        finally:
+            if not options["keep"]:
+                self.clean(fixture)
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+
+        if options["baseline"]:
+            self.compare(results["routes"], options["baseline"], options["tolerance"])
+
+    @staticmethod
+    def seed(fixture: Fixture, options: dict[str, Any]) -> None:
+        """ Theme tree of the given depth under the root of the run, then the sets spread over the themes """
+        rng = random.Random(options["seed"])
+        root = fixture.root
+
+        # index of the parent in the themes (-1 for the root), the first themes make a chain of the full depth
+        parents: list[int] = []
+        depths: list[int] = []
+
+        for i in range(options["themes"]):
+            parent = i - 1 if i < options["depth"] else rng.randrange(i)
+
+            while parent >= 0 and depths[parent] >= options["depth"]:
+                parent = parents[parent]
+
+            parents.append(parent)
+            depths.append(depths[parent] + 1 if parent >= 0 else 1)
+
+        themes: dict[int, Theme] = {}
+
+        # level by level since the path holds the id of the row
+        for depth in range(1, options["depth"] + 1):
+            positions = [i for i, level in enumerate(depths) if level == depth]
+            level = Theme.objects.bulk_create([
+                Theme(name=f"Theme {i}", parent=themes[parents[i]] if parents[i] >= 0 else root) for i in positions
+            ])
+
+            for i, theme in zip(positions, level):
+                parent_path = themes[parents[i]].path if parents[i] >= 0 else root.path
+                theme.path = f"{parent_path}{theme.pk}/"
+                themes[i] = theme
+
+            Theme.objects.bulk_update(level, ["path"])
+
+        has_children = {parent for parent in parents if parent >= 0}
+        fixture.themes = [theme.pk for theme in themes.values()]
+        fixture.parents = {theme.pk: theme.parent_id for theme in themes.values()}
+        fixture.leaves = [theme.pk for i, theme in themes.items() if i not in has_children]
+
+        # leaves under the root, removed by the theme delete routes
+        disposable = Theme.objects.bulk_create([
+            Theme(name=f"Disposable theme {i}", parent=root) for i in range(options["requests"] * (1 + BATCH_SIZE))
+        ])
+
+        for theme in disposable:
+            theme.path = f"{root.path}{theme.pk}/"
+
+        Theme.objects.bulk_update(disposable, ["path"], batch_size=1000)
+        fixture.disposable_themes = [theme.pk for theme in disposable]
+
+        def sets(count: int, kind: str) -> list[int]:
+            ids: list[int] = []
+            # bulk_create bypasses the services, the theme stats are kept in sync here
+            changes = StatsChanges()
+
+            for start in range(0, count, 5000):
+                created = Set.objects.bulk_create([
+                    Set(num=f"{fixture.prefix}-{kind}-{i}", name=f"Set {i}", year=rng.randint(1950, 2024),
+                        num_parts=rng.randint(1, 5000), img_url=f"https://cdn.rebrickable.com/media/sets/{i}.jpg",
+                        theme_id=rng.choice(fixture.themes))
+                    for i in range(start, min(start + 5000, count))
+                ])
+
+                for set_object in created:
+                    ids.append(set_object.pk)
+                    changes.add_set(set_object.theme_id, set_object.year, set_object.num_parts)
+
+            changes.apply()
+
+            return ids
+
+        fixture.sets = sets(options["sets"], "s")
+        fixture.disposable_sets = sets(options["requests"] * (1 + BATCH_SIZE), "d")
+        fixture.refresh_token = str(RefreshToken.for_user(fixture.user))
+        fixture.changes_cursor = ChangeService.encode_cursor(0, 0, timezone.now())
+
+    def run_imports(self, fixture: Fixture, sizes: list[int]) -> list[dict[str, Any]]:
+        """ Upload request and job run of set and theme files of each size """
+        if not sizes:
+            return []
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(fixture.user)}")
+        results = []
+
+        self.stdout.write(f"\n{'import':<14} {'rows':>8} {'upload (ms)':>12} {'job (s)':>8} {'rows/s':>9} "
+                          f"{'queries':>8}")
+
+        first_theme_id = (Theme.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+
+        for size in sizes:
+            files = {
+                "sets": "set_num,year,name,theme_id,num_parts,img_url\n" + "".join(
+                    f"{fixture.prefix}-import-{size}-{i},2000,Imported {i},{fixture.leaves[i % len(fixture.leaves)]},"
+                    f"{i},https://cdn.rebrickable.com/media/sets/import-{i}.jpg\n" for i in range(size)
+                ),
+                "themes": "id,name,parent_id\n" + "".join(
+                    f"{first_theme_id + i},Imported {i},{fixture.root.pk}\n" for i in range(size)
+                ),
+            }
+            first_theme_id += size
+
+            for kind, content in files.items():
+                url = "/api/sets/bulk/" if kind == "sets" else "/api/themes/bulk"
+                start = time.perf_counter()
+                response = client.post(url, {"file": SimpleUploadedFile(f"{kind}.csv", content.encode())})
+                upload = time.perf_counter() - start
+
+                if response.status_code != 202:
+                    raise CommandError(f"{url} answered {response.status_code}: {response.content!r}")
+
+                job = ImportJob.objects.get(pk=response.json()["id"])
+                fixture.jobs.append(job.pk)
+
+                with CaptureQueriesContext(connections["default"]) as queries:
+                    start = time.perf_counter()
+                    ImportJobService.run(job)
+                    duration = time.perf_counter() - start
+
+                result = {"kind": kind, "rows": size, "upload_ms": upload * 1000, "job_s": duration,
+                          "rows_per_s": size / duration, "queries": len(queries), "status": job.status}
+                results.append(result)
+
+                self.stdout.write(f"{kind:<14} {size:>8} {result['upload_ms']:>12.1f} {duration:>8.2f} "
+                                  f"{result['rows_per_s']:>9.0f} {len(queries):>8}")
+
+                if job.status != ImportJob.Status.DONE:
+                    raise CommandError(f"Import job {job.pk} failed: {job.error}")
+
+        return results
+
+    def run_routes(self, fixture: Fixture, options: dict[str, Any]) -> dict[str, dict[str, Any]]:
+        results = {}
+
+        self.stdout.write(f"\n{'route':<26} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 (ms)':>9} "
+                          f"{'p95 (ms)':>9} {'p99 (ms)':>9} {'queries':>8}")
+
+        for route in ROUTES:
+            if options["routes"] and not any(name in route.name for name in options["routes"]):
+                continue
+
+            count = min(options["requests"], route.max_requests or options["requests"])
+            result = self.load(fixture, route, count, options["concurrency"])
+            results[route.name] = data = result.to_dict()
+
+            self.stdout.write(f"{route.name:<26} {data['requests']:>8} {data['errors']:>6} "
+                              f"{data['throughput']:>8.0f} {data['p50_ms']:>9.1f} {data['p95_ms']:>9.1f} "
+                              f"{data['p99_ms']:>9.1f} {data['avg_queries']:>8.1f}")
+
+        return results
+
+    @staticmethod
+    def load(fixture: Fixture, route: Route, count: int, concurrency: int) -> Result:
+        """ Send the requests of a route from concurrency threads, each with its own client and connection """
+        durations = [0.0] * count
+        queries = [0] * count
+        errors = 0
+        lock = threading.Lock()
+
+        def work(worker: int) -> None:
+            nonlocal errors
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(fixture.user)}")
+
+            try:
+                for i in range(worker, count, concurrency):
+                    url = route.url.format(**fixture.values(i))
+                    body = json.dumps(route.body(fixture, i)) if route.body is not None else None
+                    start = time.perf_counter()
+                    response = client.generic(route.method, url, body or "", content_type="application/json",
+                                              HTTP_ACCEPT=route.accept)
+
+                    if isinstance(response, StreamingHttpResponse):
+                        response.getvalue()
+
+                    durations[i] = (time.perf_counter() - start) * 1000
+                    # counted by utils.metrics, the queries of a streamed body run after the header is set
+                    match = SERVER_TIMING_QUERIES.search(response.headers.get("Server-Timing", ""))
+                    queries[i] = int(match.group(1)) if match else 0
+
+                    if response.status_code >= 400:
+                        with lock:
+                            errors += 1
+            finally:
+                connections.close_all()
+
+        if route.method == "GET":
+            # the first request fills the lazy caches (url resolvers, schema extensions), it isn't measured
+            Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(fixture.user)}").get(
+                route.url.format(**fixture.values(0)), HTTP_ACCEPT=route.accept)
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(work, range(concurrency)))
+
+        return Result(durations, time.perf_counter() - start, queries, errors)
+
+    def compare(self, routes: dict[str, dict[str, Any]], baseline_path: str, tolerance: float) -> None:
+        with open(baseline_path) as file:
+            baseline = json.load(file)["routes"]
+
+        regressions = []
+
+        for name, result in routes.items():
+            before = baseline.get(name)
+
+            if before is None:
+                continue
+
+            if result["avg_queries"] > before["avg_queries"]:
+                regressions.append(f"{name}: {before['avg_queries']:.1f} -> {result['avg_queries']:.1f} queries")
+
+            if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+
+        if regressions:
+            raise CommandError("Regressions from the baseline:\n" + "\n".join(regressions))
+
+        self.stdout.write(self.style.SUCCESS("No regression from the baseline"))
+
+    @staticmethod
+    def clean(fixture: Fixture) -> None:
+        ThemeService.delete_subtrees([fixture.root.path])
+        # after the deletes, which are logged as well
+        Change.objects.filter(pk__gt=fixture.last_change_id).filter(
+            Q(kind=Change.Kind.SET, object_id__gte=fixture.first_set_id)
+            | Q(kind=Change.Kind.THEME, object_id__gte=fixture.first_theme_id)
+        ).delete()
+        ImportJob.objects.filter(pk__in=fixture.jobs).delete()
+        fixture.user.delete()
@@ -0,0 +1,86 @@
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from user.models import UserProfile
+from utils import metrics
+from utils.testing import APITestCase
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+class MetricsTests(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        metrics.request_metrics.reset()
+
+    def test_request_metrics(self) -> None:
+        theme_id = self.create_theme("city")
+        response = self.api.get(f"/api/themes/{theme_id}")
+
+        self.assertIn("total;dur=", response.headers["Server-Timing"])
+
+        routes = self.api.get("/api/metrics/requests").json()["routes"]
+        self.assertEqual(routes["GET /api/themes/<int:pk>"]["count"], 1)
+        self.assertEqual(routes["GET /api/themes/<int:pk>"]["histogram"][-1]["count"], 1)
+
+        self.assertEqual(self.api.delete("/api/metrics/requests").status_code, 204)
+        # a request is recorded once answered, the DELETE after the reset
+        self.assertEqual(list(self.api.get("/api/metrics/requests").json()["routes"]), ["DELETE /api/metrics/requests"])
+
+    def test_serialization_of_every_response(self) -> None:
+        theme_id = self.create_theme("city")
+        set_id = self.create_set("1-1", theme_id)
+
+        for response in (
+            self.api.get(f"/api/sets/{set_id}"),
+            self.api.get("/api/sets/"),
+            self.api.post("/api/themes/batch", {"ids": [theme_id]}, format="json"),
+            self.api.get(f"/api/themes/{theme_id}/stats", HTTP_ACCEPT="application/vnd.msgpack"),
+        ):
+            self.assertIn("serialize;dur=", response.headers["Server-Timing"])
+            self.assertIn("render;dur=", response.headers["Server-Timing"])
+
+        self.get_async(f"/api/async/themes/{theme_id}")
+
+        durations = self.api.get("/api/metrics/requests").json()["routes"]["GET /api/async/themes/<int:pk>"]["avg_ms"]
+        self.assertLessEqual({"serialize", "render"}, set(durations))
+
+    def test_database_metrics(self) -> None:
+        response = self.api.get("/api/metrics/database")
+
+        self.assertEqual(response.json()["default"]["pool"], None)
+
+    def test_admin_only(self) -> None:
+        self.api.force_authenticate(UserProfile.objects.create_user("user@lego.com", "user", "password"))
+
+        self.assertEqual(self.api.get("/api/metrics/requests").status_code, 403)
+        self.assertEqual(self.api.delete("/api/metrics/requests").status_code, 403)
+
+
+class TokenTests(APITestCase):
+    def test_token(self) -> None:
+        client = APIClient()
+        response = client.post("/api/token/", {"email": "admin@lego.com", "password": "password"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        refreshed = client.post("/api/token/refresh/", {"refresh": response.json()["refresh"]}, format="json")
+        self.assertEqual(refreshed.status_code, 200)
+
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.json()['access']}")
+        self.assertEqual(client.get("/api/metrics/database").status_code, 200)
+
+    def test_wrong_password(self) -> None:
+        response = APIClient().post("/api/token/", {"email": "admin@lego.com", "password": "wrong"}, format="json")
+
+        self.assertEqual(response.status_code, 401)
+
+
+class SchemaTests(APITestCase):
+    def test_schema(self) -> None:
+        response = self.api.get("/api/schema/", HTTP_ACCEPT="application/vnd.oai.openapi+json")
+
+        self.assertIn("/api/sets/{id}", response.json()["paths"])
+
+    def test_docs(self) -> None:
+        response = self.api.get("/api/docs/", HTTP_ACCEPT="text/html")
+
+        self.assertContains(response, "/api/schema/")
@@ -1,12 +1,20 @@
 from django.urls import include, path
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from api import views
+from set.urls import async_urlpatterns as set_async_urlpatterns
+from theme.urls import async_urlpatterns as theme_async_urlpatterns
 
 urlpatterns = [
     path("themes/", include("theme.urls"), name="themes"),
     path("sets/", include("set.urls"), name="sets"),
-    path('schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path("jobs/", include("job.urls"), name="jobs"),
+    path("changes/", include("change.urls"), name="changes"),
+    path("async/themes/", include(theme_async_urlpatterns)),
+    path("async/sets/", include(set_async_urlpatterns)),
+    path("metrics/database", views.database_metrics),
+    path("metrics/requests", views.request_metrics),
+    path('schema/', views.SchemaView.as_view(), name='schema'),
+    path('docs/', views.SwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('token/', views.TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/refresh/', views.TokenRefreshView.as_view(), name='token_refresh'),
 ]
@@ -0,0 +1,84 @@
+from typing import Any
+
+from django.db import connections
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework_simplejwt import views as jwt_views
+
+from utils import metrics
+from utils.pooled_postgresql.pool import pools_metrics
+from utils.query_budget import query_budget
+
+
+@extend_schema(
+    responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+    summary="Database connection settings and pool usage of this process"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+@query_budget(0)
+def database_metrics(request: Request) -> Response:
+    pools = pools_metrics()
+
+    return Response({
+        alias: {
+            "conn_max_age": connections.settings[alias]["CONN_MAX_AGE"],
+            "health_checks": connections.settings[alias]["CONN_HEALTH_CHECKS"],
+            "pool": pools.get(alias),
+        }
+        for alias in connections.settings
+    })
+
+
+@extend_schema(
+    responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+    summary="Latency histograms, db queries, serialization time and response size by route, for the sampled "
+            "requests of this process"
+)
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+@query_budget(0)
+def request_metrics(request: Request) -> Response:
+    if request.method == "DELETE":
+        metrics.request_metrics.reset()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    return Response(metrics.request_metrics.to_dict())
+
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    # the user read by its email
+    @query_budget(1)
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        return super().post(request, *args, **kwargs)
+
+
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    # the refresh token carries all it needs
+    @query_budget(0)
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        return super().post(request, *args, **kwargs)
+
+
+class SchemaView(SpectacularAPIView):
+    # excluded from the schema like the view it extends
+    @extend_schema(exclude=True)
+    @query_budget(0)
+    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        # drf-spectacular's views are untyped
+        return super().get(request, *args, **kwargs)  # type: ignore[no-untyped-call]
+
+
+class SwaggerView(SpectacularSwaggerView):
+    # excluded from the schema like the view it extends
+    @extend_schema(exclude=True)
+    @query_budget(0)
+    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        return super().get(request, *args, **kwargs)  # type: ignore[no-untyped-call]
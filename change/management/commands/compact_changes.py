@@ -0,0 +1,13 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from change.services import ChangeService
+
+
+class Command(BaseCommand):
+    help = "Drop the change log entries superseded by a later one and the ones older than CHANGES_RETENTION_DAYS"
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        superseded, expired = ChangeService.compact()
+        self.stdout.write(f"{superseded} superseded and {expired} expired changes deleted")
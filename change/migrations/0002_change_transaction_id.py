@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('change', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='transaction_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['transaction_id', 'id'], name='change_feed_order'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class Change(models.Model):
+    """ Entry of the append-only log of the catalog writes, (transaction_id, id) is the position in the log """
+
+    class Kind(models.TextChoices):
+        SET = "set"
+        THEME = "theme"
+
+    class Action(models.TextChoices):
+        UPSERT = "upsert"
+        DELETE = "delete"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=Action.choices)
+    created_at = models.DateTimeField(db_index=True)
+    # id of the writing transaction on PostgreSQL (0 elsewhere), the feed is ordered by it then by id
+    transaction_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["transaction_id", "id"], name="change_feed_order"),
+            # compaction looks for the later entries of the same object
+            models.Index(fields=["kind", "object_id"], name="change_kind_object"),
+        ]
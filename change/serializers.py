@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class ChangeFilterSerializer(serializers.Serializer):
+    since = serializers.CharField(required=False, help_text="Cursor returned by the previous call, none to get the "
+                                                            "cursor of the end of the log")
+    limit = serializers.IntegerField(default=1000, min_value=1, max_value=settings.CHANGES_PAGE_MAX_SIZE)
+
+
+class ChangeSerializer(serializers.Serializer):
+    kind = serializers.CharField()
+    action = serializers.CharField()
+    id = serializers.IntegerField()
+    data = serializers.JSONField(required=False, help_text="Current set or theme, upserts only")
+
+
+class ChangeFeedSerializer(serializers.Serializer):
+    changes = ChangeSerializer(many=True)
+    cursor = serializers.CharField(help_text="since of the next call")
+    more = serializers.BooleanField(help_text="Whether more changes are available right away")
@@ -0,0 +1,194 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Iterable, Optional, Union
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import BigIntegerField, DateTimeField, Exists, Expression, OuterRef, Q, QuerySet, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from change.models import Change
+from set.models import Set
+from set.serializers import SetSerializer
+from theme.models import Theme
+from theme.serializers import ThemeSerializer
+from utils.responses import ResponseGone
+from utils.serialization import FastListSerializer
+
+# models and representation of the upserted objects, by kind
+KINDS: dict[str, tuple[Union[type[Set], type[Theme]], FastListSerializer]] = {
+    Change.Kind.SET: (Set, FastListSerializer(SetSerializer)),
+    Change.Kind.THEME: (Theme, FastListSerializer(ThemeSerializer)),
+}
+
+
+class ChangeService:
+    @staticmethod
+    def record(kind: str, action: str, ids: Iterable[int]) -> None:
+        """ Append one entry per object, call it in the transaction of the write """
+        now = timezone.now()
+        transaction_id = ChangeService._transaction_id()
+
+        Change.objects.bulk_create(
+            [Change(kind=kind, object_id=pk, action=action, created_at=now, transaction_id=transaction_id)
+             for pk in ids],
+            batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+        )
+
+    @staticmethod
+    def record_queryset(kind: str, action: str, queryset: QuerySet[Any]) -> None:
+        """ Append one entry per row of the queryset with a single INSERT ... SELECT, the ids are never read """
+        connection = connections[router.db_for_write(Change)]
+        # the SQL selects the fields before the expressions
+        rows = queryset.order_by().values_list(
+            "pk", Value(kind), Value(action), Value(timezone.now(), output_field=DateTimeField()),
+            ChangeService._transaction_id(),
+        )
+        sql, params = rows.query.get_compiler(connection=connection).as_sql()
+        quote = connection.ops.quote_name
+        columns = ", ".join(quote(column) for column in ["object_id", "kind", "action", "created_at", "transaction_id"])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {quote(Change._meta.db_table)} ({columns}) {sql}", params)
+
+    @staticmethod
+    def get_changes(since: Optional[str], limit: int) -> Response:
+        """ The entries after the cursor, the last entry of each object only, with the current data of the upserts
+
+        The log is read in the order of the writing transactions: the entries of a transaction are served once every
+        transaction that started before it ended, so no entry can commit behind a cursor already returned, however
+        long the transaction. Without cursor, the position of the end of the log is returned.
+        """
+        # the horizon, the entries and the data of a page are read on the same database
+        using = router.db_for_read(Change)
+        now = timezone.now()
+        entries = Change.objects.using(using).order_by("transaction_id", "id")
+        horizon = ChangeService._horizon(using)
+
+        if horizon is not None:
+            entries = entries.filter(transaction_id__lt=horizon)
+
+        if since is None:
+            head = entries.reverse().values_list("transaction_id", "id").first()
+            cursor = ChangeService.encode_cursor(*(head or (0, 0)), now)
+
+            return Response({"changes": [], "cursor": cursor, "more": False})
+
+        transaction_id, position, created_at = ChangeService.decode_cursor(since)
+
+        if created_at < now - timedelta(days=settings.CHANGES_RETENTION_DAYS):
+            return ResponseGone("The cursor is older than the change log, sync again from the whole catalog")
+
+        page = list(
+            entries.filter(Q(transaction_id__gt=transaction_id) | Q(transaction_id=transaction_id, id__gt=position))
+            .values_list("transaction_id", "id", "kind", "object_id", "created_at")[:limit + 1]
+        )
+        more = len(page) > limit
+        page = page[:limit]
+
+        if more:
+            cursor = ChangeService.encode_cursor(page[-1][0], page[-1][1], page[-1][4])
+        elif page:
+            cursor = ChangeService.encode_cursor(page[-1][0], page[-1][1], now)
+        else:
+            cursor = ChangeService.encode_cursor(transaction_id, position, now)
+
+        return Response({"changes": ChangeService._records(page, using), "cursor": cursor, "more": more})
+
+    @staticmethod
+    def _records(page: list[tuple[int, int, str, int, datetime]], using: str) -> list[dict[str, Any]]:
+        """ The current state of the objects of the page, an upsert with the data of the ones that exist, a delete of
+        the others, in the order of their last entry
+
+        Two transactions writing an object may come in the reverse order of their commits, the state read now is the
+        one of the last commit either way. One query per kind.
+        """
+        latest = {(kind, object_id): i for i, (_, _, kind, object_id, _) in enumerate(page)}
+        data: dict[str, dict[int, dict[str, Any]]] = {}
+
+        for kind, (model, serializer) in KINDS.items():
+            ids = [object_id for object_kind, object_id in latest if object_kind == kind]
+
+            if ids:
+                rows = serializer.to_representation(serializer.values(model.objects.using(using).filter(pk__in=ids)))
+                data[kind] = {row["id"]: row for row in rows}
+
+        records: list[dict[str, Any]] = []
+
+        for kind, object_id in sorted(latest, key=latest.__getitem__):
+            if object_id in data.get(kind, {}):
+                records.append({"kind": kind, "action": Change.Action.UPSERT, "id": object_id,
+                                "data": data[kind][object_id]})
+            else:
+                records.append({"kind": kind, "action": Change.Action.DELETE, "id": object_id})
+
+        return records
+
+    @staticmethod
+    def _transaction_id() -> Expression:
+        """ Id of the current transaction on PostgreSQL, 0 elsewhere """
+        if connections[router.db_for_write(Change)].vendor != "postgresql":
+            return Value(0, output_field=BigIntegerField())
+
+        return RawSQL("pg_current_xact_id()::text::bigint", [], output_field=BigIntegerField())
+
+    @staticmethod
+    def _horizon(using: str) -> Optional[int]:
+        """ Oldest transaction still running on PostgreSQL, the entries of the transactions before it are final
+
+        SQLite runs one write transaction at a time, the ids follow the commits: every entry read is final.
+        """
+        connection = connections[using]
+
+        if connection.vendor != "postgresql":
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+            horizon: int = cursor.fetchone()[0]
+
+        return horizon
+
+    @staticmethod
+    def compact() -> tuple[int, int]:
+        """ Delete the entries superseded by a later entry of the same object, then the ones past the retention
+
+        Returns the number of entries deleted by each step.
+        """
+        # later in the order of the feed, a transaction starting later may have inserted its entry first
+        later = Change.objects.filter(kind=OuterRef("kind"), object_id=OuterRef("object_id")).filter(
+            Q(transaction_id__gt=OuterRef("transaction_id"))
+            | Q(transaction_id=OuterRef("transaction_id"), id__gt=OuterRef("id"))
+        )
+        superseded, _ = Change.objects.filter(Exists(later)).delete()
+        expired, _ = Change.objects.filter(
+            created_at__lt=timezone.now() - timedelta(days=settings.CHANGES_RETENTION_DAYS),
+        ).delete()
+
+        return superseded, expired
+
+    @staticmethod
+    def encode_cursor(transaction_id: int, position: int, created_at: datetime) -> str:
+        """ The position in the log and the age of the entries after it, which tells if they were compacted """
+        return base64.urlsafe_b64encode(
+            json.dumps([transaction_id, position, created_at.timestamp()]).encode(),
+        ).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[int, int, datetime]:
+        try:
+            transaction_id, position, timestamp = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            transaction_id, position = int(transaction_id), int(position)
+
+            # the ids are 64-bit columns
+            if not (0 <= transaction_id < 2 ** 63 and 0 <= position < 2 ** 63):
+                raise ValueError("Position out of range")
+
+            return transaction_id, position, datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc)
+        except (TypeError, ValueError, OverflowError, OSError):
+            # OverflowError and OSError: timestamps out of the range of the platform
+            raise NotFound("Invalid cursor")
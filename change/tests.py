@@ -0,0 +1,97 @@
+import base64
+import json
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from change.models import Change
+from change.services import ChangeService
+from utils.testing import APITestCase
+
+
+class ChangeTests(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cursor = self.api.get("/api/changes/").json()["cursor"]
+
+    def pull(self, limit: int = 1000) -> list[tuple[str, str, int]]:
+        """ The changes since the last pull, page by page """
+        changes = []
+
+        while True:
+            page = self.api.get("/api/changes/", {"since": self.cursor, "limit": limit}).json()
+            changes += [(change["kind"], change["action"], change["id"]) for change in page["changes"]]
+            self.cursor = page["cursor"]
+
+            if not page["more"]:
+                return changes
+
+    def test_feed(self) -> None:
+        city = self.create_theme("city")
+        police = self.create_theme("police", city)
+        first, second = self.create_set("1-1", police), self.create_set("2-1", police)
+
+        self.assertEqual(self.pull(limit=1), [
+            ("theme", "upsert", city), ("theme", "upsert", police), ("set", "upsert", first), ("set", "upsert", second),
+        ])
+
+        self.api.patch("/api/sets/batch", {"items": [{"id": first, "name": "renamed"}]}, format="json")
+        self.api.delete(f"/api/themes/{police}")
+
+        self.assertEqual(self.pull(), [
+            ("set", "delete", first), ("set", "delete", second), ("theme", "delete", police),
+        ])
+        self.assertEqual(self.pull(), [])
+
+    def test_upsert_of_a_deleted_object(self) -> None:
+        city = self.create_theme("city")
+        self.api.delete(f"/api/themes/{city}")
+
+        # the current state of each object, only its last entry
+        self.assertEqual(self.pull(), [("theme", "delete", city)])
+
+    def test_upsert_data(self) -> None:
+        city = self.create_theme("city")
+
+        with CaptureQueriesContext(connection) as queries:
+            page = self.api.get("/api/changes/", {"since": self.cursor}).json()
+
+        self.assertEqual(page["changes"], [{
+            "kind": "theme", "action": "upsert", "id": city, "data": {"id": city, "name": "city", "parent_id": None},
+        }])
+        # the log page and the data of the themes
+        self.assertEqual(len(queries), 2)
+
+    def test_compact(self) -> None:
+        city = self.create_theme("city")
+        self.api.patch(f"/api/themes/{city}", {"name": "town"}, format="json")
+        Change.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.create_theme("police", city)
+
+        self.assertEqual(ChangeService.compact(), (1, 1))
+        self.assertEqual(Change.objects.count(), 1)
+
+    def test_compact_in_the_order_of_the_feed(self) -> None:
+        city = self.create_theme("city")
+        self.api.patch(f"/api/themes/{city}", {"name": "town"}, format="json")
+        first, second = Change.objects.order_by("id")
+        # the transaction of the second entry started first, the feed sends it before the first one
+        Change.objects.filter(pk=first.pk).update(transaction_id=20)
+        Change.objects.filter(pk=second.pk).update(transaction_id=10)
+
+        self.assertEqual(ChangeService.compact(), (1, 0))
+        self.assertEqual(list(Change.objects.values_list("pk", flat=True)), [first.pk])
+
+    def test_cursors(self) -> None:
+        expired = ChangeService.encode_cursor(0, 0, timezone.now() - timedelta(days=30))
+
+        self.assertEqual(self.api.get("/api/changes/", {"since": expired}).status_code, 410)
+        self.assertEqual(self.api.get("/api/changes/", {"since": "garbage"}).status_code, 404)
+
+        for position in ([0, 0, 1e20], [2 ** 70, 0, 0], [0, -1, 0]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            self.assertEqual(self.api.get("/api/changes/", {"since": cursor}).status_code, 404)
+
+        self.assertEqual(self.api.get("/api/changes/", {"limit": 0}).status_code, 400)
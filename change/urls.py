@@ -0,0 +1,6 @@
+from django.urls import path
+from change import views
+
+urlpatterns = [
+    path('', views.ChangeListView.as_view()),
+]
@@ -0,0 +1,32 @@
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from change.serializers import ChangeFeedSerializer, ChangeFilterSerializer
+from change.services import ChangeService
+from utils.query_budget import query_budget
+from utils.responses import ResponseBadRequest
+
+
+class ChangeListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    @extend_schema(
+        parameters=[ChangeFilterSerializer],
+        responses={status.HTTP_200_OK: ChangeFeedSerializer},
+        operation_id="getChanges",
+        summary="Get the sets and themes upserted or deleted since a cursor, in the order of the writes"
+    )
+    # the horizon of the log (PostgreSQL), its page then the data of the sets and themes
+    @query_budget(4)
+    def get(request: Request) -> Response:
+        options = ChangeFilterSerializer(data=request.query_params)
+
+        if not options.is_valid():
+            return ResponseBadRequest(options.errors)
+
+        return ChangeService.get_changes(options.validated_data.get("since"), options.validated_data["limit"])
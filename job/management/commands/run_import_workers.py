@@ -0,0 +1,55 @@
+import threading
+import time
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection
+
+from job.services import ImportJobService
+
+
+class Command(BaseCommand):
+    help = "Process the pending import jobs with a pool of worker threads, jobs are queued in the database"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--workers", type=int, default=settings.IMPORT_WORKERS)
+        parser.add_argument("--poll-interval", type=float, default=settings.IMPORT_POLL_INTERVAL,
+                            help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        stop = threading.Event()
+        workers = [
+            threading.Thread(target=self.work, args=(stop, options["poll_interval"]), name=f"import-worker-{i}")
+            for i in range(options["workers"])
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        self.stdout.write(f"{len(workers)} import workers started")
+
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after the running jobs")
+            stop.set()
+
+            for worker in workers:
+                worker.join()
+
+    def work(self, stop: threading.Event, poll_interval: float) -> None:
+        try:
+            while not stop.is_set():
+                job = ImportJobService.claim()
+
+                if job is None:
+                    stop.wait(poll_interval)
+                    continue
+
+                self.stdout.write(f"Running import job {job.pk}")
+                ImportJobService.run(job)
+        finally:
+            # every thread has its own connection
+            connection.close()
@@ -0,0 +1,30 @@
+from django.db import models
+
+
+class ImportJob(models.Model):
+    """ Bulk import file waiting for or processed by an import worker """
+
+    class Kind(models.TextChoices):
+        SET = "set"
+        THEME = "theme"
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    mode = models.CharField(max_length=10)
+    file = models.FileField(upload_to="imports/")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, db_index=True)
+    # ImportReport of the rows processed so far
+    report = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # refreshed by the worker running the job, a running job without heartbeat for IMPORT_JOB_TIMEOUT is requeued
+    heartbeat_at = models.DateTimeField(null=True)
+    # number of times a worker claimed the job
+    attempts = models.PositiveIntegerField(default=0)
@@ -0,0 +1,16 @@
+from rest_framework import serializers
+
+from utils.serialization import OutputSerializer
+
+
+class ImportJobSerializer(OutputSerializer):
+    id = serializers.IntegerField()
+    kind = serializers.CharField()
+    mode = serializers.CharField()
+    status = serializers.CharField()
+    report = serializers.JSONField()
+    error = serializers.CharField()
+    attempts = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    started_at = serializers.DateTimeField()
+    finished_at = serializers.DateTimeField()
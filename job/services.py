@@ -0,0 +1,164 @@
+import copy
+import logging
+import threading
+from datetime import timedelta
+from types import TracebackType
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from job.models import ImportJob
+from job.serializers import ImportJobSerializer
+from set.serializers import FileUploadSerializer as SetFileUploadSerializer
+from set.services import SetService
+from theme.serializers import FileUploadSerializer as ThemeFileUploadSerializer
+from theme.services import ThemeService
+from utils.imports import ImportReport
+
+logger = logging.getLogger(__name__)
+
+
+class ImportJobService:
+    @staticmethod
+    def enqueue(job: ImportJob) -> Response:
+        job.save()
+
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @staticmethod
+    def get(pk: int) -> Response:
+        job = get_object_or_404(ImportJob, pk=pk)
+
+        return Response(ImportJobSerializer(job).data)
+
+    @staticmethod
+    def claim() -> Optional[ImportJob]:
+        """ Take the oldest pending job, the conditional update makes sure only one worker gets it """
+        ImportJobService.requeue_stale()
+
+        while True:
+            pk = ImportJob.objects.filter(status=ImportJob.Status.PENDING).order_by("id") \
+                .values_list("pk", flat=True).first()
+
+            if pk is None:
+                return None
+
+            now = timezone.now()
+            claimed = ImportJob.objects.filter(pk=pk, status=ImportJob.Status.PENDING).update(
+                status=ImportJob.Status.RUNNING, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1,
+            )
+
+            if claimed:
+                return ImportJob.objects.get(pk=pk)
+
+    @staticmethod
+    def requeue_stale() -> None:
+        """ Give the running jobs whose worker stopped sending heartbeats back to the queue
+
+        A job that already used its IMPORT_JOB_MAX_ATTEMPTS fails instead, it may be the one killing the workers.
+        """
+        now = timezone.now()
+        stale = ImportJob.objects.filter(status=ImportJob.Status.RUNNING).filter(
+            Q(heartbeat_at__lt=now - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)) | Q(heartbeat_at__isnull=True)
+        )
+
+        failed = stale.filter(attempts__gte=settings.IMPORT_JOB_MAX_ATTEMPTS).update(
+            status=ImportJob.Status.FAILED, error="The import worker stopped responding", finished_at=now,
+        )
+        requeued = stale.filter(attempts__lt=settings.IMPORT_JOB_MAX_ATTEMPTS).update(
+            status=ImportJob.Status.PENDING, heartbeat_at=None,
+        )
+
+        if failed or requeued:
+            logger.warning("%d stale import jobs requeued, %d failed", requeued, failed)
+
+    @staticmethod
+    def run(job: ImportJob) -> None:
+        heartbeat = Heartbeat(job)
+
+        try:
+            with heartbeat, job.file.open("rb") as file:
+                if job.kind == ImportJob.Kind.SET:
+                    report = SetService.bulk_import(
+                        SetFileUploadSerializer.read(file), job.mode, heartbeat.progress,
+                    )
+                else:
+                    report = ThemeService.bulk_import(
+                        ThemeFileUploadSerializer.read(file), job.mode, heartbeat.progress,
+                    )
+        except Exception as e:
+            logger.exception("Import job %d failed", job.pk)
+            job.status = ImportJob.Status.FAILED
+            job.error = str(e)
+            # the progress of the rows processed before the error
+            job.report = heartbeat.report or job.report
+        else:
+            job.status = ImportJob.Status.DONE
+            job.report = report.to_dict()
+
+        # a job requeued in the meantime belongs to the worker that claimed it again
+        finished = ImportJob.objects.filter(pk=job.pk, attempts=job.attempts).update(
+            status=job.status, error=job.error, report=job.report, finished_at=timezone.now(),
+        )
+
+        if finished:
+            job.file.delete(save=False)
+
+
+class Heartbeat:
+    """ Thread refreshing the heartbeat of a running job and saving its progress report
+
+    The thread has its own connection, the progress of an import running in a single transaction (themes) is
+    visible before it commits.
+    """
+
+    def __init__(self, job: ImportJob):
+        self.job = job
+        self.report: Optional[dict[str, Any]] = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name=f"import-job-{job.pk}-heartbeat", daemon=True)
+
+    def __enter__(self) -> "Heartbeat":
+        self.thread.start()
+
+        return self
+
+    def __exit__(
+            self,
+            exc_type: Optional[type[BaseException]],
+            exc: Optional[BaseException],
+            traceback: Optional[TracebackType],
+    ) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def progress(self, report: ImportReport) -> None:
+        """ Called by the import, the report is copied since the import keeps adding to it """
+        self.report = copy.deepcopy(report.to_dict())
+
+    def beat(self) -> None:
+        try:
+            while not self.stopped.wait(settings.IMPORT_HEARTBEAT_INTERVAL):
+                try:
+                    self.save()
+                except DatabaseError:
+                    # the next beat retries, the timeout leaves room for a few missed ones
+                    logger.warning("Heartbeat of import job %d failed", self.job.pk, exc_info=True)
+                    connection.close()
+        finally:
+            connection.close()
+
+    def save(self) -> None:
+        fields: dict[str, Any] = {"heartbeat_at": timezone.now()}
+
+        if self.report is not None:
+            fields["report"] = self.report
+
+        ImportJob.objects.filter(pk=self.job.pk, status=ImportJob.Status.RUNNING, attempts=self.job.attempts) \
+            .update(**fields)
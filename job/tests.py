@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from typing import Any
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.utils import timezone
+
+from job.models import ImportJob
+from job.services import ImportJobService
+from set.models import Set
+from theme.models import Theme
+from utils.testing import APITestCase
+
+
+class ImportJobTests(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        # the uploaded files
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def upload(self, path: str, content: str) -> Any:
+        file = SimpleUploadedFile("import.csv", content.encode(), content_type="text/csv")
+        response = self.api.post(path, {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 202)
+
+        return response.json()
+
+    def test_import(self) -> None:
+        themes = self.upload("/api/themes/bulk", "id,name,parent_id\n1,city,\n2,police,1\n")
+        sets = self.upload("/api/sets/bulk/", (
+            "set_num,year,name,theme_id,num_parts,img_url\n"
+            "1-1,2000,station,2,100,https://lego.com/set.png\n"
+            "2-1,2000,no theme,0,100,https://lego.com/set.png\n"
+        ))
+        self.assertEqual(themes["status"], "pending")
+
+        files = []
+
+        # oldest first, the sets need their themes
+        for pk in (themes["id"], sets["id"]):
+            job = ImportJobService.claim()
+            assert job is not None
+            self.assertEqual(job.pk, pk)
+            files.append((job.file.storage, job.file.name))
+            ImportJobService.run(job)
+
+        self.assertIsNone(ImportJobService.claim())
+        self.assertEqual(Theme.objects.get(pk=2).path, "1/2/")
+        self.assertEqual(list(Set.objects.values_list("num", flat=True)), ["1-1"])
+
+        done = self.api.get(f"/api/jobs/{sets['id']}").json()
+        self.assertEqual((done["status"], done["attempts"]), ("done", 1))
+        self.assertEqual((done["report"]["inserted"], done["report"]["failed"]), (1, 1))
+        # the files are removed once processed
+        self.assertFalse(any(storage.exists(name) for storage, name in files))
+
+    def test_invalid_file(self) -> None:
+        file = SimpleUploadedFile("import.csv", b"name\ncity\n", content_type="text/csv")
+
+        self.assertEqual(self.api.post("/api/themes/bulk", {"file": file}, format="multipart").status_code, 400)
+        self.assertFalse(ImportJob.objects.exists())
+        self.assertEqual(self.api.get("/api/jobs/1").status_code, 404)
+
+    def test_stale_jobs(self) -> None:
+        pk = self.upload("/api/themes/bulk", "id,name,parent_id\n1,city,\n")["id"]
+        job = ImportJobService.claim()
+        assert job is not None
+
+        # the worker crashed, the job is given to the next one
+        ImportJob.objects.filter(pk=pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        job = ImportJobService.claim()
+        assert job is not None
+        self.assertEqual(job.attempts, 2)
+
+        # the job that may be killing the workers fails after its last attempt
+        ImportJob.objects.filter(pk=pk).update(heartbeat_at=timezone.now() - timedelta(hours=1), attempts=3)
+        self.assertIsNone(ImportJobService.claim())
+        self.assertEqual(self.api.get(f"/api/jobs/{pk}").json()["status"], "failed")
+
+    def test_requeued_job_belongs_to_its_new_worker(self) -> None:
+        pk = self.upload("/api/themes/bulk", "id,name,parent_id\n1,city,\n")["id"]
+        job = ImportJobService.claim()
+        assert job is not None
+        ImportJob.objects.filter(pk=pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNotNone(ImportJobService.claim())
+
+        # the first worker finishing late doesn't overwrite the job of the second one
+        ImportJobService.run(job)
+
+        self.assertEqual(ImportJob.objects.get(pk=pk).status, ImportJob.Status.RUNNING)
@@ -0,0 +1,6 @@
+from django.urls import path
+from job import views
+
+urlpatterns = [
+    path('<int:pk>', views.ImportJobDetailView.as_view()),
+]
@@ -0,0 +1,24 @@
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from job.serializers import ImportJobSerializer
+from job.services import ImportJobService
+from utils.query_budget import query_budget
+
+
+class ImportJobDetailView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    @staticmethod
+    @extend_schema(
+        responses={status.HTTP_200_OK: ImportJobSerializer},
+        operation_id="getImportJobById",
+        summary="Get the status and progress of an import job"
+    )
+    @query_budget(1)
+    def get(request: Request, pk: int) -> Response:
+        return ImportJobService.get(pk)
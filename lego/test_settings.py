@@ -0,0 +1,27 @@
+from lego.settings import *  # noqa: F401, F403
+
+# the test suite runs on two local SQLite databases: python manage.py test --settings=lego.test_settings
+# replica_1 never gets the writes, like a replica lagging for good. The replica router is only installed by the
+# tests of the replicas (utils.tests), the other tests read and write default
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    'replica_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+    },
+}
+
+DATABASE_ROUTERS = []
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+ALLOWED_HOSTS = [*ALLOWED_HOSTS, "testserver"]
+
+QUERY_BUDGET_STRICT = True
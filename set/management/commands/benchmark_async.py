@@ -0,0 +1,123 @@
+import asyncio
+import statistics
+import time
+import uuid
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.test import AsyncClient, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from set.models import Set
+from theme.models import Theme
+from theme.services import ThemeService
+from user.models import UserProfile
+
+# name, sync endpoint, async endpoint, {set_id} and {theme_id} rotate over the seeded rows
+ROUTES = [
+    ("themes list", "/api/themes/?limit=50", "/api/async/themes/?limit=50"),
+    ("theme detail", "/api/themes/{theme_id}", "/api/async/themes/{theme_id}"),
+    ("theme descendants", "/api/themes/{root_id}/descendants", "/api/async/themes/{root_id}/descendants"),
+    ("theme sets", "/api/themes/{theme_id}/sets?limit=50", "/api/async/themes/{theme_id}/sets?limit=50"),
+    ("sets list", "/api/sets/?limit=50&ordering=-year", "/api/async/sets/?limit=50&ordering=-year"),
+    ("set detail", "/api/sets/{set_id}", "/api/async/sets/{set_id}"),
+]
+
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+class Command(BaseCommand):
+    help = "Compare the sync DRF endpoints with the async ones under concurrent requests on the ASGI application"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--sets", type=int, default=2000)
+        parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint and concurrency")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 200])
+        parser.add_argument("--cache", action="store_true",
+                            help="Keep the catalog cache, by default every request reaches the db")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        # the requests run in other threads (one connection each) so the rows must be committed
+        user = UserProfile.objects.create_user(f"benchmark-{uuid.uuid4().hex}@example.com", "benchmark")
+        root = Theme.objects.create(name="benchmark")
+
+        try:
+            ids = self.seed(root, options["sets"])
+
+            # the requests are sent by a test client, whose host is testserver
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                                   **({} if options["cache"] else {"CACHES": NO_CACHE})):
+                asyncio.run(self.run(str(AccessToken.for_user(user)), ids, options))
+        finally:
+            ThemeService.delete_subtrees([f"{root.pk}/"])
+            user.delete()
+
+    @staticmethod
+    def seed(root: Theme, count: int) -> dict[str, list[int]]:
+        root.path = f"{root.pk}/"
+        root.save(update_fields=["path"])
+
+        themes = Theme.objects.bulk_create([Theme(name=f"benchmark {i}", parent=root) for i in range(20)])
+
+        for theme in themes:
+            theme.path = f"{root.path}{theme.pk}/"
+
+        Theme.objects.bulk_update(themes, ["path"])
+
+        sets = Set.objects.bulk_create([
+            Set(num=f"benchmark-{uuid.uuid4().hex[:12]}-{i}", name=f"Set {i}", year=1990 + i % 30, num_parts=i,
+                img_url=f"https://cdn.rebrickable.com/media/sets/{i}.jpg", theme=themes[i % len(themes)])
+            for i in range(count)
+        ], batch_size=1000)
+
+        return {
+            "theme_id": [theme.pk for theme in themes],
+            "root_id": [root.pk],
+            "set_id": [set_object.pk for set_object in sets],
+        }
+
+    async def run(self, token: str, ids: dict[str, list[int]], options: dict[str, Any]) -> None:
+        client = AsyncClient()
+        headers = {"authorization": f"Bearer {token}"}
+
+        self.stdout.write(f"{'endpoint':<18} {'concurrency':>11} {'mode':>6} {'req/s':>8} {'p50 (ms)':>9} "
+                          f"{'p95 (ms)':>9}")
+
+        for name, sync_url, async_url in ROUTES:
+            for concurrency in options["concurrency"]:
+                for mode, url in (("sync", sync_url), ("async", async_url)):
+                    urls = [
+                        url.format(**{key: values[i % len(values)] for key, values in ids.items()})
+                        for i in range(options["requests"])
+                    ]
+                    durations, elapsed = await self.load(client, urls, headers, concurrency)
+                    percentiles = statistics.quantiles(durations, n=100)
+
+                    self.stdout.write(f"{name:<18} {concurrency:>11} {mode:>6} {len(urls) / elapsed:>8.0f} "
+                                      f"{percentiles[49]:>9.1f} {percentiles[94]:>9.1f}")
+
+    @staticmethod
+    async def load(
+            client: AsyncClient,
+            urls: list[str],
+            headers: dict[str, str],
+            concurrency: int,
+    ) -> tuple[list[float], float]:
+        """ Durations in ms of the requests, at most concurrency of them in flight, and the total time in s """
+        semaphore = asyncio.Semaphore(concurrency)
+        durations: list[float] = []
+
+        async def call(url: str) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                durations.append((time.perf_counter() - start) * 1000)
+
+            if response.status_code != 200:
+                raise CommandError(f"{url} answered {response.status_code}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(call(url) for url in urls))
+
+        return durations, time.perf_counter() - start
@@ -0,0 +1,65 @@
+import statistics
+import time
+from typing import Any, Callable
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+
+from set.models import Set
+from set.serializers import SetSerializer
+from set.services import SET_ROWS
+from theme.models import Theme
+
+
+class Command(BaseCommand):
+    help = "Compare SetSerializer(many=True) with the values() fast path used by the list endpoints"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        sizes: list[int] = options["sizes"]
+
+        # the benchmark rows are rolled back at the end
+        with transaction.atomic():
+            theme = Theme.objects.create(name="benchmark")
+            Set.objects.bulk_create([
+                Set(num=f"benchmark-{i}", name=f"Set {i}", year=2000 + i % 25, num_parts=i,
+                    img_url=f"https://cdn.rebrickable.com/media/sets/{i}.jpg", theme=theme)
+                for i in range(max(sizes))
+            ])
+            sets = Set.objects.filter(theme=theme).order_by("id")
+
+            self.stdout.write(f"{'page size':>10} {'serializer (ms)':>16} {'fast path (ms)':>15} {'speedup':>8}")
+
+            for size in sizes:
+                page = sets[:size]
+
+                def drf() -> Any:
+                    return SetSerializer(list(page.all()), many=True).data
+
+                def fast() -> Any:
+                    return SET_ROWS.to_representation(SET_ROWS.values(page))
+
+                if [dict(row) for row in drf()] != fast():
+                    raise AssertionError(f"Outputs differ for a page of {size}")
+
+                drf_time = self.measure(drf, options["repeat"])
+                fast_time = self.measure(fast, options["repeat"])
+
+                self.stdout.write(f"{size:>10} {drf_time:>16.3f} {fast_time:>15.3f} {drf_time / fast_time:>7.1f}x")
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(function: Callable[[], Any], repeat: int) -> float:
+        """ Median duration in ms, the db query included """
+        durations = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            durations.append((time.perf_counter() - start) * 1000)
+
+        return statistics.median(durations)
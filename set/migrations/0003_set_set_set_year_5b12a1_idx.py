@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('set', '0002_alter_set_num'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['year', 'id'], name='set_set_year_5b12a1_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('set', '0003_set_set_set_year_5b12a1_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['num_parts', 'id'], name='set_set_num_par_e20b21_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['name', 'id'], name='set_set_name_6b84a8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['theme', 'year', 'id'], name='set_set_theme_i_97bbff_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+
+def create_trigram_indexes(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    # icontains is UPPER(column::text) LIKE UPPER(...) on postgres, these indexes match that expression.
+    # Other databases keep the plain LIKE scan.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS set_set_name_trgm_idx ON set_set USING gin (UPPER(name::text) gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS set_set_num_trgm_idx ON set_set USING gin (UPPER(num::text) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_indexes(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('DROP INDEX IF EXISTS set_set_name_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS set_set_num_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('set', '0004_set_sort_and_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
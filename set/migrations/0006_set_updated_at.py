@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('set', '0005_set_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='set',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
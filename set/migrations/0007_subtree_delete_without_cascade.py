@@ -0,0 +1,20 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theme', '0004_subtree_delete_without_cascade'),
+        ('set', '0006_set_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='set',
+            name='theme',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='theme.theme'),
+        ),
+    ]
@@ -9,4 +9,17 @@ class Set(models.Model):
     year = models.PositiveIntegerField()
     num_parts = models.PositiveIntegerField()
     img_url = models.URLField()
-    theme = models.ForeignKey(Theme, on_delete=models.CASCADE)
+    # deleted with their theme by ThemeService.delete_subtrees
+    theme = models.ForeignKey(Theme, on_delete=models.DO_NOTHING)
+    # row version used for the ETag and Last-Modified validators
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination and sorting
+            models.Index(fields=["year", "id"]),
+            models.Index(fields=["num_parts", "id"]),
+            models.Index(fields=["name", "id"]),
+            # sets of a theme filtered by year
+            models.Index(fields=["theme", "year", "id"]),
+        ]
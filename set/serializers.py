@@ -1,12 +1,28 @@
-from typing import Union
+from typing import IO, Any, Union
 import pandas as pd
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 from rest_framework import serializers
 
+from job.models import ImportJob
 from set.models import Set
+from theme.models import Theme
+from utils.imports import IMPORT_MODES, INSERT, ColumnValidator, ImportReport
+from utils.serialization import OutputSerializer
 
+# accepted years of the imported sets
+YEAR_RANGE = (1932, 2100)
 
-class SetSerializer(serializers.Serializer):
+# ordering choice => order_by fields, id comes last to make the ordering unique for keyset pagination
+SET_ORDERINGS = {
+    "id": ["id"],
+    "-id": ["-id"],
+    **{field: [field, "id"] for field in ("year", "num_parts", "name")},
+    **{f"-{field}": [f"-{field}", "-id"] for field in ("year", "num_parts", "name")},
+}
+
+
+class SetSerializer(OutputSerializer):
     num = serializers.CharField()
     name = serializers.CharField()
     year = serializers.IntegerField()
@@ -16,6 +32,17 @@ class SetSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
 
+class SetFilterSerializer(serializers.Serializer):
+    theme_id = serializers.IntegerField(required=False)
+    year_min = serializers.IntegerField(required=False)
+    year_max = serializers.IntegerField(required=False)
+    num_parts_min = serializers.IntegerField(required=False)
+    num_parts_max = serializers.IntegerField(required=False)
+    search = serializers.CharField(required=False, help_text="Case insensitive search on name and num")
+    ordering = serializers.ChoiceField(choices=list(SET_ORDERINGS), default="id")
+    pagination = serializers.ChoiceField(choices=["offset", "cursor"], default="offset")
+
+
 class CreateSetSerializer(serializers.Serializer):
     num = serializers.CharField()
     name = serializers.CharField()
@@ -47,15 +74,65 @@ class UpdateSetSerializer(serializers.Serializer):
         return instance
 
 
-class FileUploadSerializer(serializers.Serializer):
-    file = serializers.FileField()
+class BatchGetSetSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), default=list)
+    nums = serializers.ListField(child=serializers.CharField(), default=list)
+
+    def validate(self, data: dict[str, list[Union[str, int]]]) -> dict[str, list[Union[str, int]]]:
+        if len(data["ids"]) + len(data["nums"]) > settings.BATCH_MAX_SIZE:
+            raise serializers.ValidationError(f"At most {settings.BATCH_MAX_SIZE} ids and nums")
+
+        return data
 
-    def create(self, validated_data: dict[str, InMemoryUploadedFile]) -> pd.DataFrame:
-        file = validated_data["file"]
 
-        df = pd.read_csv(file)
+class BatchUpdateSetSerializer(UpdateSetSerializer):
+    id = serializers.IntegerField()
 
-        if not {"set_num", "year", "name", "theme_id", "num_parts", "img_url"}.issubset(df.columns):
-            raise serializers.ValidationError("Columns must contain id, parent_id and name")
 
-        return df
+class FileUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    mode = serializers.ChoiceField(choices=IMPORT_MODES, default=INSERT)
+
+    columns = ["set_num", "year", "name", "theme_id", "num_parts", "img_url"]
+
+    def validate_file(self, file: UploadedFile) -> UploadedFile:
+        try:
+            header = pd.read_csv(file, nrows=0).columns
+        except pd.errors.EmptyDataError:
+            raise serializers.ValidationError("File is empty")
+
+        if not set(self.columns).issubset(header):
+            raise serializers.ValidationError("Columns must contain " + ", ".join(self.columns))
+
+        file.seek(0)
+
+        return file
+
+    def create(self, validated_data: dict[str, Any]) -> ImportJob:
+        return ImportJob(kind=ImportJob.Kind.SET, mode=validated_data["mode"], file=validated_data["file"])
+
+    @staticmethod
+    def validate_rows(chunk: pd.DataFrame, report: ImportReport) -> pd.DataFrame:
+        """ Rows of the chunk passing the column checks, with integer year, num_parts and theme_id """
+        validator = ColumnValidator(chunk, report)
+        validator.text("set_num", Set._meta.get_field("num"))
+        validator.unique("set_num")
+        validator.text("name", Set._meta.get_field("name"))
+        validator.integer("year", *YEAR_RANGE)
+        validator.integer("num_parts", 0)
+        validator.text("img_url", Set._meta.get_field("img_url"))
+        validator.url("img_url")
+        validator.integer("theme_id", 1)
+        validator.exists("theme_id", Theme)
+
+        return validator.valid_rows()
+
+    @classmethod
+    def read(cls, file: IO[bytes]) -> pd.io.parsers.TextFileReader:
+        """ Chunks of the validated file, memory is bounded by BULK_IMPORT_CHUNK_SIZE """
+        return pd.read_csv(
+            file,
+            usecols=cls.columns,
+            dtype={"set_num": str, "name": str, "img_url": str},
+            chunksize=settings.BULK_IMPORT_CHUNK_SIZE,
+        )
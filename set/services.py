@@ -1,87 +1,579 @@
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Optional, Union
+
 import pandas as pd
-from django.db.utils import IntegrityError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.db.utils import DataError, IntegrityError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import BasePagination
 from rest_framework.request import Request
 from rest_framework.response import Response
 
+from change.models import Change
+from change.services import ChangeService
 from set.models import Set
-from set.serializers import SetSerializer, UpdateSetSerializer
+from set.serializers import SET_ORDERINGS, BatchUpdateSetSerializer, FileUploadSerializer, SetFilterSerializer, \
+    SetSerializer, UpdateSetSerializer
+from theme.models import Theme
+from theme.stats import StatsChanges
+from utils.batch import item_result
+from utils.cache import CatalogCache, SET_DETAILS, SET_LISTS
+from utils.conditional import Validators, version_validators, versions_validators
+from utils.export import stream_export
+from utils.imports import ImportReport, INSERT, UPSERT
+from utils.pagination import KeysetPagination, UncountedLimitOffsetPagination
+from utils.serialization import FastListSerializer
 from utils.responses import ResponseBadRequest
 
+logger = logging.getLogger(__name__)
+
+SET_UPDATE_FIELDS = ["name", "year", "num_parts", "img_url", "theme_id"]
+
+# list pages skip the DRF field machinery, the output is the one of SetSerializer
+SET_ROWS = FastListSerializer(SetSerializer)
+
 
 class SetService:
     @staticmethod
-    def bulk_import(df: pd.DataFrame) -> Response:
-        sets = [
-            Set(
-                num=row.set_num,
-                year=row.year,
-                name=row.name,
-                num_parts=row.num_parts,
-                img_url=row.img_url,
-                theme_id=row.theme_id,
+    def bulk_import(
+            chunks: Iterable[pd.DataFrame],
+            mode: str = INSERT,
+            progress: Optional[Callable[[ImportReport], None]] = None,
+    ) -> ImportReport:
+        """ Import the chunks one after the other, progress is called with the report after each chunk """
+        report = ImportReport()
+
+        for chunk in chunks:
+            SetService._import_chunk(chunk, report, mode)
+            logger.info("Set import: %d inserted, %d updated, %d skipped, %d failed", report.inserted,
+                        report.updated, report.skipped, report.failed)
+
+            if progress is not None:
+                progress(report)
+
+        if report.inserted or report.updated:
+            CatalogCache.invalidate(SET_LISTS)
+        if report.updated:
+            CatalogCache.invalidate(SET_DETAILS)
+
+        return report
+
+    @staticmethod
+    def _import_chunk(chunk: pd.DataFrame, report: ImportReport, mode: str) -> None:
+        """ Write the rows of the chunk along with their stats changes and change log entries, in one transaction """
+        # line number in the file, the header being line 1
+        chunk = FileUploadSerializer.validate_rows(chunk.assign(row=chunk.index + 2), report)
+        chunk = chunk.astype({"year": int, "num_parts": int, "theme_id": int})
+
+        try:
+            with transaction.atomic():
+                rows, is_new, skipped = SetService._merge_existing(chunk, mode)
+                SetService._write(SetService._import_sets(rows), mode)
+                SetService._import_applied(rows, is_new)
+        except (IntegrityError, DataError):
+            # a row was rejected by the db after the checks above, write one by one to isolate it
+            with transaction.atomic():
+                rows, is_new, skipped = SetService._merge_existing(chunk, mode)
+                # the foreign keys are checked on commit, the locked themes can't be deleted meanwhile
+                theme_ids = set(Theme.objects.select_for_update().filter(pk__in=rows["theme_id"].unique().tolist())
+                                .values_list("pk", flat=True))
+                written = rows["theme_id"].isin(theme_ids)
+
+                for i, set_object in zip(rows.index[written], SetService._import_sets(rows[written])):
+                    try:
+                        with transaction.atomic():
+                            SetService._write([set_object], mode)
+                    except (IntegrityError, DataError):
+                        written.loc[i] = False
+
+                SetService._import_applied(rows[written], is_new[written])
+
+            report.fail(rows["row"][~written], "Set already exists or Theme provided doesn't exist")
+            is_new = is_new[written]
+
+        report.skipped += skipped
+        report.inserted += int(is_new.sum())
+        report.updated += int((~is_new).sum())
+
+    @staticmethod
+    def _merge_existing(chunk: pd.DataFrame, mode: str) -> tuple[pd.DataFrame, pd.Series, int]:
+        """ The rows to write, whether each is new and the number of rows skipped
+
+        The previous values of the existing sets are added as *_db columns, their rows stay locked until the
+        transaction ends.
+        """
+        existing = pd.DataFrame.from_records(
+            Set.objects.select_for_update().filter(num__in=chunk["set_num"].tolist())
+            .values_list("num", *SET_UPDATE_FIELDS),
+            columns=["set_num", *SET_UPDATE_FIELDS],
+        )
+        chunk = chunk.merge(existing, on="set_num", how="left", suffixes=("", "_db"), indicator="state")
+        is_new = chunk["state"] == "left_only"
+
+        if mode == UPSERT:
+            changed = pd.concat([chunk[field] != chunk[f"{field}_db"] for field in SET_UPDATE_FIELDS], axis=1)
+            skipped = ~is_new & ~changed.any(axis=1)
+        else:
+            skipped = ~is_new
+
+        return chunk[~skipped], is_new[~skipped], int(skipped.sum())
+
+    @staticmethod
+    def _import_sets(chunk: pd.DataFrame) -> list[Set]:
+        return [
+            Set(num=num, year=year, name=name, num_parts=num_parts, img_url=img_url, theme_id=theme_id)
+            for num, year, name, num_parts, img_url, theme_id in zip(
+                chunk["set_num"], chunk["year"], chunk["name"], chunk["num_parts"], chunk["img_url"],
+                chunk["theme_id"],
             )
-            for row in df.itertuples()
         ]
 
-        try:
-            Set.objects.bulk_create(sets)
-        except IntegrityError:
-            return ResponseBadRequest("Set already exists or Theme provided doesn't exist")
+    @staticmethod
+    def _import_applied(chunk: pd.DataFrame, is_new: pd.Series) -> None:
+        """ Stats changes and change log entries of the written rows """
+        SetService._import_stats_changes(chunk, is_new).apply()
+        ChangeService.record_queryset(Change.Kind.SET, Change.Action.UPSERT,
+                                      Set.objects.filter(num__in=chunk["set_num"].tolist()))
 
-        return Response()
+    @staticmethod
+    def _import_stats_changes(chunk: pd.DataFrame, is_new: pd.Series) -> StatsChanges:
+        """ The written rows, counted by theme and year, minus the previous values of the updated ones """
+        changes = StatsChanges()
+        added = chunk.groupby(["theme_id", "year"])["num_parts"].agg(["count", "sum"])
+        removed = chunk[~is_new].groupby(["theme_id_db", "year_db"])["num_parts_db"].agg(["count", "sum"])
+
+        for (theme_id, year), sets, parts in added.itertuples():
+            changes.add(theme_id, year, sets, parts)
+
+        for (theme_id, year), sets, parts in removed.itertuples():
+            changes.add(theme_id, year, -sets, -parts)
+
+        return changes
 
     @staticmethod
-    def get_paginated(request: Request) -> Response:
+    def _write(sets: list[Set], mode: str) -> None:
+        if mode == UPSERT:
+            Set.objects.bulk_create(
+                sets,
+                batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=["num"],
+                update_fields=[*SET_UPDATE_FIELDS, "updated_at"],
+            )
+        else:
+            Set.objects.bulk_create(sets, batch_size=settings.BULK_IMPORT_BATCH_SIZE)
+
+    @staticmethod
+    def get_paginated(request: Request, theme_id: Optional[int] = None) -> Response:
+        """ Page of the sets, of the subtree of the theme when theme_id is given """
+        # read once on a miss, by the validators then the page
+        subtree_path = lru_cache(maxsize=None)(lambda: SetService._subtree_path(theme_id))
+
+        return CatalogCache.read(
+            SET_LISTS,
+            CatalogCache.request_key(request),
+            lambda: SetService._get_paginated(request, subtree_path()),
+            lambda: SetService._get_paginated_validators(request, subtree_path()),
+        )
+
+    @staticmethod
+    def _get_paginated_validators(request: Request, subtree_path: Optional[str]) -> Validators:
+        filters = SetFilterSerializer(data=request.query_params)
+
+        if not filters.is_valid():
+            return None, None
+
+        ordering_fields = [field.lstrip("-") for field in SET_ORDERINGS[filters.validated_data["ordering"]]]
+        paginator, sets_page = SetService._paginate(
+            request,
+            filters.validated_data,
+            subtree_path,
+            lambda sets: sets.values("id", "updated_at", *ordering_fields),
+        )
+        versions = [(row["id"], row["updated_at"]) for row in sets_page]
+
+        if isinstance(paginator, KeysetPagination):
+            return versions_validators(request, versions, paginator.next_cursor, paginator.count)
+
+        return versions_validators(request, versions)
+
+    @staticmethod
+    def _subtree_path(theme_id: Optional[int]) -> Optional[str]:
+        """ Path of an existing theme, NotFound otherwise """
+        if theme_id is None:
+            return None
+
+        path = Theme.objects.filter(pk=theme_id).values_list("path", flat=True).first()
+
+        if path is None:
+            raise NotFound("No Theme matches the given query.")
+
+        return path
+
+    @staticmethod
+    def _get_paginated(request: Request, subtree_path: Optional[str]) -> Response:
+        filters = SetFilterSerializer(data=request.query_params)
+
+        if not filters.is_valid():
+            return ResponseBadRequest(filters.errors)
+
+        paginator, sets_page = SetService._paginate(request, filters.validated_data, subtree_path, SET_ROWS.values)
+        data = SET_ROWS.to_representation(sets_page)
+
+        if isinstance(paginator, KeysetPagination):
+            return paginator.get_paginated_response(data)
+
+        return Response(data)
+
+    @staticmethod
+    async def aget_paginated(request: Request, subtree_path: Optional[str] = None) -> Response:
+        return await CatalogCache.aread(
+            SET_LISTS,
+            CatalogCache.request_key(request),
+            lambda: SetService._aget_paginated(request, subtree_path),
+        )
+
+    @staticmethod
+    async def _aget_paginated(request: Request, subtree_path: Optional[str]) -> Response:
+        filters = SetFilterSerializer(data=request.query_params)
+
+        if not filters.is_valid():
+            return ResponseBadRequest(filters.errors)
+
+        paginator, sets = SetService._page_query(filters.validated_data, subtree_path, SET_ROWS.values)
+        data = SET_ROWS.to_representation(await paginator.apaginate_queryset(sets, request) or [])
+
+        if isinstance(paginator, KeysetPagination):
+            return paginator.get_paginated_response(data)
+
+        return Response(data)
+
+    @staticmethod
+    def _paginate(
+            request: Request,
+            filters: dict[str, Any],
+            subtree_path: Optional[str],
+            values: Callable[[QuerySet[Set]], QuerySet[Any]],
+    ) -> tuple[BasePagination, list[dict[str, Any]]]:
+        """ Page of sets as the rows returned by values, which must contain the ordering fields """
+        paginator, sets = SetService._page_query(filters, subtree_path, values)
+
+        return paginator, paginator.paginate_queryset(sets, request) or []
+
+    @staticmethod
+    def _page_query(
+            filters: dict[str, Any],
+            subtree_path: Optional[str],
+            values: Callable[[QuerySet[Set]], QuerySet[Any]],
+    ) -> tuple[Union[KeysetPagination, UncountedLimitOffsetPagination], QuerySet[Any]]:
+        """ Paginator and query of the sets, shared by the sync and the async list endpoints """
+        sets = SetService.filter(filters)
+
+        if subtree_path is not None:
+            sets = sets.filter(theme__path__startswith=subtree_path)
+
+        ordering = SET_ORDERINGS[filters["ordering"]]
+
+        if filters["pagination"] == "cursor":
+            return KeysetPagination(ordering), values(sets)
+
+        return UncountedLimitOffsetPagination(), values(sets.order_by(*ordering))
+
+    @staticmethod
+    def filter(filters: dict[str, Any]) -> QuerySet[Set]:
         sets = Set.objects.all()
-        paginator = LimitOffsetPagination()
-        result_page = paginator.paginate_queryset(sets, request)
 
-        serializer = SetSerializer(result_page, many=True)
+        if "theme_id" in filters:
+            sets = sets.filter(theme_id=filters["theme_id"])
+        if "year_min" in filters:
+            sets = sets.filter(year__gte=filters["year_min"])
+        if "year_max" in filters:
+            sets = sets.filter(year__lte=filters["year_max"])
+        if "num_parts_min" in filters:
+            sets = sets.filter(num_parts__gte=filters["num_parts_min"])
+        if "num_parts_max" in filters:
+            sets = sets.filter(num_parts__lte=filters["num_parts_max"])
+        if "search" in filters:
+            # backed by trigram indexes on postgres (migration 0005)
+            sets = sets.filter(Q(name__icontains=filters["search"]) | Q(num__icontains=filters["search"]))
 
-        return Response(serializer.data)
+        return sets
 
     @staticmethod
     def create(set_object: Set) -> Response:
+        changes = StatsChanges()
+        changes.add_set(set_object.theme_id, set_object.year, set_object.num_parts)
+
         try:
-            set_object.save()
+            with transaction.atomic():
+                set_object.save()
+                changes.apply()
+                ChangeService.record(Change.Kind.SET, Change.Action.UPSERT, [set_object.pk])
         except IntegrityError:
             return ResponseBadRequest("Theme doesn't exist or Num is already in the db")
 
+        CatalogCache.invalidate(SET_LISTS)
+
         return Response(SetSerializer(set_object).data)
 
     @staticmethod
     def get(pk: int) -> Response:
+        return CatalogCache.read(SET_DETAILS, str(pk), lambda: SetService._get(pk), lambda: SetService._validators(pk))
+
+    @staticmethod
+    def _validators(pk: int) -> Validators:
+        return version_validators("set", pk, Set.objects.filter(pk=pk).values_list("updated_at", flat=True).first())
+
+    @staticmethod
+    def _get(pk: int) -> Response:
         set_object = get_object_or_404(Set, pk=pk)
 
         serializer = SetSerializer(set_object)
 
         return Response(serializer.data)
 
+    @staticmethod
+    async def aget(pk: int) -> Response:
+        return await CatalogCache.aread(SET_DETAILS, str(pk), lambda: SetService._aget(pk))
+
+    @staticmethod
+    async def _aget(pk: int) -> Response:
+        row = await SET_ROWS.values(Set.objects.filter(pk=pk)).afirst()
+
+        if row is None:
+            raise NotFound("No Set matches the given query.")
+
+        return Response(SET_ROWS.to_representation([row])[0])
+
     @staticmethod
     def delete(pk: int) -> Response:
-        set_object = get_object_or_404(Set, pk=pk)
+        with transaction.atomic():
+            # locked, a concurrent delete waits then gets a 404 instead of removing the set from the stats again
+            set_object = get_object_or_404(Set.objects.select_for_update(), pk=pk)
+            changes = StatsChanges()
+            changes.add_set(set_object.theme_id, set_object.year, set_object.num_parts, -1)
 
-        set_object.delete()
+            set_object.delete()
+            changes.apply()
+            ChangeService.record(Change.Kind.SET, Change.Action.DELETE, [pk])
+
+        CatalogCache.delete(SET_DETAILS, str(pk))
+        CatalogCache.invalidate(SET_LISTS)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @staticmethod
     def update(request: Request, pk: int) -> Response:
-        set_object = get_object_or_404(Set, pk=pk)
+        try:
+            with transaction.atomic():
+                # locked, the values removed from the stats are the ones being replaced
+                set_object = get_object_or_404(Set.objects.select_for_update(), pk=pk)
+                changes = StatsChanges()
+                changes.add_set(set_object.theme_id, set_object.year, set_object.num_parts, -1)
 
-        serializer = UpdateSetSerializer(set_object, data=request.data)
+                serializer = UpdateSetSerializer(set_object, data=request.data)
 
-        if not serializer.is_valid():
-            return ResponseBadRequest(serializer.errors)
+                if not serializer.is_valid():
+                    return ResponseBadRequest(serializer.errors)
 
-        set_object = serializer.save()
+                set_object = serializer.save()
+                changes.add_set(set_object.theme_id, set_object.year, set_object.num_parts)
 
-        try:
-            set_object.save()
+                set_object.save()
+                changes.apply()
+                ChangeService.record(Change.Kind.SET, Change.Action.UPSERT, [pk])
         except IntegrityError:
             return ResponseBadRequest("Theme doesn't exist or num is already in the db")
 
-        return Response(SetSerializer(set_object).data)
\ No newline at end of file
+        CatalogCache.delete(SET_DETAILS, str(pk))
+        CatalogCache.invalidate(SET_LISTS)
+
+        return Response(SetSerializer(set_object).data)
+
+    @staticmethod
+    def _update_stats_changes(
+            updated: list[tuple[int, Set]],
+            previous: dict[int, tuple[int, int, int]],
+    ) -> StatsChanges:
+        changes = StatsChanges()
+
+        for _, set_object in updated:
+            changes.add_set(*previous[set_object.pk], sign=-1)
+            changes.add_set(set_object.theme_id, set_object.year, set_object.num_parts)
+
+        return changes
+
+    @staticmethod
+    def get_batch(ids: list[int], nums: list[str]) -> Response:
+        """ Sets matching the ids or the nums in a single query, the ones not found are listed apart """
+        rows = list(SET_ROWS.values(Set.objects.filter(Q(pk__in=ids) | Q(num__in=nums)).order_by("id")))
+        found_ids = {row["id"] for row in rows}
+        found_nums = {row["num"] for row in rows}
+
+        return Response({
+            "results": SET_ROWS.to_representation(rows),
+            "not_found": {
+                "ids": [pk for pk in ids if pk not in found_ids],
+                "nums": [num for num in nums if num not in found_nums],
+            },
+        })
+
+    @staticmethod
+    def update_batch(items: list[dict[str, Any]]) -> Response:
+        """ Apply partial updates to many sets with one bulk update, every item gets its own result
+
+        The sets, the themes and the nums are checked with one query each, an item failing validation doesn't
+        prevent the others from being written.
+        """
+        results: list[Optional[dict[str, Any]]] = [None] * len(items)
+        changes: dict[int, tuple[int, dict[str, Any]]] = {}
+
+        for i, item in enumerate(items):
+            serializer = BatchUpdateSetSerializer(data=item)
+
+            if not serializer.is_valid():
+                results[i] = item_result(item.get("id"), status.HTTP_400_BAD_REQUEST, serializer.errors)
+                continue
+
+            data = dict(serializer.validated_data)
+            pk = data.pop("id")
+
+            if pk in changes:
+                results[i] = item_result(pk, status.HTTP_400_BAD_REQUEST, "Set is more than once in the batch")
+                continue
+
+            changes[pk] = (i, data)
+
+        with transaction.atomic():
+            updated = SetService._update_batch(changes, results)
+
+        for i, set_object in updated:
+            results[i] = item_result(set_object.pk, status.HTTP_200_OK, SetSerializer(set_object).data)
+
+        if updated:
+            CatalogCache.delete(SET_DETAILS, *[str(set_object.pk) for _, set_object in updated])
+            CatalogCache.invalidate(SET_LISTS)
+
+        return Response({"results": results})
+
+    @staticmethod
+    def _update_batch(
+            changes: dict[int, tuple[int, dict[str, Any]]],
+            results: list[Optional[dict[str, Any]]],
+    ) -> list[tuple[int, Set]]:
+        """ Write the changes of update_batch in its transaction, returns the updated sets with their item index """
+        # locked, the values removed from the stats are the ones being replaced
+        sets = Set.objects.select_for_update().in_bulk(list(changes))
+        # counted values before the update, for the theme stats
+        previous = {pk: (set_object.theme_id, set_object.year, set_object.num_parts) for pk, set_object in sets.items()}
+        theme_ids = {data["theme_id"] for _, data in changes.values() if "theme_id" in data}
+        themes = set(Theme.objects.filter(pk__in=theme_ids).values_list("pk", flat=True))
+        nums = {data["num"] for _, data in changes.values() if "num" in data}
+        nums_taken = dict(Set.objects.filter(num__in=nums).values_list("num", "pk"))
+        nums_claimed: set[str] = set()
+        now = timezone.now()
+        updated = []
+
+        for pk, (i, data) in changes.items():
+            if pk not in sets:
+                results[i] = item_result(pk, status.HTTP_404_NOT_FOUND, "Set doesn't exist")
+                continue
+
+            if "theme_id" in data and data["theme_id"] not in themes:
+                results[i] = item_result(pk, status.HTTP_400_BAD_REQUEST, "Theme doesn't exist")
+                continue
+
+            num = data.get("num")
+
+            if num is not None and (nums_taken.get(num, pk) != pk or num in nums_claimed):
+                results[i] = item_result(pk, status.HTTP_400_BAD_REQUEST, "Num is already in the db")
+                continue
+
+            if num is not None:
+                nums_claimed.add(num)
+
+            set_object = UpdateSetSerializer().update(sets[pk], data)
+            set_object.updated_at = now
+            updated.append((i, set_object))
+
+        try:
+            with transaction.atomic():
+                Set.objects.bulk_update(
+                    [set_object for _, set_object in updated],
+                    ["num", *SET_UPDATE_FIELDS, "updated_at"],
+                    batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+                )
+                SetService._update_stats_changes(updated, previous).apply()
+                ChangeService.record(Change.Kind.SET, Change.Action.UPSERT,
+                                     [set_object.pk for _, set_object in updated])
+        except (IntegrityError, DataError):
+            # e.g. nums swapped between sets of the batch, write one by one to isolate the failing ones
+            written = []
+
+            for i, set_object in updated:
+                try:
+                    with transaction.atomic():
+                        set_object.save()
+                except (IntegrityError, DataError):
+                    results[i] = item_result(set_object.pk, status.HTTP_400_BAD_REQUEST,
+                                             "Theme doesn't exist or num is already in the db")
+                    continue
+
+                written.append((i, set_object))
+
+            updated = written
+            SetService._update_stats_changes(updated, previous).apply()
+            ChangeService.record(Change.Kind.SET, Change.Action.UPSERT, [set_object.pk for _, set_object in updated])
+
+        return updated
+
+    @staticmethod
+    def delete_batch(ids: list[int]) -> Response:
+        with transaction.atomic():
+            # locked, a concurrent delete of the same sets waits then doesn't find them
+            found = {
+                pk: (theme_id, year, num_parts)
+                for pk, theme_id, year, num_parts in Set.objects.select_for_update().filter(pk__in=ids)
+                .values_list("pk", "theme_id", "year", "num_parts")
+            }
+
+            if found:
+                changes = StatsChanges()
+
+                for theme_id, year, num_parts in found.values():
+                    changes.add_set(theme_id, year, num_parts, -1)
+
+                Set.objects.filter(pk__in=list(found)).delete()
+                changes.apply()
+                ChangeService.record(Change.Kind.SET, Change.Action.DELETE, found)
+
+        if found:
+            CatalogCache.delete(SET_DETAILS, *[str(pk) for pk in found])
+            CatalogCache.invalidate(SET_LISTS)
+
+        return Response({
+            "results": [
+                item_result(pk, status.HTTP_204_NO_CONTENT) if pk in found
+                else item_result(pk, status.HTTP_404_NOT_FOUND, "Set doesn't exist")
+                for pk in ids
+            ],
+        })
+
+    @staticmethod
+    def export(file_format: str) -> StreamingHttpResponse:
+        # same layout as the import file
+        rows = Set.objects.order_by("id").values_list("num", "year", "name", "theme_id", "num_parts", "img_url")
+
+        return stream_export(
+            "sets",
+            FileUploadSerializer.columns,
+            rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE),
+            file_format,
+        )
@@ -0,0 +1,185 @@
+import base64
+import io
+import json
+from unittest import mock
+
+import msgpack
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from set.models import Set
+from set.serializers import FileUploadSerializer
+from set.services import SetService
+from utils.imports import ColumnValidator, UPSERT
+from utils.renderers import MSGPACK, table_hook
+from utils.testing import APITestCase
+
+
+class SetTests(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.city = self.create_theme("city")
+        self.police = self.create_theme("police", self.city)
+
+    def test_get_update_delete(self) -> None:
+        pk = self.create_set("1-1", self.police, 2001, 100)
+
+        self.assertEqual(self.api.get(f"/api/sets/{pk}").json()["num"], "1-1")
+        response = self.api.patch(f"/api/sets/{pk}", {
+            "num": "1-1", "name": "renamed", "year": 2002, "num_parts": 50, "img_url": "https://lego.com/set.png",
+            "theme_id": self.city,
+        }, format="json")
+        self.assertEqual(response.json()["name"], "renamed")
+        self.assertStatsRebuilt()
+        self.assertEqual(self.api.patch(f"/api/sets/{pk}", {"theme_id": 0}, format="json").status_code, 400)
+
+        self.assertEqual(self.api.delete(f"/api/sets/{pk}").status_code, 204)
+        self.assertEqual(self.api.delete(f"/api/sets/{pk}").status_code, 404)
+        self.assertFalse(Set.objects.exists())
+        self.assertStatsRebuilt()
+
+    def test_list(self) -> None:
+        ids = [self.create_set(f"{i}-1", self.police, 2000 + i) for i in range(5)]
+
+        self.assertEqual([row["id"] for row in self.api.get("/api/sets/", {"limit": 2, "offset": 1}).json()],
+                         ids[1:3])
+        self.assertEqual([row["id"] for row in self.api.get("/api/sets/", {"limit": 10, "year_min": 2003}).json()],
+                         ids[3:])
+
+        page = self.api.get("/api/sets/", {"limit": 3, "pagination": "cursor", "count": "true"}).json()
+        self.assertEqual(([row["id"] for row in page["results"]], page["count"]), (ids[:3], 5))
+        page = self.api.get(page["next"]).json()
+        self.assertEqual([row["id"] for row in page["results"]], ids[3:])
+
+        self.assertEqual([row["id"] for row in self.api.get(f"/api/themes/{self.city}/sets", {"limit": 10}).json()],
+                         ids)
+
+    def test_invalid_cursors(self) -> None:
+        ids = [self.create_set(f"{i}-1", self.police, 2000 + i) for i in range(3)]
+        params = {"limit": 2, "pagination": "cursor", "ordering": "-year"}
+        page = self.api.get("/api/sets/", params).json()
+
+        self.assertEqual([row["id"] for row in self.api.get(page["next"]).json()["results"]], ids[:1])
+
+        for values in (["abc", "x"], [None, 1], [2000, 2 ** 70], [2000]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.api.get("/api/sets/", {**params, "cursor": cursor}).status_code, 404)
+
+    def test_not_modified(self) -> None:
+        pk = self.create_set("1-1", self.police)
+        etag = self.api.get(f"/api/sets/{pk}").headers["ETag"]
+
+        self.assertEqual(self.api.get(f"/api/sets/{pk}", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # another representation
+        self.assertEqual(self.api.get(f"/api/sets/{pk}", HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT=MSGPACK).status_code,
+                         200)
+
+        self.api.patch(f"/api/sets/{pk}", {
+            "num": "1-1", "name": "renamed", "year": 2000, "num_parts": 10, "img_url": "https://lego.com/set.png",
+            "theme_id": self.police,
+        }, format="json")
+
+        self.assertEqual(self.api.get(f"/api/sets/{pk}", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cached_responses_read_no_rows(self) -> None:
+        pk = self.create_set("1-1", self.police)
+        paths = [f"/api/sets/{pk}", "/api/sets/?limit=10&offset=1000", f"/api/themes/{self.city}/sets?limit=10"]
+        etags = [self.api.get(path).headers["ETag"] for path in paths]
+
+        with CaptureQueriesContext(connection) as queries:
+            for path, etag in zip(paths, etags):
+                self.assertEqual(self.api.get(path).status_code, 200)
+                self.assertEqual(self.api.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.assertEqual(len(queries), 0)
+
+    def test_batch(self) -> None:
+        ids = [self.create_set(f"{i}-1", self.police) for i in range(3)]
+
+        response = self.api.post("/api/sets/batch", {"ids": [ids[0], 0], "nums": ["1-1"]}, format="json").json()
+        self.assertEqual(sorted(row["id"] for row in response["results"]), ids[:2])
+
+        response = self.api.patch("/api/sets/batch", {"items": [
+            {"id": ids[0], "num_parts": 20, "theme_id": self.city},
+            {"id": ids[1], "num": "9-1"},
+            {"id": ids[2], "num": "0-1"},
+            {"id": 0, "name": "missing"},
+        ]}, format="json").json()
+        self.assertEqual([result["status"] for result in response["results"]], [200, 200, 400, 404])
+        self.assertEqual(Set.objects.get(pk=ids[1]).num, "9-1")
+        self.assertStatsRebuilt()
+
+        response = self.api.delete("/api/sets/batch", {"ids": [ids[0], 0]}, format="json").json()
+        self.assertEqual([result["status"] for result in response["results"]], [204, 404])
+        self.assertStatsRebuilt()
+
+    def test_batch_queries_dont_grow_with_the_batch(self) -> None:
+        ids = [self.create_set(f"{i}-1", self.police) for i in range(6)]
+        counts = []
+
+        for batch in (ids[:1], ids[1:]):
+            with CaptureQueriesContext(connection) as queries:
+                self.api.patch("/api/sets/batch", {"items": [{"id": pk, "num_parts": 5, "theme_id": self.city}
+                                                             for pk in batch]}, format="json")
+                self.api.delete("/api/sets/batch", {"ids": batch}, format="json")
+
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(Set.objects.exists())
+        self.assertStatsRebuilt()
+
+    def test_import(self) -> None:
+        self.create_set("1-1", self.police)
+        file = (
+            "set_num,year,name,theme_id,num_parts,img_url\n"
+            f"1-1,2005,updated,{self.city},7,https://lego.com/set.png\n"
+            f"2-1,2006,new,{self.police},8,https://lego.com/set.png\n"
+            f"3-1,2006,no theme,0,8,https://lego.com/set.png\n"
+        ).encode()
+
+        report = SetService.bulk_import(FileUploadSerializer.read(io.BytesIO(file)), UPSERT)
+
+        self.assertEqual((report.inserted, report.updated, report.failed), (1, 1, 1))
+        self.assertEqual(Set.objects.get(num="1-1").theme_id, self.city)
+        self.assertStatsRebuilt()
+
+    def test_import_row_rejected_by_the_db(self) -> None:
+        self.create_set("1-1", self.police)
+        file = (
+            "set_num,year,name,theme_id,num_parts,img_url\n"
+            f"1-1,2005,updated,{self.city},7,https://lego.com/set.png\n"
+            f"2-1,2006,new,{self.police},8,https://lego.com/set.png\n"
+            f"3-1,2006,theme deleted after the checks,1000,8,https://lego.com/set.png\n"
+        ).encode()
+
+        with mock.patch.object(ColumnValidator, "exists"):
+            report = SetService.bulk_import(FileUploadSerializer.read(io.BytesIO(file)), UPSERT)
+
+        self.assertEqual((report.inserted, report.updated, report.failed), (1, 1, 1))
+        self.assertEqual(report.errors[0]["row"], 4)
+        self.assertStatsRebuilt()
+
+    def test_export(self) -> None:
+        self.create_set("1-1", self.police, 2001, 100)
+        self.create_set("2-1", self.city, 2002, 200)
+        rows = [["1-1", 2001, "set 1-1", self.police, 100, "https://lego.com/set.png"],
+                ["2-1", 2002, "set 2-1", self.city, 200, "https://lego.com/set.png"]]
+
+        # the queries of the streams count in the budget of the view
+        csv = self.api.get("/api/sets/export/csv").getvalue().decode().splitlines()
+        self.assertEqual(csv[0], ",".join(FileUploadSerializer.columns))
+        self.assertEqual(csv[1:], [",".join(str(value) for value in row) for row in rows])
+
+        unpacker = msgpack.Unpacker(ext_hook=table_hook)
+        unpacker.feed(self.api.get("/api/sets/export/msgpack").getvalue())
+        exported = [row for table in unpacker for row in table]
+        self.assertEqual([[row[column] for column in FileUploadSerializer.columns] for row in exported], rows)
+
+        self.assertEqual(self.api.get("/api/sets/export/xml").status_code, 404)
+
+    def test_async_endpoints(self) -> None:
+        pk = self.create_set("1-1", self.police)
+
+        self.assertEqual(self.get_async(f"/api/async/sets/{pk}"), self.api.get(f"/api/sets/{pk}").json())
+        self.assertEqual(self.get_async("/api/async/sets/", limit=10), self.api.get("/api/sets/", {"limit": 10}).json())
@@ -4,6 +4,13 @@ from set import views
 
 urlpatterns = [
     path("bulk/", views.bulk_import),
+    path("export/<str:file_format>", views.export),
+    path("batch", views.SetBatchView.as_view()),
     path('', views.SetListView.as_view()),
     path('<int:pk>', views.SetDetailView.as_view())
-]
\ No newline at end of file
+]
+
+async_urlpatterns = [
+    path('', views.list_async),
+    path('<int:pk>', views.detail_async),
+]
@@ -1,6 +1,7 @@
+from django.http import HttpResponseBase
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from rest_framework import status, serializers
+from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes, permission_classes
 from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated, AND, IsAdminUser
@@ -8,31 +9,55 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from utils.responses import ResponseBadRequest
-from .serializers import SetSerializer, CreateSetSerializer, UpdateSetSerializer, FileUploadSerializer
+from job.serializers import ImportJobSerializer
+from job.services import ImportJobService
+from utils.asynchronous import async_api_view
+from utils.batch import BatchIdsSerializer, BatchUpdateSerializer
+from utils.conditional import conditional
+from utils.export import EXPORT_FORMATS
+from utils.query_budget import query_budget
+from utils.responses import ResponseBadRequest, ResponseNotFound
+from .serializers import SetSerializer, CreateSetSerializer, UpdateSetSerializer, FileUploadSerializer, \
+    SetFilterSerializer, BatchGetSetSerializer
 from .services import SetService
 
 
 @extend_schema(
     request=FileUploadSerializer,
-    responses={status.HTTP_200_OK: None},
-    summary="Bulk import"
+    responses={status.HTTP_202_ACCEPTED: ImportJobSerializer},
+    summary="Bulk import, the file is processed by the import workers"
 )
 @api_view(['POST'])
 @parser_classes([MultiPartParser])
 @permission_classes([IsAuthenticated, IsAdminUser])
+@query_budget(1)
 def bulk_import(request: Request) -> Response:
     serializer = FileUploadSerializer(data=request.data)
 
     if not serializer.is_valid():
         return ResponseBadRequest(serializer.errors)
 
-    try:
-        df = serializer.save()
-    except serializers.ValidationError as e:
-        return ResponseBadRequest(e.detail)
+    job = serializer.save()
 
-    return SetService.bulk_import(df)
+    return ImportJobService.enqueue(job)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(name="file_format", location=OpenApiParameter.PATH, type=OpenApiTypes.STR,
+                         enum=list(EXPORT_FORMATS)),
+    ],
+    responses={status.HTTP_200_OK: OpenApiTypes.BINARY},
+    summary="Export all sets in the import file layout"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@query_budget(1)
+def export(request: Request, file_format: str) -> HttpResponseBase:
+    if file_format not in EXPORT_FORMATS:
+        return ResponseNotFound("Format must be one of " + ", ".join(EXPORT_FORMATS))
+
+    return SetService.export(file_format)
 
 
 class SetListView(APIView):
@@ -41,13 +66,20 @@ class SetListView(APIView):
     @staticmethod
     @extend_schema(
         parameters=[
+            SetFilterSerializer,
             OpenApiParameter(name="limit", location=OpenApiParameter.QUERY, type=OpenApiTypes.INT, default=10),
             OpenApiParameter(name="offset", location=OpenApiParameter.QUERY, type=OpenApiTypes.INT, default=0),
+            OpenApiParameter(name="cursor", location=OpenApiParameter.QUERY, type=OpenApiTypes.STR,
+                             description="Cursor of the next page, cursor pagination only"),
+            OpenApiParameter(name="count", location=OpenApiParameter.QUERY, type=OpenApiTypes.BOOL, default=False,
+                             description="Include the total count, cursor pagination only"),
         ],
         responses={status.HTTP_202_ACCEPTED: SetSerializer},
         operation_id="getPaginatedSets",
         summary="Get paginated sets"
     )
+    @query_budget(4)
+    @conditional
     def get(request: Request) -> Response:
         return SetService.get_paginated(request)
 
@@ -57,6 +89,7 @@ class SetListView(APIView):
         responses={status.HTTP_201_CREATED: SetSerializer},
         summary="Create a set"
     )
+    @query_budget(5)
     def post(request: Request) -> Response:
         serializer = CreateSetSerializer(data=request.data)
 
@@ -77,6 +110,8 @@ class SetDetailView(APIView):
         operation_id="getSetById",
         summary="Get a set"
     )
+    @query_budget(2)
+    @conditional
     def get(request: Request, pk: int) -> Response:
         return SetService.get(pk)
 
@@ -85,6 +120,7 @@ class SetDetailView(APIView):
         responses={status.HTTP_204_NO_CONTENT: None},
         summary="Delete a set"
     )
+    @query_budget(6)
     def delete(request: Request, pk: int) -> Response:
         return SetService.delete(pk)
 
@@ -94,5 +130,70 @@ class SetDetailView(APIView):
         responses={status.HTTP_202_ACCEPTED: SetSerializer},
         summary="Update a set"
     )
+    @query_budget(6)
     def patch(request: Request, pk: int) -> Response:
         return SetService.update(request, pk)
+
+
+class SetBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    @extend_schema(
+        request=BatchGetSetSerializer,
+        responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+        operation_id="getSetsByIds",
+        summary="Get many sets by id or num, POST since the lists don't fit in a url"
+    )
+    @query_budget(1)
+    def post(request: Request) -> Response:
+        serializer = BatchGetSetSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return ResponseBadRequest(serializer.errors)
+
+        return SetService.get_batch(serializer.validated_data["ids"], serializer.validated_data["nums"])
+
+    @staticmethod
+    @extend_schema(
+        request=BatchUpdateSerializer,
+        responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+        summary="Update many sets, items are partial sets with their id and each one gets its own result"
+    )
+    @query_budget(10)
+    def patch(request: Request) -> Response:
+        serializer = BatchUpdateSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return ResponseBadRequest(serializer.errors)
+
+        return SetService.update_batch(serializer.validated_data["items"])
+
+    @staticmethod
+    @extend_schema(
+        request=BatchIdsSerializer,
+        responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+        summary="Delete many sets, each id gets its own result"
+    )
+    @query_budget(6)
+    def delete(request: Request) -> Response:
+        serializer = BatchIdsSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return ResponseBadRequest(serializer.errors)
+
+        return SetService.delete_batch(serializer.validated_data["ids"])
+
+
+# async read endpoints mounted under /api/async/, for ASGI deployments
+
+@async_api_view
+@query_budget(2)
+async def list_async(request: Request) -> Response:
+    return await SetService.aget_paginated(request)
+
+
+@async_api_view
+@query_budget(1)
+async def detail_async(request: Request, pk: int) -> Response:
+    return await SetService.aget(pk)
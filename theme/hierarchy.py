@@ -0,0 +1,88 @@
+from typing import Optional
+
+
+def sort_parents_first(
+        ids: list[int],
+        parent_ids: list[Optional[int]],
+        existing_ids: set[int],
+) -> tuple[list[int], list[int], list[int]]:
+    """ Order themes so that every parent comes before its children, in a single pass over the rows
+
+    A parent can either be a row of the file or a theme already in the database (existing_ids).
+    Returns the positions of the rows in insertion order, the positions of the rows that have a missing
+    ancestor and the positions of the rows that are part of (or below) a cycle.
+    """
+    position = {theme_id: i for i, theme_id in enumerate(ids)}
+    children: list[list[int]] = [[] for _ in ids]
+    roots = []
+    orphan_roots = []
+
+    for i, parent_id in enumerate(parent_ids):
+        if parent_id in position:
+            children[position[parent_id]].append(i)
+        elif parent_id is None or parent_id in existing_ids:
+            roots.append(i)
+        else:
+            orphan_roots.append(i)
+
+    order = _walk(roots, children)
+    orphans = _walk(orphan_roots, children)
+
+    reached = set(order).union(orphans)
+    cycles = [i for i in range(len(ids)) if i not in reached]
+
+    return order, orphans, cycles
+
+
+def anchor_parents(
+        ids: list[int],
+        parent_ids: list[Optional[int]],
+        parent_paths: dict[int, str],
+) -> list[Optional[int]]:
+    """ Parents of the rows, a parent that isn't a row is replaced by its nearest ancestor among the rows if any
+
+    Rows can move existing themes: a row put under an existing theme ends up below the rows that are ancestors
+    of that theme, with these parents sort_parents_first also finds the cycles going through existing themes.
+    parent_paths holds the paths of the parents that aren't part of the rows.
+    """
+    rows = set(ids)
+    anchored = []
+
+    for parent_id in parent_ids:
+        if parent_id is not None and parent_id not in rows and parent_id in parent_paths:
+            ancestor_ids = [int(pk) for pk in parent_paths[parent_id].split("/")[:-2]]
+            parent_id = next((pk for pk in reversed(ancestor_ids) if pk in rows), parent_id)
+
+        anchored.append(parent_id)
+
+    return anchored
+
+
+def _walk(starts: list[int], children: list[list[int]]) -> list[int]:
+    """ Breadth-first walk, the list grows while it is iterated """
+    order = list(starts)
+
+    for i in order:
+        order.extend(children[i])
+
+    return order
+
+
+def build_paths(
+        order: list[int],
+        ids: list[int],
+        parent_ids: list[Optional[int]],
+        parent_paths: dict[int, str],
+) -> dict[int, str]:
+    """ Materialized paths ("1/5/12/") of the rows, order must put parents first (see sort_parents_first)
+
+    parent_paths holds the paths of the parents that aren't part of the rows.
+    """
+    paths = dict(parent_paths)
+
+    for i in order:
+        parent_id = parent_ids[i]
+        parent_path = "" if parent_id is None else paths[parent_id]
+        paths[ids[i]] = f"{parent_path}{ids[i]}/"
+
+    return {theme_id: paths[theme_id] for theme_id in ids if theme_id in paths}
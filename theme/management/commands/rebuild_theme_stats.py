@@ -0,0 +1,14 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from theme import stats
+from theme.models import ThemeStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the theme stats from the sets, the services keep them up to date afterwards"
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        stats.rebuild()
+        self.stdout.write(f"{ThemeStats.objects.count()} theme stats rows rebuilt")
@@ -0,0 +1,38 @@
+from typing import Optional
+
+from django.db import migrations, models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+
+def fill_paths(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    Theme = apps.get_model('theme', 'Theme')
+    children: dict[Optional[int], list[int]] = {}
+
+    for pk, parent_id in Theme.objects.values_list('id', 'parent_id'):
+        children.setdefault(parent_id, []).append(pk)
+
+    paths = {}
+    parents = [(pk, '') for pk in children.get(None, [])]
+
+    for pk, parent_path in parents:
+        paths[pk] = f'{parent_path}{pk}/'
+        parents.extend((child, paths[pk]) for child in children.get(pk, []))
+
+    Theme.objects.bulk_update([Theme(id=pk, path=path) for pk, path in paths.items()], ['path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theme', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='theme',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
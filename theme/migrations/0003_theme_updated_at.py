@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theme', '0002_theme_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='theme',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
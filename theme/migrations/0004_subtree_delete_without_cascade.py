@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theme', '0003_theme_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='theme',
+            name='parent',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='theme.theme'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theme', '0004_subtree_delete_without_cascade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThemeStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('own_set_count', models.IntegerField(default=0)),
+                ('own_total_parts', models.BigIntegerField(default=0)),
+                ('set_count', models.IntegerField(default=0)),
+                ('total_parts', models.BigIntegerField(default=0)),
+                ('theme', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='theme.theme')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='themestats',
+            constraint=models.UniqueConstraint(fields=('theme', 'year'), name='theme_stats_theme_year'),
+        ),
+    ]
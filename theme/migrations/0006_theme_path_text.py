@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theme', '0005_theme_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='theme',
+            name='path',
+            field=models.TextField(db_index=True, default='', editable=False),
+        ),
+    ]
@@ -3,4 +3,25 @@ from django.db import models
 
 class Theme(models.Model):
     name = models.CharField(max_length=100)
-    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True)
\ No newline at end of file
+    # no cascade, ThemeService.delete_subtrees deletes a subtree and its sets with one statement per table
+    parent = models.ForeignKey("self", on_delete=models.DO_NOTHING, null=True)
+    # ids from the root down to this theme, e.g. "1/5/12/", kept in sync by ThemeService
+    path = models.TextField(db_index=True, default="", editable=False)
+    # row version used for the ETag and Last-Modified validators
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ThemeStats(models.Model):
+    """ Sets of a theme published in a year, alone and with its subtree, maintained by theme.stats """
+    theme = models.ForeignKey(Theme, on_delete=models.DO_NOTHING)
+    year = models.PositiveIntegerField()
+    own_set_count = models.IntegerField(default=0)
+    own_total_parts = models.BigIntegerField(default=0)
+    set_count = models.IntegerField(default=0)
+    total_parts = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # target of the upserts adding the changes
+            models.UniqueConstraint(fields=["theme", "year"], name="theme_stats_theme_year"),
+        ]
@@ -1,17 +1,33 @@
-from typing import Union
+from typing import IO, Any, Union
 import pandas as pd
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadedfile import UploadedFile
 from rest_framework import serializers
 
+from job.models import ImportJob
 from theme.models import Theme
+from utils.imports import IMPORT_MODES, INSERT, ColumnValidator, ImportReport
+from utils.serialization import OutputSerializer
 
 
-class ThemeSerializer(serializers.Serializer):
+class ThemeSerializer(OutputSerializer):
     name = serializers.CharField()
     parent_id = serializers.IntegerField()
     id = serializers.IntegerField()
 
 
+class StatsSerializer(serializers.Serializer):
+    set_count = serializers.IntegerField()
+    total_parts = serializers.IntegerField()
+    year_min = serializers.IntegerField(allow_null=True)
+    year_max = serializers.IntegerField(allow_null=True)
+    avg_parts = serializers.FloatField(allow_null=True)
+
+
+class ThemeStatsSerializer(OutputSerializer):
+    theme = StatsSerializer(help_text="Sets of the theme itself")
+    subtree = StatsSerializer(help_text="Sets of the theme and all its sub-themes")
+
+
 class CreateThemeSerializer(serializers.Serializer):
     name = serializers.CharField()
     parent_id = serializers.IntegerField(required=False, allow_null=True, default=None)
@@ -31,15 +47,51 @@ class UpdateThemeSerializer(serializers.Serializer):
         return instance
 
 
+class DeleteThemeSerializer(serializers.Serializer):
+    dry_run = serializers.BooleanField(default=False, help_text="Only count the themes and sets that would be deleted")
+
+
+class BatchUpdateThemeSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(required=False)
+    # unlike UpdateThemeSerializer, a missing parent_id keeps the parent
+    parent_id = serializers.IntegerField(required=False, allow_null=True)
+
+
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
+    mode = serializers.ChoiceField(choices=IMPORT_MODES, default=INSERT)
 
-    def create(self, validated_data: dict[str, InMemoryUploadedFile]) -> pd.DataFrame:
-        file = validated_data["file"]
+    columns = ["id", "name", "parent_id"]
 
-        df = pd.read_csv(file)
+    def validate_file(self, file: UploadedFile) -> UploadedFile:
+        try:
+            header = pd.read_csv(file, nrows=0).columns
+        except pd.errors.EmptyDataError:
+            raise serializers.ValidationError("File is empty")
 
-        if not {"id", "parent_id", "name"}.issubset(df.columns):
+        if not set(self.columns).issubset(header):
             raise serializers.ValidationError("Columns must contain id, parent_id and name")
 
-        return df
\ No newline at end of file
+        file.seek(0)
+
+        return file
+
+    def create(self, validated_data: dict[str, Any]) -> ImportJob:
+        return ImportJob(kind=ImportJob.Kind.THEME, mode=validated_data["mode"], file=validated_data["file"])
+
+    @staticmethod
+    def validate_rows(df: pd.DataFrame, report: ImportReport) -> pd.DataFrame:
+        """ Rows passing the column checks, with integer id and parent_id, parents are checked by the import """
+        validator = ColumnValidator(df, report)
+        validator.integer("id", 1)
+        validator.unique("id")
+        validator.text("name", Theme._meta.get_field("name"))
+        validator.integer("parent_id", 1, required=False)
+
+        return validator.valid_rows()
+
+    @staticmethod
+    def read(file: IO[bytes]) -> pd.DataFrame:
+        """ The whole validated file, the hierarchy is ordered on all the rows at once """
+        return pd.read_csv(file)
@@ -1,60 +1,260 @@
-import numpy as np
+from functools import reduce
+from operator import or_
+from typing import Any, Callable, Optional, Union
+
 import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, Q, QuerySet, Value, When
+from django.db.models.functions import Concat, Length, Substr
 from django.db.utils import IntegrityError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import BasePagination
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from theme.models import Theme
-from theme.serializers import ThemeSerializer, UpdateThemeSerializer
+from change.models import Change
+from change.services import ChangeService
+from set.models import Set
+from set.services import SetService
+from theme.hierarchy import anchor_parents, build_paths, sort_parents_first
+from theme import stats
+from theme.models import Theme, ThemeStats
+from theme.serializers import BatchUpdateThemeSerializer, FileUploadSerializer, ThemeSerializer, \
+    ThemeStatsSerializer, UpdateThemeSerializer
+from utils.batch import item_result
+from utils.cache import CatalogCache, SET_DETAILS, SET_LISTS, THEME_DETAILS, THEME_LISTS
+from utils.conditional import Validators, version_validators, versions_validators
+from utils.export import stream_export
+from utils.imports import ImportReport, INSERT, UPSERT
+from utils.pagination import KeysetPagination, UncountedLimitOffsetPagination
+from utils.serialization import FastListSerializer
 from utils.responses import ResponseBadRequest
 
+# list pages skip the DRF field machinery, the output is the one of ThemeSerializer
+THEME_ROWS = FastListSerializer(ThemeSerializer)
+
 
 class ThemeService:
     @staticmethod
-    def bulk_import(df: pd.DataFrame) -> Response:
-        df = df.replace(np.nan, None)
+    def bulk_import(
+            df: pd.DataFrame,
+            mode: str = INSERT,
+            progress: Optional[Callable[[ImportReport], None]] = None,
+    ) -> ImportReport:
+        """ Import the themes in a single transaction, raises IntegrityError if a parent is missing
 
-        df_themes_to_add = df[df["parent_id"].isna()]
-        themes = [Theme(id=row.id, name=row.name, parent_id=row.parent_id) for row in df_themes_to_add.itertuples()]
-        df = df.dropna()
-        df = df.astype({"id": int, "parent_id": int})
+        progress is called with the report once the rows are checked, then after each batch written.
+        """
+        report = ImportReport()
 
-        while df_themes_to_add.shape[0] > 0:
-            df_themes_to_add = df[df["parent_id"].isin(df_themes_to_add["id"])]
-            themes.extend([Theme(id=row.id, name=row.name, parent_id=row.parent_id) for row in
-                           df_themes_to_add.itertuples()])
+        # line number in the file, the header being line 1
+        df = FileUploadSerializer.validate_rows(df.assign(row=df.index + 2), report)
 
-        try:
-            Theme.objects.bulk_create(themes)
-        except IntegrityError:
-            return ResponseBadRequest("Theme already exists")
+        ids = df["id"].astype(int).tolist()
+        parent_ids = [None if pd.isna(parent_id) else int(parent_id) for parent_id in df["parent_id"]]
+        names = df["name"].astype(str).tolist()
+        rows = df["row"].tolist()
+
+        missing_parent_ids = set(parent_ids).difference(ids, [None])
+        existing_paths = dict(Theme.objects.filter(pk__in=missing_parent_ids).values_list("pk", "path"))
+        # an upsert can move an existing theme under one of its existing descendants
+        anchored_ids = anchor_parents(ids, parent_ids, existing_paths) if mode == UPSERT else parent_ids
+        order, orphans, cycles = sort_parents_first(ids, anchored_ids, set(existing_paths))
+        paths = build_paths(order, ids, parent_ids, existing_paths)
+
+        report.fail([rows[i] for i in orphans], "Parent theme doesn't exist")
+        report.fail([rows[i] for i in cycles], "Parent themes form a cycle")
+
+        if progress is not None:
+            progress(report)
+
+        themes = [Theme(id=ids[i], name=names[i], parent_id=parent_ids[i], path=paths[ids[i]]) for i in order]
+
+        with transaction.atomic():
+            moved = ThemeService._write(themes, mode, report, progress)
+
+            if moved:
+                ThemeService.rebuild_paths()
+                new_paths = dict(Theme.objects.filter(pk__in=list(moved)).values_list("pk", "path"))
+                stats.move_subtrees([(pk, old_path, new_paths[pk]) for pk, old_path in moved.items()])
 
-        return Response({"detail": "Successfully imported"})
+        if report.inserted or report.updated:
+            CatalogCache.invalidate(THEME_LISTS)
+        if report.updated:
+            CatalogCache.invalidate(THEME_DETAILS)
+        if moved:
+            CatalogCache.invalidate(SET_LISTS)
+
+        return report
+
+    @staticmethod
+    def _write(
+            themes: list[Theme],
+            mode: str,
+            report: ImportReport,
+            progress: Optional[Callable[[ImportReport], None]],
+    ) -> dict[int, str]:
+        """ Write the themes, returns the paths before the import of the existing themes moved to another parent """
+        moved = {}
+        existing = {
+            pk: (name, parent_id, path)
+            for pk, name, parent_id, path in Theme.objects.filter(pk__in=[theme.pk for theme in themes])
+            .values_list("id", "name", "parent_id", "path")
+        }
+        changed = []
+        new = []
+
+        for theme in themes:
+            current = existing.get(theme.pk)
+
+            if current is not None and (mode != UPSERT or current[:2] == (theme.name, theme.parent_id)):
+                report.skipped += 1
+                continue
+
+            if current is not None and current[1] != theme.parent_id:
+                moved[theme.pk] = current[2]
+
+            changed.append(theme)
+            new.append(current is None)
+
+        batch_size = settings.BULK_IMPORT_BATCH_SIZE
+
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start:start + batch_size]
+
+            if mode == UPSERT:
+                Theme.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=["name", "parent_id", "path", "updated_at"],
+                )
+            else:
+                Theme.objects.bulk_create(batch)
+
+            inserted = sum(new[start:start + batch_size])
+            report.inserted += inserted
+            report.updated += len(batch) - inserted
+
+            if progress is not None:
+                progress(report)
+
+        ChangeService.record(Change.Kind.THEME, Change.Action.UPSERT, [theme.pk for theme in changed])
+
+        return moved
+
+    @staticmethod
+    def rebuild_paths() -> None:
+        """ Recompute every materialized path, used when existing subtrees were moved by an import """
+        themes = list(Theme.objects.values_list("id", "parent_id", "path"))
+        ids = [theme_id for theme_id, _, _ in themes]
+        parent_ids: list[Optional[int]] = [parent_id for _, parent_id, _ in themes]
+
+        order, _, _ = sort_parents_first(ids, parent_ids, set())
+        paths = build_paths(order, ids, parent_ids, {})
+
+        moved = [Theme(id=theme_id, path=paths[theme_id]) for theme_id, _, path in themes
+                 if paths.get(theme_id, path) != path]
+
+        Theme.objects.bulk_update(moved, ["path"], batch_size=settings.BULK_IMPORT_BATCH_SIZE)
 
     @staticmethod
     def get_paginated(request: Request) -> Response:
-        themes = Theme.objects.all()
-        paginator = LimitOffsetPagination()
-        result_page = paginator.paginate_queryset(themes, request)
+        return CatalogCache.read(
+            THEME_LISTS,
+            CatalogCache.request_key(request),
+            lambda: ThemeService._get_paginated(request),
+            lambda: ThemeService._get_paginated_validators(request),
+        )
 
-        serializer = ThemeSerializer(result_page, many=True)
+    @staticmethod
+    def _get_paginated_validators(request: Request) -> Validators:
+        paginator, themes_page = ThemeService._paginate(request, Theme.objects.values("id", "updated_at"))
+        versions = [(row["id"], row["updated_at"]) for row in themes_page]
 
-        return Response(serializer.data)
+        if isinstance(paginator, KeysetPagination):
+            return versions_validators(request, versions, paginator.next_cursor, paginator.count)
+
+        return versions_validators(request, versions)
+
+    @staticmethod
+    def _get_paginated(request: Request) -> Response:
+        paginator, themes_page = ThemeService._paginate(request, THEME_ROWS.values(Theme.objects.all()))
+        data = THEME_ROWS.to_representation(themes_page)
+
+        if isinstance(paginator, KeysetPagination):
+            return paginator.get_paginated_response(data)
+
+        return Response(data)
+
+    @staticmethod
+    async def aget_paginated(request: Request) -> Response:
+        return await CatalogCache.aread(
+            THEME_LISTS,
+            CatalogCache.request_key(request),
+            lambda: ThemeService._aget_paginated(request),
+        )
+
+    @staticmethod
+    async def _aget_paginated(request: Request) -> Response:
+        paginator, themes = ThemeService._page_query(request, THEME_ROWS.values(Theme.objects.all()))
+        data = THEME_ROWS.to_representation(await paginator.apaginate_queryset(themes, request) or [])
+
+        if isinstance(paginator, KeysetPagination):
+            return paginator.get_paginated_response(data)
+
+        return Response(data)
+
+    @staticmethod
+    def _paginate(request: Request, themes: QuerySet[Any]) -> tuple[BasePagination, list[dict[str, Any]]]:
+        """ Page of themes, themes are values() rows containing the id """
+        paginator, themes = ThemeService._page_query(request, themes)
+
+        return paginator, paginator.paginate_queryset(themes, request) or []
+
+    @staticmethod
+    def _page_query(
+            request: Request,
+            themes: QuerySet[Any],
+    ) -> tuple[Union[KeysetPagination, UncountedLimitOffsetPagination], QuerySet[Any]]:
+        if request.query_params.get("pagination") == "cursor":
+            return KeysetPagination(["id"]), themes
+
+        return UncountedLimitOffsetPagination(), themes.order_by("id")
 
     @staticmethod
     def create(theme: Theme) -> Response:
         try:
-            theme.save()
+            with transaction.atomic():
+                theme.save()
+                theme.path = f"{ThemeService._path_of(theme.parent_id)}{theme.pk}/"
+                theme.save(update_fields=["path"])
+                ChangeService.record(Change.Kind.THEME, Change.Action.UPSERT, [theme.pk])
         except IntegrityError:
             return ResponseBadRequest("Parent theme doesn't exist")
 
+        CatalogCache.invalidate(THEME_LISTS)
+
         return Response(ThemeSerializer(theme).data)
 
     @staticmethod
     def get(pk: int) -> Response:
+        return CatalogCache.read(THEME_DETAILS, str(pk), lambda: ThemeService._get(pk),
+                                 lambda: ThemeService._validators(pk))
+
+    @staticmethod
+    def _validators(pk: int) -> Validators:
+        updated_at = Theme.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+
+        return version_validators("theme", pk, updated_at)
+
+    @staticmethod
+    def _get(pk: int) -> Response:
         theme = get_object_or_404(Theme, pk=pk)
 
         serializer = ThemeSerializer(theme)
@@ -62,16 +262,71 @@ class ThemeService:
         return Response(serializer.data)
 
     @staticmethod
-    def delete(pk: int) -> Response:
+    async def aget(pk: int) -> Response:
+        return await CatalogCache.aread(THEME_DETAILS, str(pk), lambda: ThemeService._aget(pk))
+
+    @staticmethod
+    async def _aget(pk: int) -> Response:
+        row = await THEME_ROWS.values(Theme.objects.filter(pk=pk)).afirst()
+
+        if row is None:
+            raise NotFound("No Theme matches the given query.")
+
+        return Response(THEME_ROWS.to_representation([row])[0])
+
+    @staticmethod
+    def delete(pk: int, dry_run: bool = False) -> Response:
+        """ Delete the theme with its sub-themes and their sets, a dry run only counts them """
         theme = get_object_or_404(Theme, pk=pk)
 
-        theme.delete()
+        if dry_run:
+            return Response(ThemeService.count_subtrees([theme.path]))
+
+        ThemeService.delete_subtrees([theme.path])
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def count_subtrees(paths: list[str]) -> dict[str, int]:
+        """ Themes and sets under the paths, in a single query """
+        counts: dict[str, int] = ThemeService._subtrees(paths).aggregate(
+            themes=Count("id", distinct=True),
+            sets=Count("set"),
+        )
+
+        return counts
+
+    @staticmethod
+    def delete_subtrees(paths: list[str]) -> None:
+        """ Delete the themes under the paths and their sets, with one statement per table
+
+        The foreign keys don't cascade so Django doesn't collect the deleted rows in memory, the sets must go first.
+        """
+        themes = ThemeService._subtrees(paths)
+
+        with transaction.atomic():
+            stats.remove_subtrees(paths, themes)
+            ChangeService.record_queryset(Change.Kind.SET, Change.Action.DELETE, Set.objects.filter(theme__in=themes))
+            ChangeService.record_queryset(Change.Kind.THEME, Change.Action.DELETE, themes)
+            Set.objects.filter(theme__in=themes).delete()
+            themes.delete()
+
+        # cheaper than listing the ids of the deleted themes and sets
+        CatalogCache.invalidate(THEME_LISTS, THEME_DETAILS, SET_LISTS, SET_DETAILS)
+
+    @staticmethod
+    def _subtrees(paths: list[str]) -> QuerySet[Theme]:
+        subtrees = Q()
+
+        for path in paths:
+            subtrees |= Q(path__startswith=path)
+
+        return Theme.objects.filter(subtrees)
+
     @staticmethod
     def update(request: Request, pk: int) -> Response:
         theme = get_object_or_404(Theme, pk=pk)
+        old_path = theme.path
 
         serializer = UpdateThemeSerializer(theme, data=request.data)
 
@@ -79,10 +334,261 @@ class ThemeService:
             return Response(status=status.HTTP_400_BAD_REQUEST, data=serializer.errors)
 
         theme = serializer.save()
+        parent_path = ThemeService._path_of(theme.parent_id)
+
+        if parent_path.startswith(old_path):
+            return ResponseBadRequest("A theme can't be moved under itself")
+
+        theme.path = f"{parent_path}{theme.pk}/"
 
         try:
-            theme.save()
+            with transaction.atomic():
+                theme.save()
+
+                if theme.path != old_path:
+                    Theme.objects.filter(path__startswith=old_path).exclude(pk=theme.pk).update(
+                        path=Concat(Value(theme.path), Substr("path", len(old_path) + 1))
+                    )
+                    stats.move_subtree(theme.pk, old_path, theme.path)
+
+                ChangeService.record(Change.Kind.THEME, Change.Action.UPSERT, [pk])
         except IntegrityError:
             return ResponseBadRequest("Theme doesn't exist")
 
-        return Response(ThemeSerializer(theme).data)
\ No newline at end of file
+        CatalogCache.delete(THEME_DETAILS, str(pk))
+        CatalogCache.invalidate(THEME_LISTS)
+
+        if theme.path != old_path:
+            CatalogCache.invalidate(SET_LISTS)
+
+        return Response(ThemeSerializer(theme).data)
+
+    @staticmethod
+    def get_batch(ids: list[int]) -> Response:
+        rows = list(THEME_ROWS.values(Theme.objects.filter(pk__in=ids).order_by("id")))
+        found = {row["id"] for row in rows}
+
+        return Response({
+            "results": THEME_ROWS.to_representation(rows),
+            "not_found": {"ids": [pk for pk in ids if pk not in found]},
+        })
+
+    @staticmethod
+    def update_batch(items: list[dict[str, Any]]) -> Response:
+        """ Rename and move many themes, every item gets its own result
+
+        The themes of the batch and their new parents are read in one query, names and parents are written with
+        one bulk update, the paths of all the moved subtrees with one update and their stats with one upsert.
+        """
+        results: list[Optional[dict[str, Any]]] = [None] * len(items)
+        changes: dict[int, tuple[int, dict[str, Any]]] = {}
+
+        for i, item in enumerate(items):
+            serializer = BatchUpdateThemeSerializer(data=item)
+
+            if not serializer.is_valid():
+                results[i] = item_result(item.get("id"), status.HTTP_400_BAD_REQUEST, serializer.errors)
+                continue
+
+            data = dict(serializer.validated_data)
+            pk = data.pop("id")
+
+            if pk in changes:
+                results[i] = item_result(pk, status.HTTP_400_BAD_REQUEST, "Theme is more than once in the batch")
+                continue
+
+            changes[pk] = (i, data)
+
+        parent_ids = {data["parent_id"] for _, data in changes.values() if data.get("parent_id") is not None}
+        themes = Theme.objects.in_bulk([*changes, *parent_ids])
+        # paths as they are after the moves processed so far
+        paths = {pk: theme.path for pk, theme in themes.items()}
+        moved = []
+        updated = []
+
+        for pk, (i, data) in changes.items():
+            if pk not in themes:
+                results[i] = item_result(pk, status.HTTP_404_NOT_FOUND, "Theme doesn't exist")
+                continue
+
+            theme = themes[pk]
+            parent_id = data.get("parent_id", theme.parent_id)
+
+            if parent_id is not None and parent_id not in themes:
+                results[i] = item_result(pk, status.HTTP_400_BAD_REQUEST, "Parent theme doesn't exist")
+                continue
+
+            old_path = paths[pk]
+            new_path = f"{'' if parent_id is None else paths[parent_id]}{pk}/"
+
+            if new_path != old_path:
+                if new_path.startswith(old_path):
+                    results[i] = item_result(pk, status.HTTP_400_BAD_REQUEST, "A theme can't be moved under itself")
+                    continue
+
+                moved.append(pk)
+                paths = {
+                    theme_id: new_path + path[len(old_path):] if path.startswith(old_path) else path
+                    for theme_id, path in paths.items()
+                }
+
+            theme.name = data.get("name", theme.name)
+            theme.parent_id = parent_id
+            updated.append((i, theme))
+
+        now = timezone.now()
+        # (theme, path before the batch, path after it) of the moved themes
+        moves = [(pk, themes[pk].path, paths[pk]) for pk in moved]
+
+        for _, theme in updated:
+            theme.path = paths[theme.pk]
+            theme.updated_at = now
+
+        try:
+            with transaction.atomic():
+                if moves:
+                    ThemeService._move_subtrees(moves)
+                    stats.move_subtrees(moves)
+
+                Theme.objects.bulk_update(
+                    [theme for _, theme in updated],
+                    ["name", "parent_id", "path", "updated_at"],
+                    batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+                )
+                ChangeService.record(Change.Kind.THEME, Change.Action.UPSERT, [theme.pk for _, theme in updated])
+        except IntegrityError:
+            # a parent was deleted in the meantime
+            for i, theme in updated:
+                results[i] = item_result(theme.pk, status.HTTP_409_CONFLICT, "The themes changed, retry the batch")
+
+            return Response({"results": results})
+
+        for i, theme in updated:
+            results[i] = item_result(theme.pk, status.HTTP_200_OK, ThemeSerializer(theme).data)
+
+        if updated:
+            CatalogCache.delete(THEME_DETAILS, *[str(theme.pk) for _, theme in updated])
+            CatalogCache.invalidate(THEME_LISTS)
+
+        if moves:
+            CatalogCache.invalidate(SET_LISTS)
+
+        return Response({"results": results})
+
+    @staticmethod
+    def _move_subtrees(moves: list[tuple[int, str, str]]) -> None:
+        """ Rewrite the paths of the moved subtrees in one update, moves holds (theme id, path before, path after)
+
+        A theme takes the new path of its nearest moved ancestor (itself included), the deepest prefix matches first.
+        """
+        moves = sorted(moves, key=lambda move: len(move[1]), reverse=True)
+
+        Theme.objects.filter(reduce(or_, [Q(path__startswith=old_path) for _, old_path, _ in moves])).update(
+            path=Case(*[
+                When(path__startswith=old_path, then=Concat(Value(new_path), Substr("path", len(old_path) + 1)))
+                for _, old_path, new_path in moves
+            ]),
+        )
+
+    @staticmethod
+    def delete_batch(ids: list[int]) -> Response:
+        paths = dict(Theme.objects.filter(pk__in=ids).values_list("pk", "path"))
+
+        if paths:
+            ThemeService.delete_subtrees(list(paths.values()))
+
+        return Response({
+            "results": [
+                item_result(pk, status.HTTP_204_NO_CONTENT) if pk in paths
+                else item_result(pk, status.HTTP_404_NOT_FOUND, "Theme doesn't exist")
+                for pk in ids
+            ],
+        })
+
+    @staticmethod
+    def get_ancestors(pk: int) -> Response:
+        return CatalogCache.read(THEME_LISTS, f"ancestors:{pk}", lambda: ThemeService._get_ancestors(pk))
+
+    @staticmethod
+    def _get_ancestors(pk: int) -> Response:
+        theme = get_object_or_404(Theme, pk=pk)
+        ancestor_ids = [int(ancestor_id) for ancestor_id in theme.path.split("/")[:-2]]
+
+        ancestors = Theme.objects.filter(pk__in=ancestor_ids).order_by(Length("path"))
+
+        return Response(ThemeSerializer(ancestors, many=True).data)
+
+    @staticmethod
+    def get_stats(pk: int) -> Response:
+        """ Stats of the theme alone and with its subtree, from its ThemeStats rows (one per year) """
+        rows = list(ThemeStats.objects.filter(theme_id=pk).values_list(
+            "year", "own_set_count", "own_total_parts", "set_count", "total_parts",
+        ))
+
+        if not rows and not Theme.objects.filter(pk=pk).exists():
+            raise NotFound("No Theme matches the given query.")
+
+        return Response(ThemeStatsSerializer({
+            "theme": stats.summarize((year, sets, parts) for year, sets, parts, _, _ in rows),
+            "subtree": stats.summarize((year, sets, parts) for year, _, _, sets, parts in rows),
+        }).data)
+
+    @staticmethod
+    def get_descendants(pk: int) -> Response:
+        return CatalogCache.read(THEME_LISTS, f"descendants:{pk}", lambda: ThemeService._get_descendants(pk))
+
+    @staticmethod
+    def _get_descendants(pk: int) -> Response:
+        theme = get_object_or_404(Theme, pk=pk)
+
+        descendants = Theme.objects.filter(path__startswith=theme.path).exclude(pk=pk).order_by("path")
+
+        return Response(ThemeSerializer(descendants, many=True).data)
+
+    @staticmethod
+    async def aget_descendants(pk: int) -> Response:
+        return await CatalogCache.aread(THEME_LISTS, f"descendants:{pk}", lambda: ThemeService._aget_descendants(pk))
+
+    @staticmethod
+    async def _aget_descendants(pk: int) -> Response:
+        path = await ThemeService._apath_of(pk)
+        descendants = THEME_ROWS.values(Theme.objects.filter(path__startswith=path).exclude(pk=pk).order_by("path"))
+
+        return Response(THEME_ROWS.to_representation([row async for row in descendants]))
+
+    @staticmethod
+    def get_sets(request: Request, pk: int) -> Response:
+        return SetService.get_paginated(request, theme_id=pk)
+
+    @staticmethod
+    async def aget_sets(request: Request, pk: int) -> Response:
+        return await SetService.aget_paginated(request, subtree_path=await ThemeService._apath_of(pk))
+
+    @staticmethod
+    async def _apath_of(pk: int) -> str:
+        """ Path of an existing theme, NotFound otherwise """
+        path = await Theme.objects.filter(pk=pk).values_list("path", flat=True).afirst()
+
+        if path is None:
+            raise NotFound("No Theme matches the given query.")
+
+        return path
+
+    @staticmethod
+    def _path_of(pk: Optional[int]) -> str:
+        if pk is None:
+            return ""
+
+        return Theme.objects.filter(pk=pk).values_list("path", flat=True).first() or ""
+
+    @staticmethod
+    def export(file_format: str) -> StreamingHttpResponse:
+        # same layout as the import file, parents come first in path order
+        rows = Theme.objects.order_by("path").values_list("id", "name", "parent_id")
+
+        return stream_export(
+            "themes",
+            FileUploadSerializer.columns,
+            rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE),
+            file_format,
+        )
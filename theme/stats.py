@@ -0,0 +1,205 @@
+from collections import defaultdict
+from typing import Any, Iterable, Optional
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Model, QuerySet, Sum
+
+from set.models import Set
+from theme.models import Theme, ThemeStats
+
+# ThemeStats counters, in the order of the rows written by _upsert
+COUNTERS = ["own_set_count", "own_total_parts", "set_count", "total_parts"]
+
+# (theme id, year) => counters
+Rows = dict[tuple[int, int], list[int]]
+
+
+class StatsChanges:
+    """ Changes of the sets by theme and year, apply adds them to the themes and to all their ancestors """
+
+    def __init__(self) -> None:
+        self.changes: Rows = defaultdict(lambda: [0, 0])
+
+    def add(self, theme_id: int, year: int, sets: int, parts: int) -> None:
+        change = self.changes[(int(theme_id), int(year))]
+        change[0] += int(sets)
+        change[1] += int(parts)
+
+    def add_set(self, theme_id: int, year: int, num_parts: int, sign: int = 1) -> None:
+        """ One set added (sign 1) or removed (sign -1) """
+        self.add(theme_id, year, sign, sign * num_parts)
+
+    def apply(self) -> None:
+        """ Two queries: the paths of the themes and the upsert of the counters """
+        changes = {key: change for key, change in self.changes.items() if any(change)}
+
+        if not changes:
+            return
+
+        paths = dict(Theme.objects.filter(pk__in={theme_id for theme_id, _ in changes}).values_list("pk", "path"))
+        rows: Rows = defaultdict(lambda: [0, 0, 0, 0])
+
+        for (theme_id, year), (sets, parts) in changes.items():
+            row = rows[(theme_id, year)]
+            row[0] += sets
+            row[1] += parts
+
+            for ancestor_id in path_ids(paths.get(theme_id, "")):
+                row = rows[(ancestor_id, year)]
+                row[2] += sets
+                row[3] += parts
+
+        _upsert(rows)
+        self.changes.clear()
+
+
+def move_subtree(theme_id: int, old_path: str, new_path: str) -> None:
+    """ Move the subtree counters of a theme from its old ancestors to the new ones """
+    move_subtrees([(theme_id, old_path, new_path)])
+
+
+def move_subtrees(moves: list[tuple[int, str, str]]) -> None:
+    """ move_subtree of many themes in two queries, moves holds (theme id, path before, path after all the moves)
+
+    A moved theme carries its subtree minus the subtrees of the moved themes below it, which carry their own.
+    """
+    old_paths = {theme_id: old_path for theme_id, old_path, _ in moves}
+    new_paths = {theme_id: new_path for theme_id, _, new_path in moves}
+    # subtree counters of the moved themes by year, less the ones of the moved themes below them
+    blocks: Rows = defaultdict(lambda: [0, 0])
+
+    for theme_id, year, sets, parts in ThemeStats.objects.filter(theme_id__in=old_paths) \
+            .values_list("theme_id", "year", "set_count", "total_parts"):
+        blocks[(theme_id, year)][0] += sets
+        blocks[(theme_id, year)][1] += parts
+        moved_ancestor_id = next(
+            (pk for pk in reversed(path_ids(old_paths[theme_id])[:-1]) if pk in old_paths), None,
+        )
+
+        if moved_ancestor_id is not None:
+            blocks[(moved_ancestor_id, year)][0] -= sets
+            blocks[(moved_ancestor_id, year)][1] -= parts
+
+    rows: Rows = defaultdict(lambda: [0, 0, 0, 0])
+
+    for (theme_id, year), (sets, parts) in blocks.items():
+        old_ancestors = set(path_ids(old_paths[theme_id])[:-1])
+        new_ancestors = set(path_ids(new_paths[theme_id])[:-1])
+
+        for ancestor_id in old_ancestors - new_ancestors:
+            rows[(ancestor_id, year)][2] -= sets
+            rows[(ancestor_id, year)][3] -= parts
+
+        for ancestor_id in new_ancestors - old_ancestors:
+            rows[(ancestor_id, year)][2] += sets
+            rows[(ancestor_id, year)][3] += parts
+
+    _upsert(rows)
+
+
+def remove_subtrees(paths: Iterable[str], themes: QuerySet[Theme]) -> None:
+    """ Remove the counters of the subtrees from their ancestors then the rows of the themes of the subtrees """
+    paths = set(paths)
+    roots = {path_ids(path)[-1]: path for path in paths if not any(path != other and path.startswith(other)
+                                                                     for other in paths)}
+    rows: Rows = defaultdict(lambda: [0, 0, 0, 0])
+
+    for theme_id, year, sets, parts in ThemeStats.objects.filter(theme_id__in=roots) \
+            .values_list("theme_id", "year", "set_count", "total_parts"):
+        for ancestor_id in path_ids(roots[theme_id])[:-1]:
+            row = rows[(ancestor_id, year)]
+            row[2] -= sets
+            row[3] -= parts
+
+    _upsert(rows)
+    ThemeStats.objects.filter(theme__in=themes).delete()
+
+
+def rebuild() -> None:
+    """ Recompute every row from the sets, with a single scan of the sets table
+
+    The scan runs in the transaction writing the rows, with the sets and the themes locked against writes (reads
+    go on), so no write applies its changes between the two.
+    """
+    with transaction.atomic():
+        _lock_writes(Set, Theme)
+        paths = dict(Theme.objects.values_list("pk", "path"))
+        rows: Rows = defaultdict(lambda: [0, 0, 0, 0])
+
+        for theme_id, year, sets, parts in Set.objects.values("theme_id", "year").order_by() \
+                .annotate(sets=Count("id"), parts=Sum("num_parts")).values_list("theme_id", "year", "sets", "parts"):
+            rows[(theme_id, year)][:2] = [sets, parts]
+
+            for ancestor_id in path_ids(paths.get(theme_id, "")):
+                row = rows[(ancestor_id, year)]
+                row[2] += sets
+                row[3] += parts
+
+        ThemeStats.objects.all().delete()
+        ThemeStats.objects.bulk_create(
+            [ThemeStats(theme_id=theme_id, year=year, **dict(zip(COUNTERS, row))) for (theme_id, year), row in
+             rows.items()],
+            batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+        )
+
+
+def summarize(rows: Iterable[tuple[int, int, int]]) -> dict[str, Any]:
+    """ Stats of (year, set count, total parts) rows """
+    rows = [row for row in rows if row[1] > 0]
+    set_count = sum(sets for _, sets, _ in rows)
+    total_parts = sum(parts for _, _, parts in rows)
+    years = [year for year, _, _ in rows]
+    avg_parts: Optional[float] = total_parts / set_count if set_count else None
+
+    return {
+        "set_count": set_count,
+        "total_parts": total_parts,
+        "year_min": min(years, default=None),
+        "year_max": max(years, default=None),
+        "avg_parts": avg_parts,
+    }
+
+
+def path_ids(path: str) -> list[int]:
+    """ Ids of a materialized path, from the root down to the theme """
+    return [int(theme_id) for theme_id in path.split("/")[:-1]]
+
+
+def _lock_writes(*models: type[Model]) -> None:
+    """ Block the writes to the tables of the models until the end of the transaction """
+    connection = connections[router.db_for_write(ThemeStats)]
+
+    # SQLite serializes the transactions, a write committed after the scan makes this one fail instead
+    if connection.vendor != "postgresql":
+        return
+
+    tables = ", ".join(connection.ops.quote_name(model._meta.db_table) for model in models)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {tables} IN SHARE MODE")
+
+
+def _upsert(rows: Rows) -> None:
+    """ Add the counters to the stored ones, INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite) does it in one
+    statement without reading the rows, which the ORM can't express """
+    values = [(theme_id, year, *row) for (theme_id, year), row in rows.items() if any(row)]
+
+    if not values:
+        return
+
+    connection = connections[router.db_for_write(ThemeStats)]
+    quote = connection.ops.quote_name
+    table = quote(ThemeStats._meta.db_table)
+    columns = [quote(column) for column in ["theme_id", "year", *COUNTERS]]
+    updates = ", ".join(f"{column} = {table}.{column} + excluded.{column}" for column in columns[2:])
+    placeholders = f"({', '.join(['%s'] * len(columns))})"
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), settings.BULK_IMPORT_BATCH_SIZE):
+            batch = values[start:start + settings.BULK_IMPORT_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT ({columns[0]}, {columns[1]}) DO UPDATE SET {updates}",
+                [value for row in batch for value in row],
+            )
@@ -0,0 +1,150 @@
+import io
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from theme.models import Theme, ThemeStats
+from theme.serializers import FileUploadSerializer
+from theme.services import ThemeService
+from utils.imports import UPSERT
+from utils.testing import APITestCase
+
+
+class ThemeTests(APITestCase):
+    def tree(self, width: int) -> list[list[int]]:
+        """ width roots with a child and a grandchild each, every theme with a set """
+        branches = []
+
+        for i in range(width):
+            root = self.create_theme(f"root {i}")
+            child = self.create_theme(f"child {i}", root)
+            grandchild = self.create_theme(f"grandchild {i}", child)
+            branches.append([root, child, grandchild])
+
+            for depth, theme_id in enumerate(branches[-1]):
+                self.create_set(f"{theme_id}-1", theme_id, 2000 + depth, 10 * (i + 1))
+
+        return branches
+
+    def paths(self) -> dict[int, str]:
+        return dict(Theme.objects.values_list("pk", "path"))
+
+    def test_get_update_delete(self) -> None:
+        root = self.create_theme("city")
+        child = self.create_theme("police", root)
+        self.create_set("1-1", child, 2010, 100)
+
+        self.assertEqual(self.api.get(f"/api/themes/{child}").json()["parent_id"], root)
+        self.assertEqual(self.api.get("/api/themes/", {"limit": 10}).status_code, 200)
+        self.assertEqual([theme["id"] for theme in self.api.get(f"/api/themes/{root}/descendants").json()], [child])
+        self.assertEqual([theme["id"] for theme in self.api.get(f"/api/themes/{child}/ancestors").json()], [root])
+        self.assertEqual(self.api.get(f"/api/themes/{root}/stats").json()["subtree"]["total_parts"], 100)
+        response = self.api.patch(f"/api/themes/{child}", {"name": "fire", "parent_id": root}, format="json")
+        self.assertEqual(response.json()["name"], "fire")
+        self.assertEqual(self.api.delete(f"/api/themes/{root}?dry_run=true").json(), {"themes": 2, "sets": 1})
+        self.assertEqual(self.api.delete(f"/api/themes/{root}").status_code, 204)
+        self.assertFalse(Theme.objects.exists())
+        self.assertFalse(ThemeStats.objects.filter(set_count__gt=0).exists())
+
+    def test_move(self) -> None:
+        [a, a1, a2], [b, _, _] = self.tree(2)
+
+        response = self.api.patch(f"/api/themes/{a1}", {"name": "moved", "parent_id": b}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.paths()[a2], f"{b}/{a1}/{a2}/")
+        self.assertStatsRebuilt()
+
+    def test_move_under_itself(self) -> None:
+        [a, a1, a2] = self.tree(1)[0]
+
+        response = self.api.patch(f"/api/themes/{a}", {"name": "a", "parent_id": a2}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_move(self) -> None:
+        [a, a1, a2], [b, b1, b2], [c, c1, _] = self.tree(3)
+
+        response = self.api.patch("/api/themes/batch", {"items": [
+            # a moved subtree holding another moved subtree
+            {"id": a1, "parent_id": c1},
+            {"id": c, "parent_id": b2},
+            {"id": b1, "parent_id": None},
+            {"id": a2, "parent_id": a},
+        ]}, format="json")
+
+        self.assertEqual([result["status"] for result in response.json()["results"]], [200] * 4)
+        paths = self.paths()
+        self.assertEqual(paths[a1], f"{b1}/{b2}/{c}/{c1}/{a1}/")
+        self.assertEqual(paths[a2], f"{a}/{a2}/")
+        self.assertEqual(paths[b1], f"{b1}/")
+        self.assertStatsRebuilt()
+
+    def test_async_endpoints(self) -> None:
+        [a, a1, a2] = self.tree(1)[0]
+
+        self.assertEqual(self.get_async("/api/async/themes/", limit=10),
+                         self.api.get("/api/themes/", {"limit": 10}).json())
+        self.assertEqual(self.get_async(f"/api/async/themes/{a1}"), self.api.get(f"/api/themes/{a1}").json())
+        self.assertEqual(self.get_async(f"/api/async/themes/{a}/descendants"),
+                         self.api.get(f"/api/themes/{a}/descendants").json())
+        self.assertEqual(self.get_async(f"/api/async/themes/{a}/sets", limit=10),
+                         self.api.get(f"/api/themes/{a}/sets", {"limit": 10}).json())
+
+    def test_batch_move_queries_dont_grow_with_the_batch(self) -> None:
+        branches = self.tree(6)
+        counts = []
+
+        for batch in (branches[:1], branches[1:]):
+            items = [{"id": child, "parent_id": branches[0][0] if root != branches[0][0] else None}
+                     for root, child, _ in batch]
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api.patch("/api/themes/batch", {"items": items}, format="json")
+
+            self.assertEqual({result["status"] for result in response.json()["results"]}, {200})
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertStatsRebuilt()
+
+    def test_batch_move_under_itself(self) -> None:
+        [a, a1, _], [b, _, _] = self.tree(2)
+
+        response = self.api.patch("/api/themes/batch", {"items": [
+            {"id": b, "parent_id": a1},
+            {"id": a, "parent_id": b},
+        ]}, format="json")
+
+        self.assertEqual([result["status"] for result in response.json()["results"]], [200, 400])
+        self.assertStatsRebuilt()
+
+    def test_batch_delete(self) -> None:
+        [a, _, _], [b, _, _] = self.tree(2)
+
+        response = self.api.delete("/api/themes/batch", {"ids": [a, 0]}, format="json")
+
+        self.assertEqual([result["status"] for result in response.json()["results"]], [204, 404])
+        self.assertEqual(Theme.objects.count(), 3)
+        self.assertStatsRebuilt()
+
+    def test_import_moving_existing_themes(self) -> None:
+        [a, a1, a2], [b, _, _] = self.tree(2)
+        file = f"id,name,parent_id\n{a1},moved,{b}\n{a2},moved,{a}\n1000,new,{a2}\n".encode()
+
+        report = ThemeService.bulk_import(FileUploadSerializer.read(io.BytesIO(file)), UPSERT)
+
+        self.assertEqual((report.inserted, report.updated), (1, 2))
+        self.assertEqual(self.paths()[1000], f"{a}/{a2}/1000/")
+        self.assertStatsRebuilt()
+
+    def test_export(self) -> None:
+        [a, a1, a2] = self.tree(1)[0]
+
+        response = self.api.get("/api/themes/export/csv")
+        # the queries of the stream count in the budget of the view
+        content = response.getvalue().decode()
+
+        self.assertEqual(content.splitlines(), [
+            "id,name,parent_id", f"{a},root 0,", f"{a1},child 0,{a}", f"{a2},grandchild 0,{a1}",
+        ])
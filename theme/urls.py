@@ -3,6 +3,19 @@ from theme import views
 
 urlpatterns = [
     path('bulk', views.bulk_import),
+    path('export/<str:file_format>', views.export),
+    path('batch', views.ThemeBatchView.as_view()),
     path('', views.ThemeListView.as_view()),
-    path('<int:pk>', views.ThemeDetailView.as_view())
-]
\ No newline at end of file
+    path('<int:pk>', views.ThemeDetailView.as_view()),
+    path('<int:pk>/ancestors', views.ThemeAncestorsView.as_view()),
+    path('<int:pk>/descendants', views.ThemeDescendantsView.as_view()),
+    path('<int:pk>/sets', views.ThemeSetsView.as_view()),
+    path('<int:pk>/stats', views.ThemeStatsView.as_view()),
+]
+
+async_urlpatterns = [
+    path('', views.list_async),
+    path('<int:pk>', views.detail_async),
+    path('<int:pk>/descendants', views.descendants_async),
+    path('<int:pk>/sets', views.sets_async),
+]
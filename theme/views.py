@@ -1,6 +1,7 @@
+from django.http import HttpResponseBase
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from rest_framework import status, serializers
+from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes, permission_classes
 from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
@@ -8,31 +9,56 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from theme.serializers import ThemeSerializer, CreateThemeSerializer, UpdateThemeSerializer, FileUploadSerializer
+from job.serializers import ImportJobSerializer
+from job.services import ImportJobService
+from set.serializers import SetFilterSerializer, SetSerializer
+from theme.serializers import ThemeSerializer, CreateThemeSerializer, UpdateThemeSerializer, FileUploadSerializer, \
+    DeleteThemeSerializer, ThemeStatsSerializer
 from theme.services import ThemeService
-from utils.responses import ResponseBadRequest
+from utils.asynchronous import async_api_view
+from utils.batch import BatchIdsSerializer, BatchUpdateSerializer
+from utils.conditional import conditional
+from utils.export import EXPORT_FORMATS
+from utils.query_budget import query_budget
+from utils.responses import ResponseBadRequest, ResponseNotFound
 
 
 @extend_schema(
     request=FileUploadSerializer,
-    responses={status.HTTP_200_OK: None},
-    summary="Bulk import"
+    responses={status.HTTP_202_ACCEPTED: ImportJobSerializer},
+    summary="Bulk import, the file is processed by the import workers"
 )
 @api_view(['POST'])
 @parser_classes([MultiPartParser])
 @permission_classes([IsAuthenticated, IsAdminUser])
+@query_budget(1)
 def bulk_import(request: Request) -> Response:
     serializer = FileUploadSerializer(data=request.data)
 
     if not serializer.is_valid():
         return ResponseBadRequest(serializer.errors)
 
-    try:
-        df = serializer.save()
-    except serializers.ValidationError as e:
-        return ResponseBadRequest(e.detail)
+    job = serializer.save()
 
-    return ThemeService.bulk_import(df)
+    return ImportJobService.enqueue(job)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(name="file_format", location=OpenApiParameter.PATH, type=OpenApiTypes.STR,
+                         enum=list(EXPORT_FORMATS)),
+    ],
+    responses={status.HTTP_200_OK: OpenApiTypes.BINARY},
+    summary="Export all themes in the import file layout"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@query_budget(1)
+def export(request: Request, file_format: str) -> HttpResponseBase:
+    if file_format not in EXPORT_FORMATS:
+        return ResponseNotFound("Format must be one of " + ", ".join(EXPORT_FORMATS))
+
+    return ThemeService.export(file_format)
 
 
 class ThemeListView(APIView):
@@ -43,11 +69,19 @@ class ThemeListView(APIView):
         parameters=[
             OpenApiParameter(name="limit", location=OpenApiParameter.QUERY, type=OpenApiTypes.INT, default=10),
             OpenApiParameter(name="offset", location=OpenApiParameter.QUERY, type=OpenApiTypes.INT, default=0),
+            OpenApiParameter(name="pagination", location=OpenApiParameter.QUERY, type=OpenApiTypes.STR,
+                             enum=["offset", "cursor"], default="offset"),
+            OpenApiParameter(name="cursor", location=OpenApiParameter.QUERY, type=OpenApiTypes.STR,
+                             description="Cursor of the next page, cursor pagination only"),
+            OpenApiParameter(name="count", location=OpenApiParameter.QUERY, type=OpenApiTypes.BOOL, default=False,
+                             description="Include the total count, cursor pagination only"),
         ],
         responses={status.HTTP_202_ACCEPTED: ThemeSerializer},
         operation_id="getPaginatedThemes",
         summary="Get paginated themes"
     )
+    @query_budget(4)
+    @conditional
     def get(request: Request) -> Response:
         return ThemeService.get_paginated(request)
 
@@ -57,6 +91,7 @@ class ThemeListView(APIView):
         responses={status.HTTP_201_CREATED: ThemeSerializer},
         summary="Create a theme"
     )
+    @query_budget(5)
     def post(request: Request) -> Response:
         serializer = CreateThemeSerializer(data=request.data)
 
@@ -77,16 +112,25 @@ class ThemeDetailView(APIView):
         operation_id="getThemeById",
         summary="Get a theme"
     )
+    @query_budget(2)
+    @conditional
     def get(request: Request, pk: int) -> Response:
         return ThemeService.get(pk)
 
     @staticmethod
     @extend_schema(
-        responses={status.HTTP_204_NO_CONTENT: None},
-        summary="Delete a theme"
+        parameters=[DeleteThemeSerializer],
+        responses={status.HTTP_204_NO_CONTENT: None, status.HTTP_200_OK: OpenApiTypes.OBJECT},
+        summary="Delete a theme with its sub-themes and their sets, a dry run returns their counts instead"
     )
+    @query_budget(9)
     def delete(request: Request, pk: int) -> Response:
-        return ThemeService.delete(pk)
+        options = DeleteThemeSerializer(data=request.query_params)
+
+        if not options.is_valid():
+            return ResponseBadRequest(options.errors)
+
+        return ThemeService.delete(pk, options.validated_data["dry_run"])
 
     @staticmethod
     @extend_schema(
@@ -94,5 +138,149 @@ class ThemeDetailView(APIView):
         responses={status.HTTP_202_ACCEPTED: ThemeSerializer},
         summary="Update a theme"
     )
+    @query_budget(8)
     def patch(request: Request, pk: int) -> Response:
-        return ThemeService.update(request, pk)
\ No newline at end of file
+        return ThemeService.update(request, pk)
+
+
+class ThemeBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    @extend_schema(
+        request=BatchIdsSerializer,
+        responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+        operation_id="getThemesByIds",
+        summary="Get many themes by id, POST since the list doesn't fit in a url"
+    )
+    @query_budget(1)
+    def post(request: Request) -> Response:
+        serializer = BatchIdsSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return ResponseBadRequest(serializer.errors)
+
+        return ThemeService.get_batch(serializer.validated_data["ids"])
+
+    @staticmethod
+    @extend_schema(
+        request=BatchUpdateSerializer,
+        responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+        summary="Rename and move many themes, items are partial themes with their id and each one gets its own result"
+    )
+    # the paths of all the moved subtrees are rewritten by one update, their stats read and upserted once
+    @query_budget(7)
+    def patch(request: Request) -> Response:
+        serializer = BatchUpdateSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return ResponseBadRequest(serializer.errors)
+
+        return ThemeService.update_batch(serializer.validated_data["items"])
+
+    @staticmethod
+    @extend_schema(
+        request=BatchIdsSerializer,
+        responses={status.HTTP_200_OK: OpenApiTypes.OBJECT},
+        summary="Delete many themes with their sub-themes and sets, each id gets its own result"
+    )
+    @query_budget(9)
+    def delete(request: Request) -> Response:
+        serializer = BatchIdsSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return ResponseBadRequest(serializer.errors)
+
+        return ThemeService.delete_batch(serializer.validated_data["ids"])
+
+
+class ThemeAncestorsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    @extend_schema(
+        responses={status.HTTP_200_OK: ThemeSerializer(many=True)},
+        operation_id="getThemeAncestors",
+        summary="Get the ancestors of a theme, from the root down to its parent"
+    )
+    @query_budget(2)
+    def get(request: Request, pk: int) -> Response:
+        return ThemeService.get_ancestors(pk)
+
+
+class ThemeDescendantsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    @extend_schema(
+        responses={status.HTTP_200_OK: ThemeSerializer(many=True)},
+        operation_id="getThemeDescendants",
+        summary="Get all the sub-themes of a theme"
+    )
+    @query_budget(2)
+    def get(request: Request, pk: int) -> Response:
+        return ThemeService.get_descendants(pk)
+
+
+class ThemeStatsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    @extend_schema(
+        responses={status.HTTP_200_OK: ThemeStatsSerializer},
+        operation_id="getThemeStats",
+        summary="Get the set count, total parts, year range and average parts of a theme and of its subtree"
+    )
+    @query_budget(2)
+    def get(request: Request, pk: int) -> Response:
+        return ThemeService.get_stats(pk)
+
+
+class ThemeSetsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    @extend_schema(
+        parameters=[
+            SetFilterSerializer,
+            OpenApiParameter(name="limit", location=OpenApiParameter.QUERY, type=OpenApiTypes.INT, default=10),
+            OpenApiParameter(name="offset", location=OpenApiParameter.QUERY, type=OpenApiTypes.INT, default=0),
+            OpenApiParameter(name="cursor", location=OpenApiParameter.QUERY, type=OpenApiTypes.STR,
+                             description="Cursor of the next page, cursor pagination only"),
+            OpenApiParameter(name="count", location=OpenApiParameter.QUERY, type=OpenApiTypes.BOOL, default=False,
+                             description="Include the total count, cursor pagination only"),
+        ],
+        responses={status.HTTP_200_OK: SetSerializer(many=True)},
+        operation_id="getThemeSets",
+        summary="Get paginated sets of a theme and its sub-themes"
+    )
+    @query_budget(6)
+    @conditional
+    def get(request: Request, pk: int) -> Response:
+        return ThemeService.get_sets(request, pk)
+
+
+# async read endpoints mounted under /api/async/, for ASGI deployments
+
+@async_api_view
+@query_budget(2)
+async def list_async(request: Request) -> Response:
+    return await ThemeService.aget_paginated(request)
+
+
+@async_api_view
+@query_budget(1)
+async def detail_async(request: Request, pk: int) -> Response:
+    return await ThemeService.aget(pk)
+
+
+@async_api_view
+@query_budget(2)
+async def descendants_async(request: Request, pk: int) -> Response:
+    return await ThemeService.aget_descendants(pk)
+
+
+@async_api_view
+@query_budget(3)
+async def sets_async(request: Request, pk: int) -> Response:
+    return await ThemeService.aget_sets(request, pk)
@@ -1,7 +1,33 @@
-from typing import Optional
+from typing import Any, Optional
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+
+
+def user_cache_key(user_id: Any) -> str:
+    """ Key of a user in the cache of the JWT authentication (utils.authentication) """
+    return f"auth:user:{user_id}"
+
+
+def forget_cached_users(ids: list[Any]) -> None:
+    """ Drop the users from the JWT authentication cache once the transaction commits
+
+    Dropped earlier, a request running meanwhile could cache them again with the old values.
+    """
+    keys = [user_cache_key(pk) for pk in ids]
+
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class UserProfileQuerySet(models.QuerySet['UserProfile']):
+    def update(self, **kwargs: Any) -> int:
+        """ Bulk updates (e.g. deactivating users) send no post_save, their users are forgotten here """
+        ids = list(self.values_list("pk", flat=True))
+        updated = super().update(**kwargs)
+        forget_cached_users(ids)
+
+        return updated
 
 
 class UserProfileManager(BaseUserManager['UserProfile']):
@@ -37,7 +63,7 @@ class UserProfile(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_staff = models.BooleanField(default=False)
 
-    objects = UserProfileManager()
+    objects = UserProfileManager.from_queryset(UserProfileQuerySet)()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name']
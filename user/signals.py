@@ -0,0 +1,12 @@
+from typing import Any
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from user.models import UserProfile, forget_cached_users
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def forget_cached_user(instance: UserProfile, **kwargs: Any) -> None:
+    """ Flag, password and activity changes must reach the cached JWT user lookups """
+    forget_cached_users([instance.pk])
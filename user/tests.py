@@ -0,0 +1,62 @@
+from typing import Any
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.settings import api_settings
+
+from user.models import UserProfile, user_cache_key
+from utils.testing import APITestCase
+
+
+class JWTAuthenticationTests(APITestCase):
+    """ The user lookups of the JWT authentication are cached until the user changes """
+
+    def setUp(self) -> None:
+        super().setUp()
+        # authenticated by its bearer token
+        self.api.force_authenticate(None)
+        self.login()
+
+    def login(self) -> None:
+        token = self.api.post("/api/token/", {"email": "admin@lego.com", "password": "password"}, format="json")
+        self.assertEqual(token.status_code, 200)
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {token.json()['access']}")
+
+    def get(self) -> Any:
+        return self.api.get("/api/metrics/database")
+
+    def test_cached_user(self) -> None:
+        self.assertEqual(self.get().status_code, 200)
+        # the password hash isn't cached
+        self.assertNotIn("password", cache.get(user_cache_key(self.admin.pk)))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get().status_code, 200)
+
+        self.assertEqual(len(queries), 0)
+
+    def test_saved_user(self) -> None:
+        self.get()
+        self.admin.is_staff = False
+        self.admin.save()
+
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_bulk_updated_user(self) -> None:
+        self.get()
+        UserProfile.objects.filter(pk=self.admin.pk).update(is_staff=False)
+
+        self.assertEqual(self.get().status_code, 403)
+
+    # the modules of simplejwt keep the api_settings they imported, an override of SIMPLE_JWT doesn't reach them
+    @mock.patch.object(api_settings, "CHECK_REVOKE_TOKEN", True)
+    def test_changed_password(self) -> None:
+        # a token carrying the revoke claim
+        self.login()
+        self.assertEqual(self.get().status_code, 200)
+        self.admin.set_password("changed")
+        self.admin.save()
+
+        self.assertEqual(self.get().json()["detail"], "The user's password has been changed.")
@@ -0,0 +1,91 @@
+from functools import wraps
+from typing import Any, Awaitable, Callable, Coroutine, Optional
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotAuthenticated
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from utils.authentication import JWTAuthentication
+from utils.metrics import timed
+from utils.renderers import FastJSONRenderer, MessagePackRenderer
+
+AsyncView = Callable[..., Awaitable[Response]]
+
+
+def async_api_view(view: AsyncView) -> Callable[..., Coroutine[Any, Any, HttpResponse]]:
+    """ Async GET endpoint with the JWT authentication and the json or msgpack output of the DRF views
+
+    DRF views are sync only, under ASGI they take a thread of the pool for the whole request. The view gets a
+    DRF Request (query_params, build_absolute_uri) and returns an unrendered Response like the services do.
+    """
+
+    @wraps(view)
+    async def wrapper(request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        drf_request = Request(request)
+        # errors of the negotiation itself are rendered in json
+        renderer: BaseRenderer = FastJSONRenderer()
+
+        try:
+            renderer, _ = DefaultContentNegotiation().select_renderer(
+                drf_request, [FastJSONRenderer(), MessagePackRenderer()],
+            )
+
+            if request.method not in ("GET", "HEAD"):
+                raise MethodNotAllowed(str(request.method))
+
+            with timed("auth"):
+                user = await authenticate(request)
+
+            if user is None:
+                raise NotAuthenticated()
+
+            response = await view(drf_request, *args, **kwargs)
+        except APIException as e:
+            # same body as the DRF exception handler
+            data = e.detail if isinstance(e.detail, (list, dict)) else {"detail": e.detail}
+            response = Response(data, status=e.status_code)
+
+            if response.status_code == status.HTTP_401_UNAUTHORIZED:
+                response.headers["WWW-Authenticate"] = JWTAuthentication().authenticate_header(request)
+
+        return render(response, renderer)
+
+    return wrapper
+
+
+async def authenticate(request: HttpRequest) -> Optional[Any]:
+    """ JWTAuthentication.authenticate with the user read by the async cache API and ORM """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+
+    if header is None:
+        return None
+
+    raw_token = authentication.get_raw_token(header)
+
+    if raw_token is None:
+        return None
+
+    validated_token = authentication.get_validated_token(raw_token)
+
+    return await authentication.aget_user(validated_token)
+
+
+def render(response: Response, renderer: BaseRenderer) -> HttpResponse:
+    """ Plain HttpResponse, a template response would be rendered by the handler through sync_to_async """
+    rendered = HttpResponse(
+        renderer.render(response.data),
+        status=response.status_code,
+        content_type=renderer.media_type,
+        headers={name: value for name, value in response.items() if name != "Content-Type"},
+    )
+    patch_vary_headers(rendered, ("Accept",))
+    # marker of the catalog cache for CompressionMiddleware
+    if getattr(response, "catalog_cached", False):
+        setattr(rendered, "catalog_cached", True)
+
+    return rendered
@@ -0,0 +1,128 @@
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework.request import Request
+from rest_framework_simplejwt import authentication, serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from user.models import user_cache_key
+from utils.metrics import timed
+
+# fields of the cached users, the other fields of a cached user are deferred (read from the db if ever used)
+CACHED_USER_FIELDS = ["id", "is_staff", "is_superuser"]
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """ simplejwt authentication with the user lookup cached for AUTH_USER_CACHE_TIMEOUT seconds
+
+    Only the fields the authentication and the permissions need are cached, never the password hash. The cached
+    user is dropped when the user is saved (user.signals) or bulk updated (UserProfileQuerySet). With
+    JWT_STATELESS_USER the user is built from the claims of the token (see TokenObtainPairSerializer) and never
+    read, flag changes then apply when the access token expires. Timed as the auth step of the request metrics.
+    """
+
+    def authenticate(self, request: Request) -> Optional[tuple[Any, Any]]:
+        with timed("auth"):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token: Token) -> Any:
+        if settings.JWT_STATELESS_USER or api_settings.USER_ID_CLAIM not in validated_token:
+            return self.get_token_user(validated_token)
+
+        key = user_cache_key(validated_token[api_settings.USER_ID_CLAIM])
+        entry = cache.get(key)
+
+        if entry is None:
+            user = super().get_user(validated_token)
+            cache.set(key, self.cache_entry(user), settings.AUTH_USER_CACHE_TIMEOUT)
+
+            return user
+
+        self.check_user(entry, validated_token)
+
+        return self.cached_user(entry)
+
+    async def aget_user(self, validated_token: Token) -> Any:
+        """ get_user with the async cache API and ORM """
+        if settings.JWT_STATELESS_USER or api_settings.USER_ID_CLAIM not in validated_token:
+            return self.get_token_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        key = user_cache_key(user_id)
+        entry = await cache.aget(key)
+
+        if entry is None:
+            user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+
+            if user is None:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+
+            entry = self.cache_entry(user)
+            self.check_user(entry, validated_token)
+            await cache.aset(key, entry, settings.AUTH_USER_CACHE_TIMEOUT)
+
+            return user
+
+        self.check_user(entry, validated_token)
+
+        return self.cached_user(entry)
+
+    @staticmethod
+    def cache_entry(user: Any) -> dict[str, Any]:
+        """ The cached fields, the password hash is only kept as the revoke claim it must match """
+        entry = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+        # a field of the users that have one, always true for the others
+        entry["is_active"] = user.is_active
+        entry["revoke_claim"] = get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None
+
+        return entry
+
+    def cached_user(self, entry: dict[str, Any]) -> Any:
+        """ User instance from the cached fields, as loaded by .only() """
+        # from_db takes the values in the order of the model fields
+        fields = [field.attname for field in self.user_model._meta.fields if field.concrete and field.attname in entry]
+
+        return self.user_model.from_db(None, fields, [entry[field] for field in fields])
+
+    @staticmethod
+    def get_token_user(validated_token: Token) -> TokenUser:
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user: TokenUser = api_settings.TOKEN_USER_CLASS(validated_token)
+
+        return user
+
+    @staticmethod
+    def check_user(entry: dict[str, Any], validated_token: Token) -> None:
+        """ The checks get_user runs on the users it reads """
+        if not entry["is_active"]:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry["revoke_claim"]:
+            raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+
+# drf-spectacular registers the extension in its untyped __init_subclass__
+class JWTScheme(SimpleJWTScheme):  # type: ignore[no-untyped-call]
+    """ Bearer scheme of the schema, drf-spectacular only knows the simplejwt class """
+    target_class = "utils.authentication.JWTAuthentication"
+
+
+class TokenObtainPairSerializer(serializers.TokenObtainPairSerializer):
+    """ The tokens carry the flags the permissions need, for the stateless authentication """
+
+    @classmethod
+    def get_token(cls, user: Any) -> Token:
+        token = super().get_token(user)
+        token["is_staff"] = user.is_staff
+        token["is_superuser"] = user.is_superuser
+
+        return token
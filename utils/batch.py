@@ -0,0 +1,23 @@
+from typing import Any, Optional
+
+from django.conf import settings
+from rest_framework import serializers
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), max_length=settings.BATCH_MAX_SIZE)
+
+
+class BatchUpdateSerializer(serializers.Serializer):
+    """ The items are validated one by one by the service so that an invalid item only fails itself """
+    items = serializers.ListField(child=serializers.DictField(), max_length=settings.BATCH_MAX_SIZE)
+
+
+def item_result(pk: Any, status_code: int, data: Optional[Any] = None) -> dict[str, Any]:
+    """ Result of one item of a batch: the data of the object or the detail of the error """
+    result = {"id": pk, "status": status_code}
+
+    if data is not None:
+        result["data" if status_code < 400 else "detail"] = data
+
+    return result
@@ -0,0 +1,192 @@
+import hashlib
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from utils.conditional import Validators
+from utils.replicas import has_replicas, primary_reads
+
+# namespaces of cached catalog responses
+SET_DETAILS = "set"
+SET_LISTS = "sets"
+THEME_DETAILS = "theme"
+THEME_LISTS = "themes"
+
+# part of the keys, changed with the layout of the entries so the ones of the previous layout are never read
+ENTRY_VERSION = 2
+
+
+class CatalogCache:
+    """ Read-through cache of the serialized catalog responses
+
+    Every namespace has a generation token stored in the cache, it is part of the keys of the namespace so
+    invalidating a whole namespace is a single write. If the token gets evicted a new one is drawn, which
+    can only invalidate entries, never resurrect stale ones. For DB_REPLICA_STICKY_SECONDS after a write of
+    a namespace its misses are computed on the primary, a lagging replica would fill the cache with stale rows.
+
+    An entry holds the data of the response and its validators (utils.conditional), computed on the miss before
+    the data so they are never newer than it. A conditional GET on a cached response reads no rows.
+    """
+
+    @staticmethod
+    def read(
+            namespace: str,
+            key: str,
+            compute: Callable[[], Response],
+            validators: Optional[Callable[[], Validators]] = None,
+    ) -> Response:
+        cache_key = CatalogCache._key(namespace, key)
+        entry = cache.get(cache_key)
+
+        if entry is not None:
+            data, entry_validators = entry
+
+            if entry_validators is None and validators is not None:
+                # cached by an async view, they don't answer conditional GETs
+                entry_validators = validators()
+                cache.set(cache_key, (data, entry_validators), settings.CATALOG_CACHE_TIMEOUT)
+
+            return CatalogCache._cached(Response(data), entry_validators)
+
+        if not has_replicas() or cache.get(CatalogCache._written_key(namespace)) is None:
+            entry_validators, response = CatalogCache._compute(compute, validators)
+        else:
+            with primary_reads():
+                entry_validators, response = CatalogCache._compute(compute, validators)
+
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, (response.data, entry_validators), settings.CATALOG_CACHE_TIMEOUT)
+            CatalogCache._cached(response, entry_validators)
+
+        return response
+
+    @staticmethod
+    async def aread(namespace: str, key: str, compute: Callable[[], Awaitable[Response]]) -> Response:
+        """ read for the async views, with the async cache API """
+        cache_key = await CatalogCache._akey(namespace, key)
+        entry = await cache.aget(cache_key)
+
+        if entry is not None:
+            return CatalogCache._cached(Response(entry[0]))
+
+        if not has_replicas() or await cache.aget(CatalogCache._written_key(namespace)) is None:
+            response = await compute()
+        else:
+            with primary_reads():
+                response = await compute()
+
+        if response.status_code == status.HTTP_200_OK:
+            await cache.aset(cache_key, (response.data, None), settings.CATALOG_CACHE_TIMEOUT)
+            CatalogCache._cached(response)
+
+        return response
+
+    @staticmethod
+    def read_compressed(content: bytes, encoding: str, compress: Callable[[bytes, str], bytes]) -> bytes:
+        """ Compressed body of a cached response, keyed by its digest so it needs no invalidation """
+        cache_key = CatalogCache._compressed_key(content, encoding)
+        compressed = cache.get(cache_key)
+
+        if compressed is None:
+            compressed = compress(content, encoding)
+            cache.set(cache_key, compressed, settings.CATALOG_CACHE_TIMEOUT)
+
+        return bytes(compressed)
+
+    @staticmethod
+    async def aread_compressed(content: bytes, encoding: str, compress: Callable[[bytes, str], bytes]) -> bytes:
+        cache_key = CatalogCache._compressed_key(content, encoding)
+        compressed = await cache.aget(cache_key)
+
+        if compressed is None:
+            compressed = compress(content, encoding)
+            await cache.aset(cache_key, compressed, settings.CATALOG_CACHE_TIMEOUT)
+
+        return bytes(compressed)
+
+    @staticmethod
+    def request_key(request: Request, *parts: str) -> str:
+        """ Key of a list response, the absolute url is used since pagination links contain it """
+        url = request.build_absolute_uri()
+
+        return hashlib.md5(":".join([*parts, url]).encode()).hexdigest()
+
+    @staticmethod
+    def delete(namespace: str, *keys: str) -> None:
+        cache.delete_many([CatalogCache._key(namespace, key) for key in keys])
+        CatalogCache._written(namespace)
+
+    @staticmethod
+    def invalidate(*namespaces: str) -> None:
+        cache.set_many({CatalogCache._generation_key(namespace): uuid.uuid4().hex for namespace in namespaces}, None)
+        CatalogCache._written(*namespaces)
+
+    @staticmethod
+    def _written(*namespaces: str) -> None:
+        """ Mark the namespaces as written, while the replicas may lag """
+        if has_replicas():
+            cache.set_many({CatalogCache._written_key(namespace): True for namespace in namespaces},
+                           settings.DB_REPLICA_STICKY_SECONDS)
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        generation_key = CatalogCache._generation_key(namespace)
+        generation = cache.get(generation_key)
+
+        if generation is None:
+            generation = uuid.uuid4().hex
+            # another process may have drawn one in the meantime, keep the stored one
+            if not cache.add(generation_key, generation, None):
+                generation = cache.get(generation_key, generation)
+
+        return f"catalog:{namespace}:{generation}:{ENTRY_VERSION}:{key}"
+
+    @staticmethod
+    async def _akey(namespace: str, key: str) -> str:
+        generation_key = CatalogCache._generation_key(namespace)
+        generation = await cache.aget(generation_key)
+
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not await cache.aadd(generation_key, generation, None):
+                generation = await cache.aget(generation_key, generation)
+
+        return f"catalog:{namespace}:{generation}:{ENTRY_VERSION}:{key}"
+
+    @staticmethod
+    def _compute(
+            compute: Callable[[], Response],
+            validators: Optional[Callable[[], Validators]],
+    ) -> tuple[Optional[Validators], Response]:
+        entry_validators = validators() if validators is not None else None
+
+        return entry_validators, compute()
+
+    @staticmethod
+    def _cached(response: Response, validators: Optional[Validators] = None) -> Response:
+        # tells CompressionMiddleware the body is worth keeping compressed
+        response.catalog_cached = True
+
+        if validators is not None:
+            # answered by utils.conditional
+            response.validators = validators
+
+        return response
+
+    @staticmethod
+    def _compressed_key(content: bytes, encoding: str) -> str:
+        # the body rendered by the negotiated renderer, json and msgpack have their own entries
+        return f"catalog:compressed:{encoding}:{hashlib.sha1(content).hexdigest()}"
+
+    @staticmethod
+    def _generation_key(namespace: str) -> str:
+        return f"catalog:{namespace}:generation"
+
+    @staticmethod
+    def _written_key(namespace: str) -> str:
+        return f"catalog:{namespace}:written"
@@ -0,0 +1,211 @@
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, Union
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.http.response import HttpResponseBase, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from utils.cache import CatalogCache
+
+BROTLI = "br"
+GZIP = "gzip"
+# by order of preference
+ENCODINGS = [BROTLI, GZIP]
+
+
+class Compressor:
+    """ Incremental brotli or gzip compression, every chunk is flushed so a stream reaches the client as it goes """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+
+        if encoding == BROTLI:
+            self.brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits 16 + 15: gzip container, 32KB window
+            self.gzip = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == BROTLI:
+            compressed: bytes = self.brotli.process(data) + self.brotli.flush()
+            return compressed
+
+        return self.gzip.compress(data) + self.gzip.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            finished: bytes = self.brotli.finish()
+            return finished
+
+        return self.gzip.flush()
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == BROTLI:
+        compressed: bytes = brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        return compressed
+
+    gzip = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    return gzip.compress(content) + gzip.flush()
+
+
+def accepted_encoding(header: str) -> Optional[str]:
+    """ Encoding of ENCODINGS with the highest q in an Accept-Encoding header, ties go to the order of ENCODINGS
+
+    A q of 0 refuses a coding, codings that aren't listed get the q of "*" if any.
+    """
+    accepted = {}
+
+    for coding in header.split(","):
+        name, _, params = coding.strip().partition(";")
+        quality = 1.0
+
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0
+
+        accepted[name.strip().lower()] = quality
+
+    qualities = {encoding: accepted.get(encoding, accepted.get("*", 0)) for encoding in ENCODINGS}
+    # max keeps the first of the encodings with the highest q
+    encoding = max(ENCODINGS, key=qualities.__getitem__)
+
+    return encoding if qualities[encoding] > 0 else None
+
+
+class CompressionMiddleware:
+    """ Brotli or gzip compression of the responses of COMPRESSION_MIN_SIZE bytes or more, and of streams
+
+    Responses served from the catalog cache are compressed once: the compressed body is cached by the digest of the
+    content, so every hit of a hot entry reuses it. There is no BREACH padding since the API doesn't mix secrets
+    with reflected input in its bodies.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Union[HttpResponseBase, Awaitable[HttpResponseBase]]:
+        if self.is_async:
+            return self.__acall__(request)
+
+        response: HttpResponseBase = self.get_response(request)
+        encoding = self.encoding(request, response)
+
+        if encoding is None:
+            return response
+
+        if isinstance(response, StreamingHttpResponse):
+            return self.compress_stream(response, encoding)
+
+        if not isinstance(response, HttpResponse):
+            return response
+
+        if getattr(response, "catalog_cached", False):
+            content = CatalogCache.read_compressed(response.content, encoding, compress)
+        else:
+            content = compress(response.content, encoding)
+
+        return self.compressed(response, content, encoding)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponseBase:
+        response: HttpResponseBase = await self.get_response(request)
+        encoding = self.encoding(request, response)
+
+        if encoding is None:
+            return response
+
+        if isinstance(response, StreamingHttpResponse):
+            return self.compress_stream(response, encoding)
+
+        if not isinstance(response, HttpResponse):
+            return response
+
+        if getattr(response, "catalog_cached", False):
+            content = await CatalogCache.aread_compressed(response.content, encoding, compress)
+        else:
+            content = compress(response.content, encoding)
+
+        return self.compressed(response, content, encoding)
+
+    @staticmethod
+    def encoding(request: HttpRequest, response: HttpResponseBase) -> Optional[str]:
+        """ Encoding to compress the response with, None to send it as it is """
+        if response.has_header("Content-Encoding"):
+            return None
+
+        if isinstance(response, HttpResponse) and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return None
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        return accepted_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+
+    @staticmethod
+    def compressed(response: HttpResponse, content: bytes, encoding: str) -> HttpResponse:
+        # incompressible content (e.g. already compressed files) stays as it is
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response.headers["Content-Length"] = str(len(content))
+        CompressionMiddleware.encoded(response, encoding)
+
+        return response
+
+    @staticmethod
+    def compress_stream(response: StreamingHttpResponse, encoding: str) -> StreamingHttpResponse:
+        compressor = Compressor(encoding)
+        chunks = response.streaming_content
+
+        if isinstance(chunks, AsyncIterator):
+            response.streaming_content = _acompress_chunks(chunks, compressor)
+        else:
+            response.streaming_content = _compress_chunks(chunks, compressor)
+
+        # the compressed size isn't known before the end of the stream
+        del response.headers["Content-Length"]
+        CompressionMiddleware.encoded(response, encoding)
+
+        return response
+
+    @staticmethod
+    def encoded(response: HttpResponseBase, encoding: str) -> None:
+        # the representation changed, a strong ETag becomes weak (RFC 9110 8.8.1), If-None-Match still matches it
+        etag = response.get("ETag")
+
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = f"W/{etag}"
+
+        response.headers["Content-Encoding"] = encoding
+
+
+def _compress_chunks(chunks: Iterable[bytes], compressor: Compressor) -> Iterator[bytes]:
+    for chunk in chunks:
+        compressed = compressor.chunk(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield compressor.finish()
+
+
+async def _acompress_chunks(chunks: AsyncIterator[bytes], compressor: Compressor) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        compressed = compressor.chunk(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield compressor.finish()
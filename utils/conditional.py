@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.request import Request
+
+# ETag (unquoted) and Last-Modified of a resource, None when it doesn't exist
+Validators = tuple[Optional[str], Optional[datetime]]
+
+
+def conditional(view: Callable[..., HttpResponse]) -> Callable[..., HttpResponse]:
+    """ Answer GET requests with a 304 when If-None-Match / If-Modified-Since match the validators of the response
+
+    The view returns a response of CatalogCache.read, which keeps the validators with the cached data: a cached
+    response is validated without reading the db. The negotiated format is part of the ETag, the cached data is
+    rendered by the renderer of each request.
+    """
+
+    @wraps(view)
+    def wrapper(request: Request, *args: Any, **kwargs: Any) -> HttpResponse:
+        response = view(request, *args, **kwargs)
+        version, last_modified = getattr(response, "validators", (None, None))
+
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+        etag = quote_etag(f"{version}-{request.accepted_renderer.format}") if version is not None else None
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+        if etag is not None:
+            response.headers["ETag"] = etag
+        if timestamp is not None:
+            response.headers["Last-Modified"] = http_date(timestamp)
+
+        conditional_response = get_conditional_response(request, etag=etag, last_modified=timestamp, response=response)
+
+        return conditional_response or response
+
+    return wrapper
+
+
+def versions_validators(request: Request, versions: Iterable[tuple[int, datetime]], *extra: Any) -> Validators:
+    """ Validators of a list response from the (id, updated_at) of its rows
+
+    The url is part of the ETag since it selects the rows, extra holds the other values of the response (e.g.
+    next cursor, count). There is no Last-Modified: a deleted row or an older row shifting into the page changes
+    the list without changing its latest updated_at.
+    """
+    digest = hashlib.sha1(f"{request.get_full_path()}:{extra}".encode())
+
+    for pk, updated_at in versions:
+        digest.update(f":{pk}@{updated_at.timestamp()}".encode())
+
+    return digest.hexdigest(), None
+
+
+def version_validators(kind: str, pk: int, updated_at: Optional[datetime]) -> Validators:
+    """ Validators of a single row """
+    if updated_at is None:
+        return None, None
+
+    return f"{kind}-{pk}-{updated_at.timestamp()}", updated_at
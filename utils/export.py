@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Iterator, Union
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from utils.renderers import MSGPACK as MSGPACK_MEDIA_TYPE, table_chunks
+
+CSV = "csv"
+NDJSON = "ndjson"
+MSGPACK = "msgpack"
+EXPORT_FORMATS = {
+    CSV: "text/csv",
+    NDJSON: "application/x-ndjson",
+    MSGPACK: MSGPACK_MEDIA_TYPE,
+}
+
+
+def stream_export(
+        name: str,
+        columns: list[str],
+        rows: Iterable[tuple[Any, ...]],
+        file_format: str,
+) -> StreamingHttpResponse:
+    """ Stream rows as a csv file (header included), as one json object per line or as msgpack columnar tables
+
+    rows should come from a server-side cursor (QuerySet.iterator) so memory doesn't grow with the table.
+    """
+    chunks: Iterator[Union[str, bytes]]
+
+    if file_format == CSV:
+        chunks = _csv_chunks(columns, rows)
+    elif file_format == NDJSON:
+        chunks = _ndjson_chunks(columns, rows)
+    else:
+        # one table per EXPORT_CHUNK_SIZE rows, read with msgpack.Unpacker(ext_hook=utils.renderers.table_hook)
+        chunks = table_chunks(columns, rows, settings.EXPORT_CHUNK_SIZE)
+
+    response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[file_format])
+    response.headers["Content-Disposition"] = f'attachment; filename="{name}.{file_format}"'
+
+    return response
+
+
+def _csv_chunks(columns: list[str], rows: Iterable[tuple[Any, ...]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+
+        if count % settings.EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(columns: list[str], rows: Iterable[tuple[Any, ...]]) -> Iterator[str]:
+    lines = []
+
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row))))
+
+        if len(lines) == settings.EXPORT_CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    if lines:
+        yield "\n".join(lines) + "\n"
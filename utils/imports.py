@@ -0,0 +1,143 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import models
+
+INSERT = "insert"
+UPSERT = "upsert"
+IMPORT_MODES = [INSERT, UPSERT]
+
+# rows listed for each failed check of a report, the count covers all of them
+CHECK_SAMPLE_ROWS = 10
+
+# upper bound of the integer columns
+INTEGER_MAX = 2147483647
+
+# shape of a URL, the hosts are then checked with URLValidator
+URL_SHAPE = re.compile(r"(?:%s)://[^/?#\s]+(?:[/?#]\S*)?" % "|".join(URLValidator.schemes), re.IGNORECASE)
+
+
+@dataclass
+class ImportReport:
+    """ Counts and per-row failures collected while importing a file """
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+    # failed column checks by (column, detail): number of rows and the first ones
+    checks: dict[tuple[str, str], dict[str, Any]] = field(default_factory=dict)
+
+    def fail(self, rows: Iterable[int], detail: str) -> None:
+        """ Record failed rows, only the first BULK_IMPORT_MAX_ERRORS are kept with their detail """
+        for row in rows:
+            self.failed += 1
+
+            if len(self.errors) < settings.BULK_IMPORT_MAX_ERRORS:
+                self.errors.append({"row": int(row), "detail": detail})
+
+    def fail_check(self, column: str, detail: str, count: int, rows: list[int]) -> None:
+        """ Record a check failed by count rows, the rows aren't counted as failed (see ColumnValidator) """
+        check = self.checks.setdefault((column, detail), {"column": column, "detail": detail, "count": 0, "rows": []})
+        check["count"] += count
+        check["rows"].extend(rows[:CHECK_SAMPLE_ROWS - len(check["rows"])])
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": self.errors,
+            "checks": list(self.checks.values()),
+        }
+
+
+class ColumnValidator:
+    """ Checks of the rows of an import file, each check runs on whole columns instead of row by row
+
+    Every check sees every row so the report lists all the problems of a file at once, valid_rows then drops
+    the rows failing any of them. The frame needs a "row" column (line number in the file).
+    """
+
+    def __init__(self, df: pd.DataFrame, report: ImportReport):
+        self.df = df
+        self.report = report
+        self.invalid = pd.Series(False, index=df.index)
+
+    def text(self, column: str, model_field: "models.Field[Any, Any]", required: bool = True) -> None:
+        values = self.df[column].astype("string")
+
+        if required:
+            self._fail(column, "Missing value", values.isna())
+
+        if model_field.max_length is not None:
+            self._fail(column, f"Longer than {model_field.max_length} characters",
+                       values.str.len() > model_field.max_length)
+
+    def integer(self, column: str, min_value: int, max_value: int = INTEGER_MAX, required: bool = True) -> None:
+        """ Also converts the column to integers (nullable) """
+        raw = self.df[column]
+        values = pd.to_numeric(raw, errors="coerce")
+        missing = raw.isna()
+        not_integer = (values.isna() & ~missing) | (values.notna() & (values % 1 != 0))
+        out_of_range = (values < min_value) | (values > max_value)
+
+        if required:
+            self._fail(column, "Missing value", missing)
+
+        self._fail(column, "Not an integer", not_integer)
+        self._fail(column, f"Not between {min_value} and {max_value}", out_of_range & ~not_integer)
+
+        self.df[column] = values.where(~(not_integer | out_of_range)).astype("Int64")
+
+    def url(self, column: str) -> None:
+        """ The full URLValidator regex is slow on large columns, it only runs on the distinct hosts """
+        values = self.df[column].astype("string")
+        shaped = values.str.fullmatch(URL_SHAPE).fillna(False)
+        hosts = values.where(shaped).str.split("/", n=3).str[2]
+        valid_hosts = [host for host in hosts.dropna().unique() if _is_url(f"http://{host}")]
+        valid = shaped & hosts.isin(valid_hosts)
+
+        self._fail(column, "Not a valid URL", values.notna() & ~valid)
+
+    def unique(self, column: str) -> None:
+        """ The first occurrence of a value is kept """
+        values = self.df[column]
+
+        self._fail(column, "Duplicated in the file", values.notna() & values.duplicated())
+
+    def exists(self, column: str, model: type[models.Model]) -> None:
+        """ The values must be primary keys of the model, checked in a single query """
+        values = self.df[column].dropna().unique().tolist()
+        existing = list(model._default_manager.filter(pk__in=values).values_list("pk", flat=True))
+
+        self._fail(column, f"{model._meta.verbose_name} doesn't exist".capitalize(),
+                   self.df[column].notna() & ~self.df[column].isin(existing))
+
+    def valid_rows(self) -> pd.DataFrame:
+        self.report.failed += int(self.invalid.sum())
+
+        return self.df[~self.invalid]
+
+    def _fail(self, column: str, detail: str, mask: pd.Series) -> None:
+        mask = mask.fillna(False).astype(bool)
+        count = int(mask.sum())
+
+        if count:
+            self.report.fail_check(column, detail, count, self.df.loc[mask, "row"].head(CHECK_SAMPLE_ROWS).tolist())
+            self.invalid |= mask
+
+
+def _is_url(value: str) -> bool:
+    try:
+        URLValidator()(value)
+    except ValidationError:
+        return False
+
+    return True
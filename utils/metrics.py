@@ -0,0 +1,246 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator, Optional, Union
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponseBase, StreamingHttpResponse
+
+# upper bounds (ms) of the latency histogram buckets, the last bucket is unbounded
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+@dataclass
+class RequestStats:
+    """ Measures of one sampled request, durations in seconds by step (db, auth, serialize, render) """
+    queries: int = 0
+    durations: dict[str, float] = field(default_factory=dict)
+
+    def add(self, step: str, duration: float) -> None:
+        self.durations[step] = self.durations.get(step, 0.0) + duration
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def timed(step: str) -> Iterator[None]:
+    """ Add the duration of the block to the step of the current request, if it is sampled """
+    stats = _current.get()
+
+    if stats is None:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        stats.add(step, time.perf_counter() - start)
+
+
+def _count_query(execute: Callable[..., Any], sql: str, params: Any, many: bool, context: dict[str, Any]) -> Any:
+    stats = _current.get()
+
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.add("db", time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def _install_query_counter(sender: Any, connection: BaseDatabaseWrapper, **kwargs: Any) -> None:
+    """ Every connection counts the queries of the sampled requests, whatever the thread running them
+
+    Connections are per thread, the ones running the queries of an async view aren't reachable from it.
+    """
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class RouteMetrics:
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.durations: dict[str, float] = {}
+        self.queries = 0
+        self.size = 0
+
+    def record(self, status_code: int, total: float, stats: RequestStats, size: int) -> None:
+        self.count += 1
+        self.errors += status_code >= 500
+        self.histogram[self.bucket(total * 1000)] += 1
+        self.queries += stats.queries
+        self.size += size
+
+        for step, duration in [("total", total), *stats.durations.items()]:
+            self.durations[step] = self.durations.get(step, 0.0) + duration
+
+    @staticmethod
+    def bucket(milliseconds: float) -> int:
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if milliseconds <= bound:
+                return i
+
+        return len(HISTOGRAM_BUCKETS)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """ Upper bound of the bucket holding the percentile, None when it's in the unbounded bucket """
+        seen = 0
+
+        for i, count in enumerate(self.histogram):
+            seen += count
+
+            if seen >= fraction * self.count:
+                return HISTOGRAM_BUCKETS[i] if i < len(HISTOGRAM_BUCKETS) else None
+
+        return None
+
+    def to_dict(self) -> dict[str, Any]:
+        cumulative = 0
+        buckets = []
+
+        for bound, count in zip([*HISTOGRAM_BUCKETS, "+Inf"], self.histogram):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "avg_ms": {step: duration / self.count * 1000 for step, duration in self.durations.items()},
+            "avg_queries": self.queries / self.count,
+            "avg_size": self.size / self.count,
+            "histogram": buckets,
+        }
+
+
+class RequestMetrics:
+    """ Aggregated measures of the sampled requests of the process, by method and route """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.routes: dict[str, RouteMetrics] = {}
+
+    def record(self, route: str, status_code: int, total: float, stats: RequestStats, size: int) -> None:
+        with self.lock:
+            self.routes.setdefault(route, RouteMetrics()).record(status_code, total, stats, size)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "sample_rate": settings.REQUEST_METRICS_SAMPLE_RATE,
+                "routes": {route: metrics.to_dict() for route, metrics in sorted(self.routes.items())},
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.routes = {}
+
+
+request_metrics = RequestMetrics()
+
+
+class RequestMetricsMiddleware:
+    """ Measure a sample of the requests: total time, db queries and time, auth, serialization and rendering
+
+    The measures are sent back in a Server-Timing header and aggregated in request_metrics. Requests outside of
+    the sample (REQUEST_METRICS_SAMPLE_RATE) only cost a random draw. Should be the first middleware.
+
+    The serialize and render steps are timed where every response goes through, the output of the response
+    serializers (OutputSerializer, FastListSerializer) and the API renderers, sync and async views alike.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+        # connections opened before this module was loaded
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(None, connection)
+
+    def __call__(self, request: HttpRequest) -> Union[HttpResponseBase, Awaitable[HttpResponseBase]]:
+        if self.is_async:
+            return self.__acall__(request)
+
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            unsampled: HttpResponseBase = self.get_response(request)
+            return unsampled
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponseBase:
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            response: HttpResponseBase = await self.get_response(request)
+            return response
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    @staticmethod
+    def finish(
+            request: HttpRequest,
+            response: HttpResponseBase,
+            stats: RequestStats,
+            total: float,
+    ) -> HttpResponseBase:
+        match = request.resolver_match
+        route = f"{request.method} /{match.route}" if match is not None else f"{request.method} (unmatched)"
+        # the size of a streamed response isn't known
+        size = 0 if isinstance(response, StreamingHttpResponse) else len(getattr(response, "content", b""))
+
+        request_metrics.record(route, response.status_code, total, stats, size)
+
+        timings = [f"total;dur={total * 1000:.1f}"]
+
+        for step, duration in stats.durations.items():
+            timing = f"{step};dur={duration * 1000:.1f}"
+
+            if step == "db":
+                timing += f';desc="{stats.queries} queries"'
+
+            timings.append(timing)
+
+        response.headers["Server-Timing"] = ", ".join(timings)
+
+        return response
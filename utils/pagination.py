@@ -0,0 +1,147 @@
+import base64
+import json
+from typing import Any, Optional, Union
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model, Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class UncountedLimitOffsetPagination(LimitOffsetPagination):
+    """ Limit/offset pagination that doesn't run a COUNT(*) since the count isn't part of our responses """
+
+    def paginate_queryset(self, queryset: QuerySet[Any], request: Request, view: Any = None) -> Optional[list[Any]]:
+        self.request = request
+        self.limit = self.get_limit(request)
+
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+
+        return list(queryset[self.offset:self.offset + self.limit])
+
+    async def apaginate_queryset(self, queryset: QuerySet[Any], request: Request) -> Optional[list[Any]]:
+        """ paginate_queryset with the async ORM """
+        self.request = request
+        self.limit = self.get_limit(request)
+
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+
+        return [row async for row in queryset[self.offset:self.offset + self.limit]]
+
+
+class KeysetPagination(BasePagination):
+    """ Cursor pagination on a unique ordering (the last field must be unique, e.g. id), fields can be descending
+
+    The cursor holds the ordering values of the last row of the page, the next page is fetched with a range
+    condition on those values so every page costs one index range scan whatever its depth.
+    """
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    count_query_param = "count"
+    default_limit = 10
+    max_limit = 1000
+
+    def __init__(self, ordering: list[str]):
+        self.ordering = ordering
+        self.fields = [field.lstrip("-") for field in ordering]
+
+    def paginate_queryset(self, queryset: QuerySet[Any], request: Request, view: Any = None) -> list[Any]:
+        queryset, page_queryset = self.prepare(queryset, request)
+
+        self.count = queryset.count() if request.query_params.get(self.count_query_param) == "true" else None
+
+        return self.page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset: QuerySet[Any], request: Request) -> list[Any]:
+        """ paginate_queryset with the async ORM """
+        queryset, page_queryset = self.prepare(queryset, request)
+
+        self.count = await queryset.acount() if request.query_params.get(self.count_query_param) == "true" else None
+
+        return self.page([row async for row in page_queryset])
+
+    def prepare(self, queryset: QuerySet[Any], request: Request) -> tuple[QuerySet[Any], QuerySet[Any]]:
+        """ The ordered queryset and the query of the page, with one extra row telling if there is a next page """
+        self.request = request
+        self.limit = self.get_limit(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        page_queryset = queryset.filter(self.after(self.decode_cursor(cursor, queryset.model))) if cursor else queryset
+
+        return queryset, page_queryset[:self.limit + 1]
+
+    def page(self, rows: list[Any]) -> list[Any]:
+        self.next_cursor = self.encode_cursor(rows[self.limit - 1]) if len(rows) > self.limit else None
+
+        return rows[:self.limit]
+
+    def get_paginated_response(self, data: Any) -> Response:
+        page: dict[str, Any] = {"next": self.get_next_link()}
+
+        if self.count is not None:
+            page["count"] = self.count
+
+        page["results"] = data
+
+        return Response(page)
+
+    def get_limit(self, request: Request) -> int:
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+
+        return min(limit, self.max_limit) if limit > 0 else self.default_limit
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_cursor is None:
+            return None
+
+        url = self.request.build_absolute_uri()
+
+        return str(replace_query_param(url, self.cursor_query_param, self.next_cursor))
+
+    def after(self, values: list[Any]) -> Q:
+        """ Rows strictly after values in the lexicographic ordering """
+        condition = Q()
+
+        for i, field in enumerate(self.fields):
+            equal = dict(zip(self.fields[:i], values[:i]))
+            lookup = "lt" if self.ordering[i].startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{field}__{lookup}": values[i]})
+
+        return condition
+
+    def encode_cursor(self, row: Union[Model, dict[str, Any]]) -> str:
+        values = [row[field] if isinstance(row, dict) else getattr(row, field) for field in self.fields]
+
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor: str, model: type[Model]) -> list[Any]:
+        """ The values of the cursor, cleaned by the fields of the model (types, nulls, ranges of the columns) """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError("Cursor of another ordering")
+
+            columns = {field.name: field for field in model._meta.fields}
+            values = [columns[field].clean(value, None) for field, value in zip(self.fields, values)]
+
+            # the range validators of the fields depend on the backend, auto fields have none
+            if any(isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63 for value in values):
+                raise ValueError("Value out of the range of the columns")
+
+            return values
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound("Invalid cursor")
@@ -0,0 +1,4 @@
+""" PostgreSQL backend taking its connections from an in-process pool, ENGINE = "utils.pooled_postgresql"
+
+The pool is configured by the POOL entry of the database settings (MAX_SIZE, TIMEOUT), see lego/settings.py.
+"""
@@ -0,0 +1,32 @@
+from typing import Any
+
+from django.db.backends.postgresql import base
+from psycopg2.extensions import connection
+
+from utils.pooled_postgresql.pool import ConnectionPool, get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ PostgreSQL backend whose connections are borrowed from the pool of the alias instead of opened
+
+    close() gives the connection back to the pool, so CONN_MAX_AGE should be 0: the connection goes back at the
+    end of every request and any thread (ASGI, import workers) can reuse it.
+    """
+
+    def get_new_connection(self, conn_params: dict[str, Any]) -> connection:
+        pool_settings = self.settings_dict.get("POOL", {})
+
+        # the parent only sets attributes that are the same for every wrapper of the alias
+        self.connection_pool = get_pool(self.alias, lambda: ConnectionPool(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            max_size=pool_settings.get("MAX_SIZE", 10),
+            timeout=pool_settings.get("TIMEOUT", 5),
+            health_checks=self.settings_dict["CONN_HEALTH_CHECKS"],
+        ))
+
+        return self.connection_pool.acquire()
+
+    def _close(self) -> None:
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.release(self.connection)
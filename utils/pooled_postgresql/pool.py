@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from django.db.utils import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection
+
+# idle connections older than this are checked with a query before being handed out (CONN_HEALTH_CHECKS)
+HEALTH_CHECK_AFTER = 10
+
+
+class ConnectionPool:
+    """ Bounded pool of psycopg2 connections shared by the threads of the process
+
+    size counts the open connections, idle or in use. acquire waits up to timeout seconds for a connection when
+    max_size of them are in use. Connections given back in a transaction are rolled back, the broken ones are
+    discarded.
+    """
+
+    def __init__(self, connect: Callable[[], connection], max_size: int, timeout: float, health_checks: bool):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_checks = health_checks
+        self.condition = threading.Condition()
+        # (connection, time it was released), the last released is reused first
+        self.idle: list[tuple[connection, float]] = []
+        self.size = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self) -> connection:
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        with self.condition:
+            self.waiting += 1
+
+            try:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0 or not self.condition.wait(remaining):
+                        self.timeouts += 1
+                        raise OperationalError(f"No database connection available after {self.timeout}s "
+                                               f"({self.max_size} in use)")
+            finally:
+                self.waiting -= 1
+
+            waited = time.monotonic() - start
+            self.acquired += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+            if self.idle:
+                conn: Optional[connection]
+                conn, released_at = self.idle.pop()
+            else:
+                conn, released_at = None, 0.0
+                self.size += 1
+
+        if conn is not None:
+            if self.usable(conn, released_at):
+                return conn
+
+            # its slot is used for the new connection
+            conn.close()
+
+            with self.condition:
+                self.discarded += 1
+
+        try:
+            new_conn = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.created += 1
+
+        return new_conn
+
+    def release(self, conn: connection) -> None:
+        if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                conn.close()
+
+        with self.condition:
+            if conn.closed:
+                self.size -= 1
+                self.discarded += 1
+            else:
+                self.idle.append((conn, time.monotonic()))
+
+            self.condition.notify()
+
+    def usable(self, conn: connection, released_at: float) -> bool:
+        if conn.closed:
+            return False
+
+        if not self.health_checks or time.monotonic() - released_at < HEALTH_CHECK_AFTER:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except Exception:
+            return False
+
+        return True
+
+    def metrics(self) -> dict[str, Any]:
+        with self.condition:
+            return {
+                "max_size": self.max_size,
+                "open": self.size,
+                "in_use": self.size - len(self.idle),
+                "idle": len(self.idle),
+                "waiting": self.waiting,
+                "acquired": self.acquired,
+                "created": self.created,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": self.wait_time / self.acquired * 1000 if self.acquired else 0.0,
+                "max_wait_ms": self.max_wait_time * 1000,
+            }
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, create: Callable[[], ConnectionPool]) -> ConnectionPool:
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = create()
+
+        return _pools[alias]
+
+
+def pools_metrics() -> dict[str, dict[str, Any]]:
+    """ Metrics of the pools of the process by database alias """
+    with _pools_lock:
+        pools = dict(_pools)
+
+    return {alias: pool.metrics() for alias, pool in pools.items()}
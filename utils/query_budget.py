@@ -0,0 +1,179 @@
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget:
+    """ Queries of a view run, by sql (the parameters aren't part of it so a per-row query shows up as a repeat) """
+
+    def __init__(self, name: str, max_queries: int, max_duplicates: int):
+        self.name = name
+        self.max_queries = max_queries
+        self.max_duplicates = max_duplicates
+        self.queries: Counter[str] = Counter()
+
+    def check(self) -> None:
+        problems = []
+        count = sum(self.queries.values())
+
+        if count > self.max_queries:
+            problems.append(f"{self.name} ran {count} queries, its budget is {self.max_queries}")
+
+        for sql, times in self.queries.most_common():
+            if times <= self.max_duplicates:
+                break
+
+            problems.append(f"{self.name} ran the same query {times} times (N+1?): {sql}")
+
+        if problems and settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded("\n".join(problems))
+
+        for problem in problems:
+            logger.warning(problem)
+
+
+_budget: ContextVar[Optional[QueryBudget]] = ContextVar("query_budget", default=None)
+
+
+def query_budget(
+        max_queries: int,
+        max_duplicates: Optional[int] = None,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """ Declare the most queries a view may run and check it, along with repeated queries, on every call
+
+    Exceeding it logs a warning, or fails when QUERY_BUDGET_STRICT is set (tests). The authentication queries
+    run before the view and aren't counted, the queries of a streaming response are counted as its content is
+    sent. Works on sync and async views.
+    """
+
+    def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+        name = view.__qualname__
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with _budgeted(name, max_queries, max_duplicates) as budget:
+                    response = await view(*args, **kwargs)
+
+                return _checked(budget, response)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with _budgeted(name, max_queries, max_duplicates) as budget:
+                response = view(*args, **kwargs)
+
+            return _checked(budget, response)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def _budgeted(name: str, max_queries: int, max_duplicates: Optional[int]) -> Iterator[Optional[QueryBudget]]:
+    """ Count the queries of the block, the budget is None when an outer budgeted view accounts for them """
+    if _budget.get() is not None:
+        yield None
+        return
+
+    if max_duplicates is None:
+        max_duplicates = settings.QUERY_BUDGET_MAX_DUPLICATES
+
+    budget = QueryBudget(name, max_queries, max_duplicates)
+
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(None, connection)
+
+    token = _budget.set(budget)
+
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+def _checked(budget: Optional[QueryBudget], response: Any) -> Any:
+    """ Check the budget, once the content is sent for a streaming response since its queries run meanwhile """
+    if budget is None:
+        return response
+
+    if not isinstance(response, StreamingHttpResponse):
+        budget.check()
+        return response
+
+    content = response.streaming_content
+
+    if isinstance(content, AsyncIterator):
+        response.streaming_content = _acounted(budget, content)
+    else:
+        response.streaming_content = _counted(budget, content)
+
+    return response
+
+
+def _counted(budget: QueryBudget, content: Iterator[bytes]) -> Iterator[bytes]:
+    """ The content, counting the queries run to produce each chunk then checking the budget """
+    while True:
+        token = _budget.set(budget)
+
+        try:
+            chunk = next(content)
+        except StopIteration:
+            break
+        finally:
+            _budget.reset(token)
+
+        yield chunk
+
+    budget.check()
+
+
+async def _acounted(budget: QueryBudget, content: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    while True:
+        token = _budget.set(budget)
+
+        try:
+            chunk = await content.__anext__()
+        except StopAsyncIteration:
+            break
+        finally:
+            _budget.reset(token)
+
+        yield chunk
+
+    budget.check()
+
+
+def _record_query(execute: Callable[..., Any], sql: str, params: Any, many: bool, context: dict[str, Any]) -> Any:
+    budget = _budget.get()
+
+    if budget is not None:
+        budget.queries[sql] += 1
+
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_query_recorder(sender: Any, connection: BaseDatabaseWrapper, **kwargs: Any) -> None:
+    """ Installed on every connection since the queries of an async view run on the connection of another thread """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
@@ -0,0 +1,146 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional, Union
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Model
+from django.http import HttpRequest, HttpResponseBase
+
+# set when the reads of the current request (or thread) must see its writes
+_use_primary: ContextVar[bool] = ContextVar("use_primary", default=False)
+
+# cookie telling that the client wrote recently, its reads stay on the primary while it lives
+PRIMARY_COOKIE = "use_primary"
+
+
+def use_primary() -> None:
+    _use_primary.set(True)
+
+
+def has_replicas() -> bool:
+    return any(alias != DEFAULT_DB_ALIAS for alias in settings.DATABASES)
+
+
+@contextmanager
+def primary_reads() -> Iterator[None]:
+    """ Send the reads of the block to the primary """
+    token = _use_primary.set(True)
+
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class ReplicaRouter:
+    """ Send the reads to a random replica and the writes to the primary
+
+    Once something was written, or when ReplicaMiddleware asked for it, the reads of the request go to the
+    primary so they see the writes whatever the replication lag.
+    """
+
+    def __init__(self) -> None:
+        self.replicas = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+    def db_for_read(self, model: type[Model], **hints: Any) -> str:
+        if not self.replicas or _use_primary.get():
+            return DEFAULT_DB_ALIAS
+
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model: type[Model], **hints: Any) -> str:
+        use_primary()
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints: Any) -> bool:
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, model_name: Optional[str] = None, **hints: Any) -> bool:
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """ Keep the reads on the primary during unsafe requests and for a while after them
+
+    The client gets a cookie living DB_REPLICA_STICKY_SECONDS after a write, so the reads following it (e.g. the
+    list after a create) aren't served by a lagging replica. API clients usually drop the cookies, the writes of a
+    client sending an Authorization header (e.g. a bearer token) are remembered in the cache as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        self.replicas = has_replicas()
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Union[HttpResponseBase, Awaitable[HttpResponseBase]]:
+        if self.is_async:
+            return self.__acall__(request)
+
+        key = self.client_key(request)
+        token = _use_primary.set(
+            self.starts_on_primary(request) or (key is not None and cache.get(key) is not None)
+        )
+
+        try:
+            response = self.get_response(request)
+            wrote = _use_primary.get()
+        finally:
+            _use_primary.reset(token)
+
+        if key is not None and self.wrote(request, wrote):
+            cache.set(key, True, settings.DB_REPLICA_STICKY_SECONDS)
+
+        return self.remember(request, response, wrote)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponseBase:
+        key = self.client_key(request)
+        token = _use_primary.set(
+            self.starts_on_primary(request) or (key is not None and await cache.aget(key) is not None)
+        )
+
+        try:
+            response = await self.get_response(request)
+            wrote = _use_primary.get()
+        finally:
+            _use_primary.reset(token)
+
+        if key is not None and self.wrote(request, wrote):
+            await cache.aset(key, True, settings.DB_REPLICA_STICKY_SECONDS)
+
+        return self.remember(request, response, wrote)
+
+    def client_key(self, request: HttpRequest) -> Optional[str]:
+        """ Cache key of the recent writes of a client authenticated by a header, by the digest of the header """
+        authorization = request.headers.get("Authorization")
+
+        if not self.replicas or authorization is None:
+            return None
+
+        return "replicas:wrote:" + hashlib.md5(authorization.encode()).hexdigest()
+
+    @staticmethod
+    def starts_on_primary(request: HttpRequest) -> bool:
+        return request.method not in ("GET", "HEAD", "OPTIONS") or PRIMARY_COOKIE in request.COOKIES
+
+    @staticmethod
+    def wrote(request: HttpRequest, wrote: bool) -> bool:
+        return wrote and request.method not in ("GET", "HEAD", "OPTIONS")
+
+    @staticmethod
+    def remember(request: HttpRequest, response: HttpResponseBase, wrote: bool) -> HttpResponseBase:
+        if ReplicaMiddleware.wrote(request, wrote):
+            response.set_cookie(PRIMARY_COOKIE, "1", max_age=settings.DB_REPLICA_STICKY_SECONDS, httponly=True)
+
+        return response
@@ -19,4 +19,14 @@ class ResponseBadRequest(Response):
             data={
                 "detail": detail
             }
-        )
\ No newline at end of file
+        )
+
+
+class ResponseGone(Response):
+    def __init__(self, detail: str):
+        super().__init__(
+            status=status.HTTP_410_GONE,
+            data={
+                "detail": detail
+            }
+        )
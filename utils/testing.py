@@ -0,0 +1,61 @@
+from typing import Any, Optional
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from theme import stats
+from theme.models import ThemeStats
+from user.models import UserProfile
+
+
+class APITestCase(TransactionTestCase):
+    """ Requests of an admin, the endpoints run under strict query budgets (see lego.test_settings)
+
+    Not a TestCase, its atomic blocks would add savepoints to the queries of the budgets.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.admin = UserProfile.objects.create_superuser("admin@lego.com", "admin", "password")
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def create_theme(self, name: str, parent_id: Optional[int] = None) -> Any:
+        response = self.api.post("/api/themes/", {"name": name, "parent_id": parent_id}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()["id"]
+
+    def create_set(self, num: str, theme_id: int, year: int = 2000, num_parts: int = 10) -> Any:
+        response = self.api.post("/api/sets/", {
+            "num": num, "name": f"set {num}", "year": year, "num_parts": num_parts,
+            "img_url": "https://lego.com/set.png", "theme_id": theme_id,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()["id"]
+
+    def assertStatsRebuilt(self) -> None:
+        """ The maintained theme stats are the ones rebuilt from the sets """
+        def rows() -> set[tuple[int, ...]]:
+            return {row for row in ThemeStats.objects.values_list("theme_id", "year", *stats.COUNTERS) if any(row[2:])}
+
+        maintained = rows()
+        stats.rebuild()
+
+        self.assertEqual(maintained, rows())
+
+    def get_async(self, path: str, **params: Any) -> Any:
+        """ JSON of a GET on the ASGI handler, with the bearer token of the admin """
+        async def get() -> Any:
+            response = await AsyncClient().get(path, params, headers={"Authorization": f"Bearer {token}"})
+            self.assertEqual(response.status_code, 200)
+
+            return response.json()
+
+        token = AccessToken.for_user(self.admin)
+
+        return async_to_sync(get)()
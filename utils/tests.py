@@ -0,0 +1,129 @@
+from typing import Any, Iterator
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import router
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from theme.models import Theme
+from user.models import UserProfile
+from utils.cache import CatalogCache, THEME_LISTS
+from utils.query_budget import QueryBudgetExceeded, query_budget
+from utils.replicas import ReplicaRouter
+
+
+class ReplicaTests(TestCase):
+    """ Reads following writes with the replica router, replica_1 never gets the writes (see lego.test_settings) """
+    databases = {"default", "replica_1"}
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.writer = self.client_of("writer@lego.com")
+        self.reader = self.client_of("reader@lego.com")
+
+        patcher = mock.patch.object(router, "routers", [ReplicaRouter()])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def client_of(email: str) -> APIClient:
+        """ Client of a bearer token, the user exists on both databases like the ones created before the lag """
+        user = UserProfile.objects.create_user(email, "name", "password")
+        user.save(using="replica_1")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+        return client
+
+    def create_theme(self, name: str) -> Any:
+        response = self.writer.post("/api/themes/", {"name": name}, format="json")
+        self.assertEqual(response.status_code, 200)
+        # API clients rarely keep cookies
+        self.writer.cookies.clear()
+
+        return response.json()["id"]
+
+    def test_reads_go_to_the_replica(self) -> None:
+        theme_id = self.create_theme("city")
+
+        self.assertEqual(self.reader.get(f"/api/themes/{theme_id}/stats").status_code, 404)
+
+    def test_bearer_client_reads_its_writes(self) -> None:
+        theme_id = self.create_theme("city")
+
+        self.assertEqual(self.writer.get(f"/api/themes/{theme_id}/stats").status_code, 200)
+
+    def test_cookie_client_reads_its_writes(self) -> None:
+        client = APIClient()
+        client.force_authenticate(UserProfile.objects.get(email="writer@lego.com"))
+        theme_id = client.post("/api/themes/", {"name": "city"}, format="json").json()["id"]
+
+        self.assertEqual(client.get(f"/api/themes/{theme_id}/stats").status_code, 200)
+
+    def test_cache_miss_after_a_write_reads_the_primary(self) -> None:
+        # cached before the write, from the replica
+        self.assertEqual(self.reader.get("/api/themes/", {"limit": 10}).json(), [])
+
+        theme_id = self.create_theme("city")
+        page = self.reader.get("/api/themes/", {"limit": 10}).json()
+
+        self.assertEqual([theme["id"] for theme in page], [theme_id])
+
+        # once the lag window is over the page cached from the primary is still served
+        cache.delete(CatalogCache._written_key(THEME_LISTS))
+
+        self.assertEqual(self.reader.get("/api/themes/", {"limit": 10}).json(), page)
+
+    def test_cache_miss_after_the_lag_window_reads_the_replica(self) -> None:
+        self.create_theme("city")
+        cache.delete(CatalogCache._written_key(THEME_LISTS))
+
+        self.assertEqual(self.reader.get("/api/themes/", {"limit": 10}).json(), [])
+
+
+class QueryBudgetTests(TestCase):
+    """ Budgets are strict in the tests (see lego.test_settings) """
+
+    @staticmethod
+    def themes() -> Iterator[bytes]:
+        for name in Theme.objects.values_list("name", flat=True):
+            yield name.encode()
+
+    def test_view_over_budget(self) -> None:
+        @query_budget(0)
+        def view(request: HttpRequest) -> HttpResponse:
+            return HttpResponse(Theme.objects.count())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            view(RequestFactory().get("/"))
+
+    def test_repeated_query(self) -> None:
+        @query_budget(10, max_duplicates=2)
+        def view(request: HttpRequest) -> HttpResponse:
+            return HttpResponse([Theme.objects.filter(pk=pk).exists() for pk in range(3)])
+
+        with self.assertRaisesMessage(QueryBudgetExceeded, "ran the same query 3 times"):
+            view(RequestFactory().get("/"))
+
+    def test_streamed_queries_count(self) -> None:
+        @query_budget(0)
+        def view(request: HttpRequest) -> StreamingHttpResponse:
+            return StreamingHttpResponse(self.themes())
+
+        # the view returns before its query runs
+        response = view(RequestFactory().get("/"))
+
+        with self.assertRaises(QueryBudgetExceeded):
+            response.getvalue()
+
+    def test_streamed_queries_within_budget(self) -> None:
+        Theme.objects.create(name="city", path="1/")
+
+        @query_budget(1)
+        def view(request: HttpRequest) -> StreamingHttpResponse:
+            return StreamingHttpResponse(self.themes())
+
+        self.assertEqual(view(RequestFactory().get("/")).getvalue(), b"city")